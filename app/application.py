@@ -8,6 +8,7 @@ from gino import create_engine
 from gino_starlette import Gino, GinoEngine
 
 from .settings.globals import DATABASE_CONFIG, WRITE_DATABASE_CONFIG
+from .utils.http import close_async_client
 
 # Set the current engine using a ContextVar to assure
 # that the correct connection is used during concurrent requests
@@ -128,3 +129,9 @@ async def shutdown_event():
         logger.info(
             f"Closed database connection for read operations {READ_ENGINE.repr(color=True)}"
         )
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Closing pooled HTTP connections on shutdown."""
+    await close_async_client()
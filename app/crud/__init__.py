@@ -1,6 +1,6 @@
 import json
 from copy import deepcopy
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 from pydantic.main import BaseModel
 
@@ -45,21 +45,29 @@ def update_metadata(row: Base, parent: Base):
     Make sure empty metadata get correctly merged.
     """
 
-    if parent.metadata:
-        _metadata = deepcopy(parent.metadata)
+    row.metadata = merge_metadata(parent.metadata, row.metadata)
+    return row
+
+
+def merge_metadata(*metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge metadata objects, ordered from parent to child.
+
+    Values of a child override those of its parent, unless they are
+    None.
+    """
+
+    if metadata and metadata[0]:
+        _metadata = deepcopy(metadata[0])
     else:
         _metadata = {}
 
-    if row.metadata:
-        filtered_metadata = {
-            key: value for key, value in row.metadata.items() if value is not None
-        }
-    else:
-        filtered_metadata = {}
+    for child in metadata[1:]:
+        if child:
+            _metadata.update(
+                {key: value for key, value in child.items() if value is not None}
+            )
 
-    _metadata.update(filtered_metadata)
-    row.metadata = _metadata
-    return row
+    return _metadata
 
 
 def update_all_metadata(rows: List[Base], parent: Base) -> List[Base]:
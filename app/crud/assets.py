@@ -1,10 +1,12 @@
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from uuid import UUID
 
 from asyncpg import UniqueViolationError
 from fastapi.encoders import jsonable_encoder
 
+from ..application import db
 from ..errors import RecordAlreadyExistsError, RecordNotFoundError
+from ..models.enum.assets import AssetType
 from ..models.enum.sources import SourceType
 from ..models.orm.assets import Asset as ORMAsset
 from ..models.orm.datasets import Dataset as ORMDataset
@@ -15,48 +17,74 @@ from ..models.pydantic.creation_options import (
     VectorDrivers,
     asset_creation_option_factory,
 )
-from . import datasets, update_all_metadata, update_data, update_metadata, versions
+from . import merge_metadata, update_data
+from .cache import invalidate_feature_info, invalidate_tiles
+
+_version_metadata = ORMVersion.metadata.label("version_metadata")
+_dataset_metadata = ORMDataset.metadata.label("dataset_metadata")
+
+PAGE_SIZE = 1000
 
 
 async def get_assets(dataset: str, version: str) -> List[ORMAsset]:
-    rows: List[ORMAsset] = await ORMAsset.query.where(
+    rows: List[Tuple[ORMAsset, Any, Any]] = await _assets_with_parents().where(
         ORMAsset.dataset == dataset
-    ).where(ORMAsset.version == version).order_by(ORMAsset.created_on).gino.all()
+    ).where(ORMAsset.version == version).order_by(ORMAsset.created_on).gino.load(
+        _loader()
+    ).all()
     if not rows:
         raise RecordNotFoundError(
             f"No assets for version with name {dataset}.{version} found"
         )
 
-    d: ORMDataset = await datasets.get_dataset(dataset)
-    v: ORMVersion = await versions.get_version(dataset, version)
-
-    v = update_metadata(v, d)
-
-    return update_all_metadata(rows, v)
+    return _inherit_all_metadata(rows)
 
 
 async def get_all_assets() -> List[ORMAsset]:
-    assets = await ORMAsset.query.gino.all()
-
-    return await _update_all_asset_metadata(assets)
+    return [row async for row in iterate_assets()]
 
 
 async def get_assets_by_type(asset_type: str) -> List[ORMAsset]:
-    assets = await ORMAsset.query.where(ORMAsset.asset_type == asset_type).gino.all()
-    return await _update_all_asset_metadata(assets)
+    return [row async for row in iterate_assets(asset_type)]
+
+
+async def iterate_assets(
+    asset_type: Optional[str] = None, page_size: int = PAGE_SIZE
+) -> AsyncIterator[ORMAsset]:
+    """Iterate over all assets, optionally filtered by asset type.
+
+    Assets are fetched in pages, using keyset pagination on the primary
+    key. Inherited metadata are only merged once per dataset version.
+    """
+    version_metadata_cache: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+    last_asset_id: Optional[UUID] = None
+
+    while True:
+        query = _assets_with_parents()
+        if asset_type is not None:
+            query = query.where(ORMAsset.asset_type == asset_type)
+        if last_asset_id is not None:
+            query = query.where(ORMAsset.asset_id > last_asset_id)
+
+        rows = (
+            await query.order_by(ORMAsset.asset_id)
+            .limit(page_size)
+            .gino.load(_loader())
+            .all()
+        )
 
+        for row in _inherit_all_metadata(rows, version_metadata_cache):
+            yield row
 
-async def get_asset(asset_id: UUID) -> ORMAsset:
+        if len(rows) < page_size:
+            break
+        last_asset_id = rows[-1][0].asset_id
 
-    row: ORMAsset = await ORMAsset.get([asset_id])
-    if row is None:
-        raise RecordNotFoundError(f"Could not find requested asset {asset_id}")
 
-    dataset: ORMDataset = await datasets.get_dataset(row.dataset)
-    version: ORMVersion = await versions.get_version(row.dataset, row.version)
-    version = update_metadata(version, dataset)
+async def get_asset(asset_id: UUID) -> ORMAsset:
+    row, version_metadata, dataset_metadata = await _get_asset_with_parents(asset_id)
 
-    return update_metadata(row, version)
+    return _inherit_metadata(row, version_metadata, dataset_metadata)
 
 
 async def create_asset(dataset, version, **data) -> ORMAsset:
@@ -72,12 +100,21 @@ async def create_asset(dataset, version, **data) -> ORMAsset:
             f"Cannot create asset of type {data['asset_type']}. "
             f"Asset uri must be unique. An asset with uri {data['asset_uri']} already exists"
         )
+    finally:
+        invalidate_feature_info(dataset, version)
 
-    d: ORMDataset = await datasets.get_dataset(dataset)
-    v: ORMVersion = await versions.get_version(dataset, version)
-    v = update_metadata(v, d)
+    parents: Optional[Tuple[Any, Any]] = await db.select(
+        [_version_metadata, _dataset_metadata]
+    ).select_from(_version_join()).where(ORMVersion.dataset == dataset).where(
+        ORMVersion.version == version
+    ).gino.load(
+        (_version_metadata, _dataset_metadata)
+    ).first()
 
-    return update_metadata(new_asset, v)
+    if parents is None:
+        parents = (None, None)
+
+    return _inherit_metadata(new_asset, *parents)
 
 
 async def update_asset(asset_id: UUID, **data) -> ORMAsset:
@@ -85,34 +122,103 @@ async def update_asset(asset_id: UUID, **data) -> ORMAsset:
     data = _validate_creation_options(**data)
     jsonable_data = jsonable_encoder(data)
 
-    row: ORMAsset = await get_asset(asset_id)
-    row = await update_data(row, jsonable_data)
-
-    dataset: ORMDataset = await datasets.get_dataset(row.dataset)
-    version: ORMVersion = await versions.get_version(row.dataset, row.version)
-    version = update_metadata(version, dataset)
+    row, version_metadata, dataset_metadata = await _get_asset_with_parents(asset_id)
+    try:
+        row = await update_data(row, jsonable_data)
+    finally:
+        _invalidate_cache(row)
 
-    return update_metadata(row, version)
+    return _inherit_metadata(row, version_metadata, dataset_metadata)
 
 
 async def delete_asset(asset_id: UUID) -> ORMAsset:
-    row: ORMAsset = await get_asset(asset_id)
-    await ORMAsset.delete.where(ORMAsset.asset_id == asset_id).gino.status()
+    row, version_metadata, dataset_metadata = await _get_asset_with_parents(asset_id)
+    try:
+        await ORMAsset.delete.where(ORMAsset.asset_id == asset_id).gino.status()
+    finally:
+        _invalidate_cache(row)
+
+    return _inherit_metadata(row, version_metadata, dataset_metadata)
+
+
+def _invalidate_cache(row: ORMAsset) -> None:
+    invalidate_feature_info(row.dataset, row.version)
+    # Tiles include the fields of the dynamic vector tile cache or are read
+    # from the archive of the static vector tile cache
+    if row.asset_type in (
+        AssetType.dynamic_vector_tile_cache,
+        AssetType.static_vector_tile_cache,
+    ):
+        invalidate_tiles(row.dataset, row.version)
+
+
+def _version_join():
+    """Join versions with their parent datasets."""
+    return ORMVersion.join(ORMDataset, ORMVersion.dataset == ORMDataset.dataset)
+
+
+def _assets_with_parents():
+    """Select assets together with metadata of parent version and dataset.
+
+    Allows to resolve metadata inheritance within a single query.
+    """
+    return db.select(
+        [ORMAsset.__table__, _version_metadata, _dataset_metadata]
+    ).select_from(
+        ORMAsset.join(
+            _version_join(),
+            (ORMAsset.dataset == ORMVersion.dataset)
+            & (ORMAsset.version == ORMVersion.version),
+        )
+    )
+
+
+def _loader() -> Tuple[Any, Any, Any]:
+    return ORMAsset, _version_metadata, _dataset_metadata
+
+
+async def _get_asset_with_parents(asset_id: UUID) -> Tuple[ORMAsset, Any, Any]:
+    """Fetch asset row as stored, together with metadata of parent version
+    and dataset."""
+    row: Optional[Tuple[ORMAsset, Any, Any]] = await _assets_with_parents().where(
+        ORMAsset.asset_id == asset_id
+    ).gino.load(_loader()).first()
+    if row is None:
+        raise RecordNotFoundError(f"Could not find requested asset {asset_id}")
+
+    return row
+
+
+def _inherit_metadata(
+    row: ORMAsset,
+    version_metadata: Optional[Dict[str, Any]],
+    dataset_metadata: Optional[Dict[str, Any]],
+) -> ORMAsset:
+    """Merge dataset, version and asset metadata."""
+    row.metadata = merge_metadata(dataset_metadata, version_metadata, row.metadata)
+    return row
 
-    dataset: ORMDataset = await datasets.get_dataset(row.dataset)
-    version: ORMVersion = await versions.get_version(row.dataset, row.version)
-    version = update_metadata(version, dataset)
 
-    return update_metadata(row, version)
+def _inherit_all_metadata(
+    rows: List[Tuple[ORMAsset, Any, Any]],
+    version_metadata_cache: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None,
+) -> List[ORMAsset]:
+    """Merge metadata for a list of assets.
 
+    Merged dataset and version metadata are computed once per version
+    and reused for all of its assets.
+    """
+    if version_metadata_cache is None:
+        version_metadata_cache = dict()
 
-async def _update_all_asset_metadata(assets):
     new_rows = list()
-    for row in assets:
-        dataset: ORMDataset = await datasets.get_dataset(row.dataset)
-        version: ORMVersion = await versions.get_version(row.dataset, row.version)
-        version = update_metadata(version, dataset)
-        update_metadata(row, version)
+    for row, version_metadata, dataset_metadata in rows:
+        key = (row.dataset, row.version)
+        if key not in version_metadata_cache:
+            version_metadata_cache[key] = merge_metadata(
+                dataset_metadata, version_metadata
+            )
+        row.metadata = merge_metadata(version_metadata_cache[key], row.metadata)
         new_rows.append(row)
 
     return new_rows
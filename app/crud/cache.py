@@ -0,0 +1,202 @@
+"""In-process cache for dataset and version rows.
+
+Rows are cached by primary key. Once an entry is older than
+METADATA_CACHE_TTL, its `updated_on` timestamp is compared with the one
+in the database before it is served again. All writes through app.crud
+invalidate the affected entries directly.
+
+The latest version number of each dataset is cached for
+METADATA_CACHE_TTL seconds, unless is_latest changes through app.crud.
+The same applies to feature info columns of each version, which are
+dropped whenever an asset of the version changes.
+
+SQL query results are cached by dataset, version, normalized query and
+geostore ID. They are dropped whenever the version changes or new data
+is appended to it.
+
+Geostores never change, since their IDs are hashes of their geometry.
+Serialized responses are kept until evicted or their version is deleted.
+
+Rendered dynamic vector tiles are cached by dataset, version and tile
+coordinates. Tiles of mutable versions expire after TILE_MAX_AGE
+seconds. Concurrent renders of the same tile are coalesced.
+
+Headers and directories of PMTiles archives of static vector tile caches
+are cached by dataset, version and the ETag of the archive, so that a
+replaced archive is never read with outdated directories. Tiles read
+from archives share the tile cache.
+"""
+from copy import deepcopy
+from time import monotonic
+from typing import Any, Dict, Optional, Tuple, Type
+
+from ..application import db
+from ..models.orm.base import Base
+from ..models.orm.datasets import Dataset as ORMDataset
+from ..models.orm.versions import Version as ORMVersion
+from ..settings.globals import (
+    GEOSTORE_CACHE_SIZE,
+    METADATA_CACHE_SIZE,
+    METADATA_CACHE_TTL,
+    QUERY_CACHE_DIR,
+    QUERY_CACHE_DIR_SIZE,
+    QUERY_CACHE_SIZE,
+    TILE_CACHE_SIZE,
+    TILE_DIRECTORY_CACHE_SIZE,
+)
+from ..utils.cache import LRUCache, ResultCache, SingleFlight
+from ..utils.pmtiles import Directory
+
+# Rough memory overhead of a cache entry in bytes, so that empty tiles count
+TILE_ENTRY_OVERHEAD = 128
+
+
+class RowCache(object):
+    def __init__(self, model: Type[Base], maxsize: int, ttl: float):
+        self.model = model
+        self.ttl = ttl
+        self.primary_key = list(model.__table__.primary_key.columns)
+        self.revalidations = 0
+        self.stale = 0
+        self._cache = LRUCache(maxsize)
+
+    async def get(self, *key: Any) -> Optional[Base]:
+        """Return a fresh copy of cached row or None if row is not cached
+        or outdated."""
+        entry: Optional[Tuple[Dict[str, Any], float]] = self._cache.get(key)
+        if entry is None:
+            return None
+
+        values, validated_on = entry
+        if monotonic() - validated_on >= self.ttl:
+            self.revalidations += 1
+            updated_on = await self._updated_on(key)
+            if updated_on is None or updated_on != values["updated_on"]:
+                self.stale += 1
+                self._cache.pop(key)
+                return None
+            self._cache.set(key, (values, monotonic()))
+
+        return self.model(**deepcopy(values))
+
+    def set(self, row: Base) -> None:
+        key = tuple(getattr(row, c.name) for c in self.primary_key)
+        self._cache.set(key, (deepcopy(row.to_dict()), monotonic()))
+
+    def invalidate(self, *key: Any) -> None:
+        """Remove all entries which primary key starts with given values."""
+        if len(key) == len(self.primary_key):
+            self._cache.pop(key)
+        else:
+            for k in self._cache.keys():
+                if k[: len(key)] == key:
+                    self._cache.pop(k)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        # Entries which turned out to be outdated count as misses
+        stats["hits"] -= self.stale
+        stats["misses"] += self.stale
+        total = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / total if total else None
+        stats["revalidations"] = self.revalidations
+        stats["stale"] = self.stale
+        return stats
+
+    async def _updated_on(self, key: Tuple[Any, ...]):
+        query = db.select([self.model.updated_on])
+        for column, value in zip(self.primary_key, key):
+            query = query.where(column == value)
+        return await query.gino.scalar()
+
+
+dataset_cache = RowCache(ORMDataset, METADATA_CACHE_SIZE, METADATA_CACHE_TTL)
+version_cache = RowCache(ORMVersion, METADATA_CACHE_SIZE, METADATA_CACHE_TTL)
+
+# Latest version number per dataset
+latest_version_cache = LRUCache(METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+
+# Feature info columns of database table per dataset version
+feature_info_cache = LRUCache(METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+
+# Serialized SQL query results
+query_result_cache = ResultCache(
+    QUERY_CACHE_SIZE, spill_dir=QUERY_CACHE_DIR, spill_maxsize=QUERY_CACHE_DIR_SIZE
+)
+
+# Serialized geostore responses and their ETags
+geostore_cache = LRUCache(GEOSTORE_CACHE_SIZE, getsizeof=lambda entry: len(entry[0]))
+
+# Gzip encoded dynamic vector tiles and tiles being rendered
+tile_cache = LRUCache(
+    TILE_CACHE_SIZE, getsizeof=lambda tile: len(tile) + TILE_ENTRY_OVERHEAD
+)
+tile_renders = SingleFlight()
+
+# Headers and directories of PMTiles archives, sized by directory entries
+tile_directory_cache = LRUCache(
+    TILE_DIRECTORY_CACHE_SIZE,
+    getsizeof=lambda value: len(value.entries) if isinstance(value, Directory) else 1,
+)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit and miss counters of all caches."""
+    return {
+        "datasets": dataset_cache.stats(),
+        "versions": version_cache.stats(),
+        "latest_versions": latest_version_cache.stats(),
+        "feature_info": feature_info_cache.stats(),
+        "query_results": query_result_cache.stats(),
+        "geostores": geostore_cache.stats(),
+        "tiles": {**tile_cache.stats(), "renders": tile_renders.stats()},
+        "tile_directories": tile_directory_cache.stats(),
+    }
+
+
+def clear_cache() -> None:
+    dataset_cache.clear()
+    version_cache.clear()
+    latest_version_cache.clear()
+    feature_info_cache.clear()
+    query_result_cache.clear()
+    geostore_cache.clear()
+    tile_cache.clear()
+    tile_directory_cache.clear()
+
+
+def invalidate_feature_info(dataset: str, version: Optional[str] = None) -> None:
+    """Drop cached feature info columns of a version or of all versions of a
+    dataset."""
+    for key in feature_info_cache.keys():
+        if key[0] == dataset and (version is None or key[1] == version):
+            feature_info_cache.pop(key)
+
+
+def invalidate_query_results(dataset: str, version: Optional[str] = None) -> None:
+    """Drop cached SQL query results of a version or of all versions of a
+    dataset."""
+    if version is None:
+        query_result_cache.invalidate(dataset)
+    else:
+        query_result_cache.invalidate(dataset, version)
+
+
+def invalidate_geostores(dataset: str, version: Optional[str] = None) -> None:
+    """Drop cached geostores of a version or of all versions of a
+    dataset."""
+    for key in geostore_cache.keys():
+        if key[0] == dataset and (version is None or key[1] == version):
+            geostore_cache.pop(key)
+
+
+def invalidate_tiles(dataset: str, version: Optional[str] = None) -> None:
+    """Drop cached tiles and tile archive directories of a version or of all
+    versions of a dataset."""
+    for cache in (tile_cache, tile_directory_cache):
+        for key in cache.keys():
+            if key[0] == dataset and (version is None or key[1] == version):
+                cache.pop(key)
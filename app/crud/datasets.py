@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from asyncpg import UniqueViolationError
 
@@ -7,6 +7,15 @@ from ..errors import RecordAlreadyExistsError, RecordNotFoundError
 from ..models.orm.datasets import Dataset as ORMDataset
 from ..models.orm.queries.datasets import all_datasets
 from . import update_data
+from .cache import (
+    dataset_cache,
+    invalidate_feature_info,
+    invalidate_geostores,
+    invalidate_query_results,
+    invalidate_tiles,
+    latest_version_cache,
+    version_cache,
+)
 
 
 async def get_datasets() -> List[ORMDataset]:
@@ -17,9 +26,12 @@ async def get_datasets() -> List[ORMDataset]:
 
 
 async def get_dataset(dataset: str) -> ORMDataset:
-    row: ORMDataset = await ORMDataset.get(dataset)
-    if row is None:
-        raise RecordNotFoundError(f"Dataset with name {dataset} does not exist")
+    row: Optional[ORMDataset] = await dataset_cache.get(dataset)
+    if row is not None:
+        return row
+
+    row = await _get_dataset(dataset)
+    dataset_cache.set(row)
 
     return row
 
@@ -29,18 +41,41 @@ async def create_dataset(dataset: str, **data) -> ORMDataset:
         new_dataset: ORMDataset = await ORMDataset.create(dataset=dataset, **data)
     except UniqueViolationError:
         raise RecordAlreadyExistsError(f"Dataset with name {dataset} already exists")
+    finally:
+        dataset_cache.invalidate(dataset)
 
     return new_dataset
 
 
 async def update_dataset(dataset: str, **data):
-    row: ORMDataset = await get_dataset(dataset)
-
-    return await update_data(row, data)
+    # Bypass cache, changes are merged into the current row
+    row: ORMDataset = await _get_dataset(dataset)
+    try:
+        return await update_data(row, data)
+    finally:
+        dataset_cache.invalidate(dataset)
 
 
 async def delete_dataset(dataset: str) -> ORMDataset:
-    row: ORMDataset = await get_dataset(dataset)
-    await ORMDataset.delete.where(ORMDataset.dataset == dataset).gino.status()
+    row: ORMDataset = await _get_dataset(dataset)
+    try:
+        await ORMDataset.delete.where(ORMDataset.dataset == dataset).gino.status()
+    finally:
+        # Versions are deleted in cascade
+        dataset_cache.invalidate(dataset)
+        version_cache.invalidate(dataset)
+        latest_version_cache.pop(dataset)
+        invalidate_feature_info(dataset)
+        invalidate_query_results(dataset)
+        invalidate_geostores(dataset)
+        invalidate_tiles(dataset)
+
+    return row
+
+
+async def _get_dataset(dataset: str) -> ORMDataset:
+    row: Optional[ORMDataset] = await ORMDataset.get(dataset)
+    if row is None:
+        raise RecordNotFoundError(f"Dataset with name {dataset} does not exist")
 
     return row
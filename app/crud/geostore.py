@@ -0,0 +1,128 @@
+import json
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from asyncpg import UndefinedColumnError, UndefinedTableError
+
+from ..application import db
+from ..errors import RecordNotFoundError
+from ..models.orm.geostore import Geostore as ORMGeostore
+
+GEOSTORE_COLUMNS = [
+    "gfw_geostore_id",
+    "gfw_geojson",
+    "gfw_area__ha",
+    "gfw_bbox",
+    "created_on",
+    "updated_on",
+]
+
+
+async def create_geostores(geometries: List[str]) -> List[UUID]:
+    """Register GeoJSON geometries as user geostores.
+
+    IDs, area and bounding box of all geometries are derived in a single
+    statement. Geometries which already exist are skipped. Returns
+    geostore IDs in input order.
+    """
+    rows = await db.all(
+        db.text(
+            """
+            WITH input AS (
+                SELECT i, ST_SetSRID(ST_GeomFromGeoJSON(geojson), 4326) AS geom
+                FROM unnest(CAST(:geometries AS text[])) WITH ORDINALITY AS t(geojson, i)
+            ), geostores AS (
+                SELECT
+                    i,
+                    md5(ST_AsGeoJSON(geom))::uuid AS gfw_geostore_id,
+                    ST_AsGeoJSON(geom) AS gfw_geojson,
+                    ST_Area(geom::geography) / 10000 AS gfw_area__ha,
+                    ST_MakeEnvelope(
+                        ST_XMin(geom), ST_YMin(geom), ST_XMax(geom), ST_YMax(geom), 4326
+                    ) AS gfw_bbox
+                FROM input
+            ), inserted AS (
+                INSERT INTO geostore (gfw_geostore_id, gfw_geojson, gfw_area__ha, gfw_bbox)
+                SELECT gfw_geostore_id, gfw_geojson, gfw_area__ha, gfw_bbox FROM geostores
+                ON CONFLICT (gfw_geostore_id) DO NOTHING
+            )
+            SELECT gfw_geostore_id FROM geostores ORDER BY i
+            """
+        ).bindparams(geometries=geometries)
+    )
+    return [row.gfw_geostore_id for row in rows]
+
+
+async def get_geostore_from_anywhere(geostore_id: UUID) -> Dict[str, Any]:
+    """Geostore of any dataset or user defined geometry.
+
+    Dataset version tables inherit from the geostore table, hence
+    querying the parent table finds all of them.
+    """
+    return await _get_geostore(ORMGeostore.__table__, geostore_id)
+
+
+async def get_geostore_by_version(
+    dataset: str, version: str, geostore_id: UUID
+) -> Dict[str, Any]:
+    t = db.table(version, *[db.column(name) for name in GEOSTORE_COLUMNS])
+    t.schema = dataset
+
+    try:
+        return await _get_geostore(t, geostore_id)
+    except (UndefinedTableError, UndefinedColumnError):
+        raise RecordNotFoundError(
+            f"Version {dataset}.{version} does not have a geostore"
+        )
+
+
+async def _get_geostore(table, geostore_id: UUID) -> Dict[str, Any]:
+    """Look up geostore using the hash index on gfw_geostore_id."""
+    c = table.c
+    row = await (
+        db.select(
+            [
+                c.gfw_geostore_id,
+                c.gfw_geojson,
+                c.gfw_area__ha,
+                db.func.ST_XMin(c.gfw_bbox).label("xmin"),
+                db.func.ST_YMin(c.gfw_bbox).label("ymin"),
+                db.func.ST_XMax(c.gfw_bbox).label("xmax"),
+                db.func.ST_YMax(c.gfw_bbox).label("ymax"),
+                c.created_on,
+                c.updated_on,
+            ]
+        )
+        .where(c.gfw_geostore_id == geostore_id)
+        .limit(1)
+        .gino.first()
+    )
+    if row is None:
+        raise RecordNotFoundError(f"Geostore {geostore_id} not found")
+
+    return _geostore(row)
+
+
+def _geostore(row) -> Dict[str, Any]:
+    bbox: Optional[List[float]] = (
+        [row.xmin, row.ymin, row.xmax, row.ymax] if row.xmin is not None else None
+    )
+    return {
+        "gfw_geostore_id": row.gfw_geostore_id,
+        "gfw_geojson": _feature_collection(row.gfw_geojson),
+        "gfw_area__ha": row.gfw_area__ha,
+        "gfw_bbox": bbox,
+        "created_on": row.created_on,
+        "updated_on": row.updated_on,
+    }
+
+
+def _feature_collection(geojson: str) -> Dict[str, Any]:
+    """Geostores store plain geometries, wrap them into a feature
+    collection."""
+    obj: Dict[str, Any] = json.loads(geojson)
+    if obj["type"] == "FeatureCollection":
+        return obj
+    elif obj["type"] != "Feature":
+        obj = {"type": "Feature", "properties": {}, "geometry": obj}
+    return {"type": "FeatureCollection", "features": [obj]}
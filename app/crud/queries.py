@@ -0,0 +1,92 @@
+"""Run sandboxed SQL queries on dataset version tables.
+
+Queries run in read only transactions with a statement timeout. They
+use the engine bound to the current request, unless an engine is
+passed explicitly.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import orjson
+from gino import GinoEngine
+
+from ..application import db
+from ..settings.globals import QUERY_PREFETCH, QUERY_TIMEOUT
+
+# Number of COPY data chunks to buffer ahead of the consumer
+COPY_BUFFER_SIZE = 16
+
+
+async def query_plan(sql: str, engine: Optional[GinoEngine] = None) -> Dict[str, Any]:
+    """Estimated execution plan of query, without executing it.
+
+    Planning evaluates constant expressions, hence the plan is subject
+    to the same restrictions as the query itself.
+    """
+    async with read_only_transaction(engine, QUERY_TIMEOUT) as raw_conn:
+        explain: str = await raw_conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}")
+    return orjson.loads(explain)[0]["Plan"]
+
+
+@asynccontextmanager
+async def read_only_transaction(
+    engine: Optional[GinoEngine] = None, timeout: float = QUERY_TIMEOUT
+):
+    """Raw connection in a read only transaction with statement
+    timeout."""
+    async with (engine or db).acquire() as conn:
+        raw_conn = conn.raw_connection
+        async with raw_conn.transaction(readonly=True):
+            await raw_conn.execute(
+                f"SET LOCAL statement_timeout = {int(timeout * 1000)}"
+            )
+            yield raw_conn
+
+
+async def execute_query(
+    sql: str, engine: Optional[GinoEngine] = None, timeout: float = QUERY_TIMEOUT
+) -> AsyncIterator[Any]:
+    """Prepare query in a read only transaction and iterate over its
+    rows using a server-side cursor.
+
+    Attributes of the prepared statement are yielded before the rows.
+    """
+    async with read_only_transaction(engine, timeout) as raw_conn:
+        statement = await raw_conn.prepare(sql)
+        yield statement.get_attributes()
+        async for record in statement.cursor(prefetch=QUERY_PREFETCH):
+            yield record
+
+
+async def copy_query(
+    sql: str, engine: Optional[GinoEngine] = None, timeout: float = QUERY_TIMEOUT
+) -> AsyncIterator[bytes]:
+    """Run query through COPY in a read only transaction and pass on CSV
+    data as PostgreSQL sends them.
+
+    Rows are never decoded. COPY writes into a small buffer, which
+    holds it back until the consumer has caught up.
+    """
+    buffer: asyncio.Queue = asyncio.Queue(maxsize=COPY_BUFFER_SIZE)
+    async with read_only_transaction(engine, timeout) as raw_conn:
+        copy = asyncio.ensure_future(
+            raw_conn.copy_from_query(sql, output=buffer.put, format="csv", header=True)
+        )
+        try:
+            while True:
+                get = asyncio.ensure_future(buffer.get())
+                await asyncio.wait({get, copy}, return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    break
+                yield get.result()
+
+            # COPY has finished, pass on what is left and raise its errors
+            while not buffer.empty():
+                yield buffer.get_nowait()
+            copy.result()
+        finally:
+            if not copy.done():
+                copy.cancel()
+                await asyncio.wait({copy})
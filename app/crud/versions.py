@@ -1,11 +1,30 @@
-from typing import Any, List, Optional
+import re
+from typing import Any, Dict, List, Optional, Tuple
 
 from asyncpg import UniqueViolationError
 
+from ..application import db
 from ..errors import RecordAlreadyExistsError, RecordNotFoundError
 from ..models.orm.datasets import Dataset as ORMDataset
 from ..models.orm.versions import Version as ORMVersion
 from . import datasets, update_all_metadata, update_data, update_metadata
+from .cache import (
+    dataset_cache,
+    feature_info_cache,
+    invalidate_feature_info,
+    invalidate_geostores,
+    invalidate_query_results,
+    invalidate_tiles,
+    latest_version_cache,
+    version_cache,
+)
+
+# Suffix of optional table with subdivided geometries of a version table
+SUBDIVIDED_SUFFIX = "__subdivided"
+
+# Optional geometry columns simplified for display up to a zoom level, such as
+# geom_wm_z6 for geom_wm
+SIMPLIFIED_COLUMN = re.compile(r"^(?P<column>.+)_z(?P<zoom>[0-9]{1,2})$")
 
 
 async def get_versions(dataset: str) -> List[ORMVersion]:
@@ -26,29 +45,87 @@ async def get_version_names(dataset: str) -> List[Any]:
 
 
 async def get_version(dataset: str, version: str) -> ORMVersion:
-    row: ORMVersion = await ORMVersion.get([dataset, version])
-    if row is None:
-        raise RecordNotFoundError(
-            f"Version with name {dataset}.{version} does not exist"
-        )
-    d: ORMDataset = await datasets.get_dataset(dataset)
+    row: Optional[ORMVersion] = await version_cache.get(dataset, version)
+    parent: Optional[ORMDataset] = (
+        await dataset_cache.get(dataset) if row is not None else None
+    )
+    if row is None or parent is None:
+        row, parent = await _get_version_with_parent(dataset, version)
+        version_cache.set(row)
+        dataset_cache.set(parent)
 
-    return update_metadata(row, d)
+    return update_metadata(row, parent)
 
 
 async def get_latest_version(dataset) -> str:
     """Fetch latest version number."""
 
-    latest: Optional[str] = await ORMVersion.select("version").where(
-        ORMVersion.dataset == dataset
-    ).where(ORMVersion.is_latest).gino.scalar()
+    latest: Optional[str] = latest_version_cache.get(dataset)
+    if latest is not None:
+        return latest
+
+    latest = (
+        await ORMVersion.select("version")
+        .where(ORMVersion.dataset == dataset)
+        .where(ORMVersion.is_latest)
+        .gino.scalar()
+    )
 
     if latest is None:
         raise RecordNotFoundError(f"Dataset {dataset} has no latest version.")
 
+    latest_version_cache.set(dataset, latest)
     return latest
 
 
+async def get_subdivided_table(dataset: str, version: str) -> Optional[str]:
+    """Qualified name of the table with subdivided geometries of a version,
+    if it exists.
+
+    The result is cached with feature info of the version.
+    """
+    key = (dataset, version, SUBDIVIDED_SUFFIX)
+    table: Optional[str] = feature_info_cache.get(key)
+    if table is None:
+        name = f'"{dataset}"."{version}{SUBDIVIDED_SUFFIX}"'
+        exists = await db.scalar(
+            db.text("SELECT to_regclass(:name) IS NOT NULL").bindparams(name=name)
+        )
+        table = name if exists else ""
+        feature_info_cache.set(key, table)
+
+    return table or None
+
+
+def simplified_zoom_levels(
+    fields: List[Dict[str, Any]], column: str
+) -> Tuple[int, ...]:
+    """Zoom levels for which simplified variants of a geometry column are
+    listed in field metadata, in ascending order."""
+    zoom_levels: List[int] = list()
+    for field in fields:
+        match = SIMPLIFIED_COLUMN.match(field["field_name"])
+        if (
+            match is not None
+            and match["column"] == column
+            and field["field_type"] == "geometry"
+        ):
+            zoom_levels.append(int(match["zoom"]))
+    return tuple(sorted(zoom_levels))
+
+
+def simplified_column(column: str, zoom_levels: Tuple[int, ...], zoom: int) -> str:
+    """Geometry column to use at a zoom level.
+
+    Picks the most simplified variant which is still precise enough for
+    the zoom level, or the column itself beyond the last zoom level.
+    """
+    for zoom_level in zoom_levels:
+        if zoom <= zoom_level:
+            return f"{column}_z{zoom_level}"
+    return column
+
+
 async def create_version(dataset: str, version: str, **data) -> ORMVersion:
     """Create new version record if version does not yet exist."""
     try:
@@ -59,6 +136,8 @@ async def create_version(dataset: str, version: str, **data) -> ORMVersion:
         raise RecordAlreadyExistsError(
             f"Version with name {dataset}.{version} already exists"
         )
+    finally:
+        _invalidate_cache(dataset, version, data)
     d: ORMDataset = await datasets.get_dataset(dataset)
 
     return update_metadata(new_version, d)
@@ -66,21 +145,72 @@ async def create_version(dataset: str, version: str, **data) -> ORMVersion:
 
 async def update_version(dataset: str, version: str, **data):
     """Update fields of version."""
-    row: ORMVersion = await get_version(dataset, version)
-    row = await update_data(row, data)
-
-    d: ORMDataset = await datasets.get_dataset(dataset)
+    # Bypass cache, changes are merged into the current row
+    row, parent = await _get_version_with_parent(dataset, version)
+    try:
+        row = await update_data(row, data)
+    finally:
+        _invalidate_cache(dataset, version, data)
 
-    return update_metadata(row, d)
+    return update_metadata(row, parent)
 
 
 async def delete_version(dataset: str, version: str) -> ORMVersion:
     """Delete a version."""
-    row: ORMVersion = await get_version(dataset, version)
-    await ORMVersion.delete.where(ORMVersion.dataset == dataset).where(
-        ORMVersion.version == version
-    ).gino.status()
+    row, parent = await _get_version_with_parent(dataset, version)
+    try:
+        await ORMVersion.delete.where(ORMVersion.dataset == dataset).where(
+            ORMVersion.version == version
+        ).gino.status()
+    finally:
+        version_cache.invalidate(dataset, version)
+        invalidate_feature_info(dataset, version)
+        invalidate_query_results(dataset, version)
+        invalidate_geostores(dataset, version)
+        invalidate_tiles(dataset, version)
+        if row.is_latest:
+            latest_version_cache.pop(dataset)
+
+    return update_metadata(row, parent)
+
+
+async def _get_version_with_parent(
+    dataset: str, version: str
+) -> Tuple[ORMVersion, ORMDataset]:
+    """Fetch version row together with parent dataset row in a single
+    query.
+
+    Version metadata are returned as stored, without inheritance.
+    """
+    result: Optional[Tuple[ORMVersion, ORMDataset]] = (
+        await db.select([ORMVersion.__table__, ORMDataset.__table__])
+        .select_from(
+            ORMVersion.join(ORMDataset, ORMVersion.dataset == ORMDataset.dataset)
+        )
+        .where(ORMVersion.dataset == dataset)
+        .where(ORMVersion.version == version)
+        .apply_labels()
+        .gino.load((ORMVersion, ORMDataset))
+        .first()
+    )
+    if result is None:
+        raise RecordNotFoundError(
+            f"Version with name {dataset}.{version} does not exist"
+        )
 
-    d: ORMDataset = await datasets.get_dataset(dataset)
+    return result
+
+
+def _invalidate_cache(dataset: str, version: str, data: Dict[str, Any]) -> None:
+    invalidate_query_results(dataset, version)
+    invalidate_tiles(dataset, version)
+
+    if "is_latest" in data:
+        latest_version_cache.pop(dataset)
 
-    return update_metadata(row, d)
+    if data.get("is_latest"):
+        # A database trigger resets is_latest for all other versions of the
+        # dataset, without touching their updated_on field
+        version_cache.invalidate(dataset)
+    else:
+        version_cache.invalidate(dataset, version)
@@ -5,22 +5,21 @@ import sys
 from fastapi.exceptions import HTTPException, RequestValidationError
 from fastapi.logger import logger
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
 
 from .application import app
 from .errors import ClientError, ServerError
-from .middleware import redirect_latest, set_db_mode
+from .middleware import GZipMiddleware, RedirectLatestMiddleware, SetDBModeMiddleware
 from .routes import security
 from .routes.features import features
 from .routes.geostore import geostore
 from .routes.meta import assets, datasets, versions
 from .routes.sql import queries
 from .routes.tasks import tasks
+from .routes.tiles import vector_tiles
 
 ################
 # LOGGING
@@ -78,10 +77,10 @@ app.mount("/static", StaticFiles(directory="/app/app/static"), name="static")
 # MIDDLEWARE
 #################
 
-MIDDLEWARE = (set_db_mode, redirect_latest)
+MIDDLEWARE = (SetDBModeMiddleware, RedirectLatestMiddleware)
 
 for m in MIDDLEWARE:
-    app.add_middleware(BaseHTTPMiddleware, dispatch=m)
+    app.add_middleware(m)
 
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 app.add_middleware(
@@ -135,6 +134,16 @@ for r in geostore_routers:
     app.include_router(r, prefix="/geostore")
 
 
+###############
+# TILE API
+###############
+
+tile_routers = (vector_tiles.router,)
+
+for r in tile_routers:
+    app.include_router(r, prefix="/tiles")
+
+
 ###############
 # TASK API
 ###############
@@ -155,6 +164,7 @@ tags_metadata = [
     {"name": "Features", "description": features.__doc__},
     {"name": "Query", "description": queries.__doc__},
     {"name": "Geostore", "description": geostore.__doc__},
+    {"name": "Tiles", "description": vector_tiles.__doc__},
     {"name": "Tasks", "description": tasks.__doc__},
 ]
 
@@ -178,6 +188,7 @@ def custom_openapi(openapi_prefix: str = ""):
         {"name": "Geostore API", "tags": ["Geostore"]},
         {"name": "Feature API", "tags": ["Features"]},
         {"name": "SQL API", "tags": ["Query"]},
+        {"name": "Tile API", "tags": ["Tiles"]},
         {"name": "Task API", "tags": ["Tasks"]},
     ]
 
@@ -1,60 +1,129 @@
 from fastapi import Request
 from fastapi.logger import logger
 from fastapi.responses import ORJSONResponse, RedirectResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware as StarletteGZipMiddleware
+from starlette.middleware.gzip import GZipResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from .application import ContextEngine
 from .crud.versions import get_latest_version
 from .errors import BadRequestError, RecordNotFoundError
+from .settings.globals import REWRITE_LATEST_VERSION
 
 
-async def set_db_mode(request: Request, call_next):
+class SetDBModeMiddleware(object):
     """This middleware replaces the db engine depending on the request type.
 
     Read requests use the read only pool. Write requests use the write
     pool.
     """
-    if request.method in ["PUT", "PATCH", "POST", "DELETE"]:
-        method = "WRITE"
-    else:
-        method = "READ"
-    async with ContextEngine(method):
-        response = await call_next(request)
-    return response
 
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-async def redirect_latest(request: Request, call_next):
-    """Redirect all GET requests using latest version to actual version
-    number."""
-
-    try:
-        if request.method == "GET" and "latest" in request.url.path:
-            path_items = request.url.path.split("/")
-
-            i = 0
-            for i, item in enumerate(path_items):
-                if item == "latest":
-                    break
-            if i == 0:
-
-                raise BadRequestError("Invalid URI")
-            path_items[i] = await get_latest_version(path_items[i - 1])
-            url = "/".join(path_items)
-            return RedirectResponse(url=f"{url}?{request.query_params}")
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] in ["PUT", "PATCH", "POST", "DELETE"]:
+            method = "WRITE"
+        else:
+            method = "READ"
+        async with ContextEngine(method):
+            await self.app(scope, receive, send)
+
+
+class GZipMiddleware(StarletteGZipMiddleware):
+    """Compress responses with gzip, unless they are encoded already.
+
+    Starlette's middleware would compress pre-encoded responses, such as
+    vector tiles, a second time.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = _EncodedPassthroughResponder(self.app, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _EncodedPassthroughResponder(GZipResponder):
+    passthrough = False
+
+    async def send_with_gzip(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.passthrough = "content-encoding" in Headers(raw=message["headers"])
+        if self.passthrough:
+            await self.send(message)
         else:
-            response = await call_next(request)
-            return response
+            await super().send_with_gzip(message)
+
+
+class RedirectLatestMiddleware(object):
+    """Redirect all GET requests using latest version to actual version
+    number.
+
+    If REWRITE_LATEST_VERSION is set, the request path is rewritten
+    instead and the response is served without an additional redirect.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-    except BadRequestError as e:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            if scope["method"] == "GET" and "latest" in scope["path"]:
+                path = await resolve_latest(scope["path"])
+                if REWRITE_LATEST_VERSION:
+                    await self.app(
+                        dict(scope, path=path),
+                        receive,
+                        _with_content_location(send_wrapper, path),
+                    )
+                    return
+
+                request = Request(scope)
+                response = RedirectResponse(url=f"{path}?{request.query_params}")
+                await response(scope, receive, send_wrapper)
+            else:
+                await self.app(scope, receive, send_wrapper)
+
+        except Exception as e:
+            # Too late to replace a response which is already on its way
+            if response_started:
+                raise
+            await _error_response(e)(scope, receive, send)
+
+
+def _error_response(e: Exception) -> ORJSONResponse:
+    if isinstance(e, BadRequestError):
         return ORJSONResponse(
             status_code=400, content={"status": "failed", "data": str(e)}
         )
 
-    except RecordNotFoundError as e:
+    elif isinstance(e, RecordNotFoundError):
         return ORJSONResponse(
             status_code=404, content={"status": "failed", "data": str(e)}
         )
 
-    except Exception as e:
+    else:
         logger.exception(str(e))
         return ORJSONResponse(
             status_code=500,
@@ -63,3 +132,32 @@ async def redirect_latest(request: Request, call_next):
                 "data": "Internal Server Error. Could not process request.",
             },
         )
+
+
+def _with_content_location(send: Send, path: str) -> Send:
+    """Add Content-Location header with resolved path to response."""
+
+    async def wrapper(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(scope=message)
+            headers["Content-Location"] = path
+        await send(message)
+
+    return wrapper
+
+
+async def resolve_latest(path: str) -> str:
+    """Replace `latest` in path with latest version number of the dataset
+    preceding it."""
+    path_items = path.split("/")
+
+    i = 0
+    for i, item in enumerate(path_items):
+        if item == "latest":
+            break
+    if i == 0:
+
+        raise BadRequestError("Invalid URI")
+    path_items[i] = await get_latest_version(path_items[i - 1])
+
+    return "/".join(path_items)
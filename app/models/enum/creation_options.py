@@ -34,6 +34,16 @@ class TileStrategy(str, Enum):
     discontinuous = "discontinuous"
 
 
+class TileBuilder(str, Enum):
+    tippecanoe = "tippecanoe"
+    postgis = "postgis"
+
+
+class TileOutput(str, Enum):
+    directory = "directory"
+    pmtiles = "pmtiles"
+
+
 class PartitionType(str, Enum):
     hash = "hash"
     list = "list"
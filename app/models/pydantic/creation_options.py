@@ -1,7 +1,7 @@
 from datetime import date
 from typing import Any, Dict, List, Optional, Type, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from pydantic.types import PositiveInt
 
 from ..enum.assets import AssetType
@@ -11,6 +11,8 @@ from ..enum.creation_options import (
     PartitionType,
     PGType,
     TableDrivers,
+    TileBuilder,
+    TileOutput,
     TileStrategy,
     VectorDrivers,
 )
@@ -20,6 +22,10 @@ COLUMN_REGEX = r"^[a-z][a-zA-Z0-9_-]{2,}$"
 PARTITION_SUFFIX_REGEX = r"^[a-z0-9_-]{3,}$"
 STR_VALUE_REGEX = r"^[a-zA-Z0-9_-]{1,}$"
 
+# Zoom level at which the postgis tile builder splits the tile pyramid into
+# jobs. Tiles above it cover too many features to render with ST_AsMVT.
+POSTGIS_TILE_SPLIT_ZOOM = 5
+
 
 class Index(BaseModel):
     index_type: IndexType
@@ -90,12 +96,30 @@ class VectorSourceCreationOptions(BaseModel):
         ],
         description="List of indices to add to table",
     )
+    subdivide_max_vertices: Optional[int] = Field(
+        None,
+        ge=5,
+        description="Also store geometries split into parts of at most this number "
+        "of vertices. Speeds up intersections with large polygons (optional).",
+    )
+    simplify_zoom_levels: Optional[List[int]] = Field(
+        None,
+        description="Also store geometries simplified to the pixel size of each of "
+        "these zoom levels, each with a spatial index. Tiles and feature info up to "
+        "a zoom level use the closest simplified geometries (optional).",
+    )
     create_dynamic_vector_tile_cache: bool = Field(
         True,
         description="By default, vector sources will implicitly create a dynamic vector tile cache. "
         "Disable this option by setting value to `false`",
     )
 
+    @validator("simplify_zoom_levels", each_item=True)
+    def zoom_level(cls, v):
+        if not 0 <= v <= 22:
+            raise ValueError("Zoom levels must be between 0 and 22")
+        return v
+
 
 class TableSourceCreationOptions(BaseModel):
     src_driver: TableDrivers = Field(..., description="Driver of input file.")
@@ -153,6 +177,42 @@ class StaticVectorTileCacheCreationOptions(BaseModel):
         description="`discontinuous` corresponds to `drop-densest-as-needed` and"
         "`continuous` corresponds to `coalesce-densest-as-needed`",
     )
+    tile_builder: TileBuilder = Field(
+        TileBuilder.tippecanoe,
+        description="`tippecanoe` builds tiles on a single large node from an NDJSON "
+        "export. `postgis` renders them directly from the database table with "
+        "ST_AsMVT, split into quadkey ranges across many small jobs. It keeps all "
+        "features and ignores `tile_strategy`, which suits point and alert tables. "
+        f"Requires a minimum zoom level of at least {POSTGIS_TILE_SPLIT_ZOOM}.",
+    )
+    output: TileOutput = Field(
+        TileOutput.directory,
+        description="`directory` uploads every tile as a separate object. `pmtiles` "
+        "writes all tiles into a single PMTiles archive, from which the tile API "
+        "serves them with HTTP range requests. Requires the `tippecanoe` tile builder.",
+    )
+
+    @validator("tile_builder")
+    def builder_min_zoom(cls, v, values):
+        if (
+            v == TileBuilder.postgis
+            and values.get("min_zoom", POSTGIS_TILE_SPLIT_ZOOM)
+            < POSTGIS_TILE_SPLIT_ZOOM
+        ):
+            raise ValueError(
+                "The postgis tile builder requires a minimum zoom level of at "
+                f"least {POSTGIS_TILE_SPLIT_ZOOM}"
+            )
+        return v
+
+    @validator("output")
+    def output_builder(cls, v, values):
+        if (
+            v == TileOutput.pmtiles
+            and values.get("tile_builder") != TileBuilder.tippecanoe
+        ):
+            raise ValueError("PMTiles output requires the tippecanoe tile builder")
+        return v
 
 
 class NdjsonCreationOptions(BaseModel):
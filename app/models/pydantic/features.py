@@ -1,7 +1,11 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
 
 from .responses import Response
 
+MAX_POINTS = 10000
+
 
 class FeatureResponse(Response):
     data: Dict[str, Any]
@@ -9,3 +13,18 @@ class FeatureResponse(Response):
 
 class FeaturesResponse(Response):
     data: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class FeaturePoint(BaseModel):
+    lat: float = Field(..., title="Latitude", ge=-90, le=90)
+    lng: float = Field(..., title="Longitude", ge=-180, le=180)
+    z: Optional[int] = Field(None, title="Zoom level", ge=0, le=22)
+
+
+class FeaturesLookupIn(BaseModel):
+    points: List[FeaturePoint] = Field(..., min_items=1, max_items=MAX_POINTS)
+
+
+class FeaturesLookupResponse(Response):
+    data: Dict[str, List[Dict[str, Any]]]
@@ -27,9 +27,13 @@ class FeatureCollection(BaseModel):
 class Geostore(Base):
     gfw_geostore_id: UUID
     gfw_geojson: FeatureCollection
-    gfw_area__ha: float
-    gfw_bbox: List[float]
+    gfw_area__ha: Optional[float]
+    gfw_bbox: Optional[List[float]]
 
 
 class GeostoreResponse(Response):
     data: Geostore
+
+
+class GeostoreIdsResponse(Response):
+    data: List[UUID]
@@ -0,0 +1,41 @@
+from enum import Enum
+from typing import Optional
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+from .base import Base
+from .responses import Response
+
+
+class QueryJobFormat(str, Enum):
+    csv = "csv"
+    parquet = "parquet"
+
+
+class QueryJobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    saved = "saved"
+    failed = "failed"
+
+
+class QueryJobIn(BaseModel):
+    sql: str = Field(..., title="SQL query")
+    geostore_id: Optional[UUID] = Field(None, title="Geostore ID")
+    format: QueryJobFormat = QueryJobFormat.csv
+
+
+class QueryJob(Base):
+    job_id: UUID
+    dataset: str
+    version: str
+    sql: str
+    format: QueryJobFormat
+    status: QueryJobStatus = QueryJobStatus.pending
+    message: Optional[str] = None
+    download_url: Optional[str] = None
+
+
+class QueryJobResponse(Response):
+    data: QueryJob
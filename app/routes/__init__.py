@@ -1,15 +1,23 @@
-import requests
-from fastapi import Depends, HTTPException, Path
+from hashlib import sha256
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Path, Request
 from fastapi.logger import logger
 from fastapi.security import OAuth2PasswordBearer
-from requests import Response
+from httpx import HTTPError, Response
 
-from app.settings.globals import ENV
+from app.settings.globals import AUTH_CACHE_SIZE, AUTH_CACHE_TTL, AUTH_URL
+from app.utils import arrow
+from app.utils.cache import LRUCache
+from app.utils.http import get_async_client
 
 DATASET_REGEX = r"^[a-z][a-z0-9_-]{2,}$"
 VERSION_REGEX = r"^v\d{1,8}\.?\d{1,3}\.?\d{1,3}$|^latest$"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
+# Identities of verified tokens, keyed by token hash
+identity_cache = LRUCache(AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
 
 async def dataset_dependency(
     dataset: str = Path(..., title="Dataset", regex=DATASET_REGEX)
@@ -34,13 +42,18 @@ async def version_dependency(
     return version
 
 
+async def arrow_media_type(request: Request) -> Optional[str]:
+    """Arrow or Parquet media type requested in Accept header, if any."""
+    return arrow.accepted_media_type(request.headers.get("accept", ""))
+
+
 async def is_admin(token: str = Depends(oauth2_scheme)) -> bool:
     """Calls GFW API to authorize user.
 
     User must be ADMIN for gfw app
     """
 
-    response = who_am_i(token)
+    response = await who_am_i(token)
 
     if response.status_code == 401 or not (
         response.json()["role"] == "ADMIN"
@@ -58,7 +71,7 @@ async def is_service_account(token: str = Depends(oauth2_scheme)) -> bool:
     User must be service account with email gfw-sync@wri.org
     """
 
-    response = who_am_i(token)
+    response = await who_am_i(token)
 
     if response.status_code == 401 or not (
         response.json()["email"] == "gfw-sync@wri.org"
@@ -70,17 +83,28 @@ async def is_service_account(token: str = Depends(oauth2_scheme)) -> bool:
         return True
 
 
-def who_am_i(token) -> Response:
-    """Call GFW API to get token's identity."""
+async def who_am_i(token) -> Response:
+    """Call GFW API to get token's identity.
 
-    if ENV == "dev":
-        prefix = "staging"
-    else:
-        prefix = ENV
+    Successful responses are cached, so that repeated calls with the
+    same token don't hit the authorization server. Rejected tokens are
+    always verified again.
+    """
+
+    key = sha256(token.encode()).hexdigest()
+    cached: Optional[Response] = identity_cache.get(key)
+    if cached is not None:
+        return cached
 
     headers = {"Authorization": f"Bearer {token}"}
-    url = f"https://{prefix}-api.globalforestwatch.org/auth/check-logged"
-    response: Response = requests.get(url, headers=headers)
+    url = f"{AUTH_URL}/auth/check-logged"
+    try:
+        response: Response = await get_async_client().get(url, headers=headers)
+    except HTTPError as e:
+        logger.warning(f"Failed to authorize user. Request failed with error: {e}")
+        raise HTTPException(
+            status_code=500, detail="Call to authorization server failed"
+        )
 
     if response.status_code != 200 and response.status_code != 401:
         logger.warning(
@@ -90,4 +114,7 @@ def who_am_i(token) -> Response:
             status_code=500, detail="Call to authorization server failed"
         )
 
+    if response.status_code == 200:
+        identity_cache.set(key, response)
+
     return response
@@ -1,26 +1,76 @@
 """Explore data entries for a given dataset version (vector and tabular data
 only) in a classic RESTful way."""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import defaultdict
-from functools import partial
-from typing import DefaultDict, Optional
-
-import pyproj
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import ORJSONResponse
-from geojson import Point as geoPoint
-from geojson import Polygon as geoPolygon
-from shapely.geometry import Point
-from shapely.ops import transform
+from math import cos, radians
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    DefaultDict,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.sql import Select
 from sqlalchemy.sql.elements import TextClause
 
-from ...application import db
-from ...crud import assets
+from ...application import ContextEngine, db
+from ...crud import assets, versions
+from ...crud.cache import feature_info_cache
 from ...models.pydantic.assets import AssetType
-from ...models.pydantic.features import FeaturesResponse
-from ...routes import dataset_dependency, version_dependency
+from ...models.pydantic.features import (
+    FeaturePoint,
+    FeaturesLookupIn,
+    FeaturesLookupResponse,
+    FeaturesResponse,
+)
+from ...routes import arrow_media_type, dataset_dependency, version_dependency
+from ...utils import arrow
 
 router = APIRouter()
 
+# Shortest distance of one degree latitude, at the equator
+METERS_PER_DEGREE = 110574
+
+MAX_LIMIT = 10000
+NDJSON = "application/x-ndjson"
+CURSOR_PREFIX = "_cursor_"
+POINT_INDEX = "_point_index"
+
+# Positional parameters of prepared info tool queries
+POINT_PARAMS = ("lng", "lat", "dx", "dy", "distance")
+
+
+class CursorKey(NamedTuple):
+    order_by: str  # Expression to order features by
+    select: str  # Expression to return key value in JSON serializable form
+    param: str  # Expression to compare against key value passed as parameter
+    type: type  # Type of key value
+
+
+# Vector tables have a serial feature id. Other tables are ordered by physical
+# row location, using the partition a row is stored in first.
+FID_KEYS = (CursorKey("gfw_fid", "gfw_fid", ":{}", int),)
+ROW_KEYS = (
+    CursorKey("tableoid", "tableoid::bigint", "CAST(:{} AS bigint)::oid", int),
+    CursorKey("ctid", "ctid::text", "CAST(:{} AS text)::tid", str),
+)
+
+
+class FeatureColumns(NamedTuple):
+    fields: List[str]
+    keys: Tuple[CursorKey, ...]
+    subdivided: Optional[str] = None
+    simplified_zoom_levels: Tuple[int, ...] = ()
+
 
 @router.get("/{dataset}/{version}", response_class=ORJSONResponse)
 async def get_features(
@@ -30,69 +80,311 @@ async def get_features(
     lat: float = Query(None, title="Latitude", ge=-90, le=90),
     lng: float = Query(None, title="Longitude", ge=-180, le=180),
     z: int = Query(None, title="Zoom level", ge=0, le=22),
+    limit: Optional[int] = Query(
+        None, title="Maximum number of features to return", ge=1, le=MAX_LIMIT
+    ),
+    cursor: Optional[str] = Query(
+        None, title="Cursor returned with previous page of features"
+    ),
+    request: Request,
+    media_type: Optional[str] = Depends(arrow_media_type),
 ):
     """Retrieve list of features Add optional spatial filter using a point
-    buffer (for info tool)."""
-    feature_rows = await get_features_by_location(dataset, version, lat, lng, z)
+    buffer (for info tool).
+
+    Use `limit` to page through features. Responses then include a
+    `next_cursor` to pass along with the next request, as long as there
+    are more features to fetch. Request `application/x-ndjson` to stream
+    all features as newline delimited JSON, or
+    `application/vnd.apache.arrow.stream` and
+    `application/vnd.apache.parquet` to stream them as Arrow record
+    batches. Streamed responses can't be paged.
+    """
+    ndjson: bool = NDJSON in request.headers.get("accept", "")
+    if (ndjson or media_type is not None) and (limit or cursor is not None):
+        raise HTTPException(
+            status_code=400,
+            detail="Streamed responses can't be paged. "
+            "Remove limit and cursor or request JSON.",
+        )
+
+    columns: FeatureColumns = await get_feature_columns(dataset, version)
+    after: Optional[List[Any]] = _decode_cursor(cursor, columns.keys)
+
+    if ndjson:
+        sql = _features_query(dataset, version, columns, lat, lng, z)
+        return StreamingResponse(_stream_features(sql), media_type=NDJSON)
+
+    if media_type is not None:
+        sql = _features_query(dataset, version, columns, lat, lng, z)
+        return StreamingResponse(
+            _stream_arrow_features(sql, media_type), media_type=media_type,
+        )
+
+    # Plain info tool requests use a prepared statement
+    if not (limit or after):
+        feature_rows = await get_features_by_location(dataset, version, lat, lng, z)
+        return await _features_response(feature_rows)
+
+    # Fetch one extra row to know if there is a next page. Key values are
+    # appended to the selected columns.
+    key_count = len(columns.keys)
+    sql = _features_query(
+        dataset, version, columns, lat, lng, z, limit and limit + 1, after
+    )
+    feature_rows = await db.all(sql)
+
+    next_cursor: Optional[str] = None
+    if limit and len(feature_rows) > limit:
+        feature_rows = feature_rows[:limit]
+        next_cursor = _encode_cursor(feature_rows[-1], key_count)
+
+    return await _features_response(feature_rows, key_count, next_cursor)
+
+
+@router.post("/{dataset}/{version}", response_class=ORJSONResponse)
+async def get_features_by_locations(
+    *,
+    dataset: str = Depends(dataset_dependency),
+    version: str = Depends(version_dependency),
+    request: FeaturesLookupIn,
+) -> FeaturesLookupResponse:
+    """Retrieve features for many locations at once.
 
-    return await _features_response(feature_rows)
+    Each point uses the same search tolerance as the info tool for its
+    zoom level. Features are returned per point, keyed by the position
+    of the point in the request.
+    """
+    columns: FeatureColumns = await get_feature_columns(dataset, version)
+    sql = _features_by_locations_query(dataset, version, columns, request.points)
+
+    data: Dict[str, List[Dict[str, Any]]] = {
+        str(i): list() for i in range(len(request.points))
+    }
+    # Lookups run on the read pool, POST requests are bound to the write pool
+    engine = await ContextEngine.get_engine("READ")
+    for row in await engine.all(sql):
+        feature = dict(row.items())
+        data[str(feature.pop(POINT_INDEX))].append(feature)
+
+    return FeaturesLookupResponse(data=data)
 
 
 async def get_features_by_location(dataset, version, lat, lng, zoom):
+    """Features at location, as selected by the info tool.
+
+    The query text only depends on dataset version, feature columns and
+    whether a search tolerance applies. asyncpg keeps prepared
+    statements per connection, keyed by query text, so that repeated
+    requests skip building, compiling and planning the query and only
+    bind new coordinates.
+    """
+    columns: FeatureColumns = await get_feature_columns(dataset, version)
+    values: Dict[str, float] = _point_values(lat, lng, zoom)
+    sql: str = _info_query(
+        dataset,
+        version,
+        columns,
+        "distance" in values,
+        _geometry_column(columns, zoom),
+    )
+
+    async with db.acquire() as conn:
+        return await conn.raw_connection.fetch(
+            sql, *[values[name] for name in POINT_PARAMS if name in values]
+        )
+
+
+def _features_query(
+    dataset: str,
+    version: str,
+    columns: FeatureColumns,
+    lat: float,
+    lng: float,
+    zoom: int,
+    limit: Optional[int] = None,
+    after: Optional[List[Any]] = None,
+) -> Select:
+    """Select features at location.
+
+    If results are limited or start after a cursor, features are ordered
+    by key columns and key values are appended to the selected columns.
+    """
     t = db.table(version)
     t.schema = dataset
 
-    geometry = geodesic_point_buffer(lat, lng, zoom)
+    feature_columns = [db.column(field_name) for field_name in columns.fields]
+
+    sql = db.select(feature_columns)
+    if limit or after:
+        sql = (
+            db.select(
+                feature_columns
+                + [
+                    db.literal_column(key.select).label(f"{CURSOR_PREFIX}{i}")
+                    for i, key in enumerate(columns.keys)
+                ]
+            )
+            .order_by(*[db.literal_column(key.order_by) for key in columns.keys])
+            .limit(limit)
+        )
+    sql = sql.select_from(t).where(
+        filter_point(
+            _geometry_column(columns, zoom), lat, lng, zoom, columns.subdivided
+        )
+    )
+
+    if after:
+        sql = sql.where(_filter_after(columns.keys, after))
+
+    return sql
 
-    all_columns = await get_fields(dataset, version)
-    feature_columns = [
-        db.column(field["field_name"])
-        for field in all_columns
-        if field["is_feature_info"]
-    ]
 
-    sql = (
-        db.select(feature_columns)
-        .select_from(t)
-        .where(filter_intersects("geom", str(geometry)))
+def _info_query(
+    dataset: str,
+    version: str,
+    columns: FeatureColumns,
+    tolerance: bool,
+    field: str = "geom",
+) -> str:
+    """Select features at location, using positional parameters."""
+    fields = ", ".join(_quote(field_name) for field_name in columns.fields)
+    condition = _point_condition(
+        field, tolerance, lambda name: f"${POINT_PARAMS.index(name) + 1}"
+    )
+    return (
+        f"SELECT {fields} FROM {_quote(dataset)}.{_quote(version)} "
+        f"WHERE {_on_parts(condition, columns.subdivided)}"
     )
 
-    features = await db.all(sql)
 
-    return features
+def _quote(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
 
 
-def geodesic_point_buffer(lat, lng, zoom):
-    """Return either a point at or polygon surrounding provided latitude and
-    longitude (depending on zoom level) as geoJSON see
-    https://gis.stackexchange.com/questions/289044/creating-buffer-circle-x-
-    kilometers-from-point-using-python."""
-    buffer_distance = _get_buffer_distance(zoom)
+def _features_by_locations_query(
+    dataset: str, version: str, columns: FeatureColumns, points: List[FeaturePoint]
+) -> Select:
+    """Select features at all points in a single query.
 
-    if buffer_distance:
-        proj_wgs84 = pyproj.Proj(init="epsg:4326")
-        # Azimuthal equidistant projection
-        aeqd_proj = "+proj=aeqd +lat_0={lat} +lon_0={lon} +x_0=0 +y_0=0"
-        project = partial(
-            pyproj.transform,
-            pyproj.Proj(aeqd_proj.format(lat=lat, lon=lng)),
-            proj_wgs84,
+    Points are passed as arrays and unnested into a relation, which is
+    joined with the feature table. Points which require an exact match
+    and points with a search tolerance are joined separately, so that
+    both joins can use the spatial index. If the version has subdivided
+    geometries, points are joined with these first and then with the
+    features their parts belong to.
+    """
+    fields = set(columns.fields) | {"gfw_fid"}
+    t = db.table(version, *[db.column(field_name) for field_name in fields])
+    t.schema = dataset
+
+    parts = None
+    geom = "geom"
+    if columns.subdivided is not None:
+        parts = db.table(
+            f"{version}{versions.SUBDIVIDED_SUFFIX}",
+            db.column("gfw_fid"),
+            db.column("geom"),
         )
-        buf = Point(0, 0).buffer(buffer_distance)  # distance in metres
+        parts.schema = dataset
+        parts = parts.alias("_parts")
+        geom = "_parts.geom"
 
-        coord_list = transform(project, buf).exterior.coords[:]
-        geojson_geometry = geoPolygon([coord_list])
-    else:
-        geojson_geometry = geoPoint((lat, lng))
+    exact: List[Tuple[int, FeaturePoint]] = list()
+    nearby: List[Tuple[int, FeaturePoint, int]] = list()
+    for i, point in enumerate(points):
+        distance = _get_buffer_distance(point.z)
+        if distance:
+            nearby.append((i, point, distance))
+        else:
+            exact.append((i, point))
 
-    return geojson_geometry
+    point_geom = "ST_SetSRID(ST_MakePoint(_points._lng, _points._lat), 4326)"
+    selects: List[Select] = list()
 
+    if exact:
+        exact_points = _points(
+            "exact",
+            index=[i for i, _ in exact],
+            lng=[p.lng for _, p in exact],
+            lat=[p.lat for _, p in exact],
+        )
+        selects.append(
+            _select_at_points(
+                t, columns, exact_points, parts, f"ST_Intersects({geom}, {point_geom})"
+            )
+        )
 
-def _get_buffer_distance(zoom: int) -> Optional[int]:
-    # FIXME: Couldn't get the exact match to work, so setting a buffer
-    # distance of 1m for zoom levels >9.
-    # zoom_buffer: DefaultDict[int, Optional[int]] = defaultdict(lambda: None)
-    zoom_buffer: DefaultDict[int, Optional[int]] = defaultdict(lambda: 1)
+    if nearby:
+        envelopes = [_search_envelope(p.lat, distance) for _, p, distance in nearby]
+        nearby_points = _points(
+            "nearby",
+            index=[i for i, _, _ in nearby],
+            lng=[p.lng for _, p, _ in nearby],
+            lat=[p.lat for _, p, _ in nearby],
+            distance=[float(distance) for _, _, distance in nearby],
+            dx=[dx for dx, _ in envelopes],
+            dy=[dy for _, dy in envelopes],
+        )
+        selects.append(
+            _select_at_points(
+                t,
+                columns,
+                nearby_points,
+                parts,
+                f"{geom} && ST_Expand({point_geom}, _points._dx, _points._dy) "
+                f"AND ST_DWithin({geom}::geography, {point_geom}::geography, "
+                "_points._distance)",
+            )
+        )
+
+    return selects[0] if len(selects) == 1 else db.union_all(*selects)
+
+
+def _points(name: str, **values: List[Any]):
+    """Relation of points, unnested from one array per attribute."""
+    types = {"index": "integer"}
+    arrays = ", ".join(
+        f"CAST(:{name}_{key} AS {types.get(key, 'double precision')}[])"
+        for key in values.keys()
+    )
+    columns = ", ".join(f"_{key}" for key in values.keys())
+
+    return (
+        db.text(f"SELECT * FROM unnest({arrays}) AS points({columns})")
+        .bindparams(**{f"{name}_{key}": value for key, value in values.items()})
+        .columns(*[db.column(f"_{key}") for key in values.keys()])
+        .alias("_points")
+    )
+
+
+def _select_at_points(
+    t, columns: FeatureColumns, points, parts, condition: str
+) -> Select:
+    """Join points with features which satisfy the spatial condition.
+
+    With subdivided geometries, a feature is returned once per point,
+    however many of its parts match.
+    """
+    sql = db.select(
+        [points.c._index.label(POINT_INDEX)]
+        + [t.c[field_name] for field_name in columns.fields]
+    )
+    if parts is None:
+        return sql.select_from(points.join(t, db.text(condition)))
+
+    return sql.select_from(
+        points.join(parts, db.text(condition)).join(t, t.c.gfw_fid == parts.c.gfw_fid)
+    ).distinct(points.c._index, parts.c.gfw_fid)
+
+
+def _get_buffer_distance(zoom: Optional[int]) -> Optional[int]:
+    """Search tolerance in meters for given zoom level.
+
+    Above zoom level 9 or without zoom level only exact matches are
+    returned.
+    """
+    zoom_buffer: DefaultDict[Optional[int], Optional[int]] = defaultdict(lambda: None)
     zoom_buffer.update(
         {
             0: 10000,
@@ -110,14 +402,179 @@ def _get_buffer_distance(zoom: int) -> Optional[int]:
     return zoom_buffer[zoom]
 
 
-def filter_intersects(field, geometry) -> TextClause:
-    f = db.text(
-        f"ST_Intersects({field}, ST_SetSRID(ST_GeomFromGeoJSON(:geometry),4326))"
-    )
-    value = {"geometry": f"{geometry}"}
-    f = f.bindparams(**value)
+def filter_point(
+    field: str, lat: float, lng: float, zoom: int, subdivided: Optional[str] = None
+) -> TextClause:
+    """Filter features within search tolerance of a point, depending on
+    zoom level.
+
+    The point is passed as coordinates, which spares PostGIS from
+    parsing a geometry. Tolerance search first compares bounding boxes,
+    which uses the spatial index on `field`, and then checks geodesic
+    distance of the remaining candidates. If a table with subdivided
+    geometries is given, the filter is applied to its parts instead.
+    """
+    values = _point_values(lat, lng, zoom)
+    condition = _point_condition(field, "distance" in values, lambda name: f":{name}")
+
+    return db.text(_on_parts(condition, subdivided)).bindparams(**values)
+
+
+def _point_values(lat: float, lng: float, zoom: int) -> Dict[str, float]:
+    """Parameter values of point filter."""
+    values = {"lat": float(lat), "lng": float(lng)}
+    distance = _get_buffer_distance(zoom)
+
+    if distance:
+        dx, dy = _search_envelope(lat, distance)
+        values.update({"dx": dx, "dy": dy, "distance": float(distance)})
+
+    return values
+
+
+def _point_condition(field: str, tolerance: bool, param: Callable[[str], str]) -> str:
+    """Condition of point filter, with parameters rendered by `param`."""
+    point = f"ST_SetSRID(ST_MakePoint({param('lng')}, {param('lat')}), 4326)"
+
+    if tolerance:
+        return (
+            f"{field} && ST_Expand({point}, {param('dx')}, {param('dy')}) "
+            f"AND ST_DWithin({field}::geography, {point}::geography, "
+            f"{param('distance')})"
+        )
+    return f"ST_Intersects({field}, {point})"
+
+
+def _geometry_column(columns: FeatureColumns, zoom: Optional[int]) -> str:
+    """Geometry column to filter on at a zoom level.
+
+    Subdivided geometries are only stored at full resolution.
+    """
+    if zoom is None or columns.subdivided is not None:
+        return "geom"
+    return versions.simplified_column("geom", columns.simplified_zoom_levels, zoom)
+
+
+def _on_parts(condition: str, subdivided: Optional[str]) -> str:
+    """Evaluate spatial condition on subdivided geometries, if available."""
+    if subdivided is None:
+        return condition
+    return f"gfw_fid IN (SELECT gfw_fid FROM {subdivided} WHERE {condition})"
+
+
+def _search_envelope(lat: float, distance: int) -> Tuple[float, float]:
+    """Degrees longitude and latitude which cover at least given distance
+    in meters around given latitude."""
+    dy = distance / METERS_PER_DEGREE
+    # Degrees longitude get shorter towards the poles, use the shortest
+    # length within search distance
+    cos_lat = cos(radians(min(abs(lat) + dy, 90)))
+    dx = dy / cos_lat if cos_lat * 180 > dy else 180.0
+
+    return dx, dy
+
+
+async def get_feature_columns(dataset, version) -> FeatureColumns:
+    """Names of fields to return with features and key columns to page
+    through features.
+
+    Columns are cached per version and dropped from cache when an asset
+    of the version changes. Tables with a feature ID may come with a
+    table of subdivided geometries, which is then used for spatial
+    filters. Otherwise, filters at low zoom levels use simplified
+    geometries, if available.
+    """
+    columns: Optional[FeatureColumns] = feature_info_cache.get((dataset, version))
+    if columns is None:
+        fields = await get_fields(dataset, version)
+        has_fid = any(field["field_name"] == "gfw_fid" for field in fields)
+        columns = FeatureColumns(
+            fields=[
+                field["field_name"] for field in fields if field["is_feature_info"]
+            ],
+            keys=FID_KEYS if has_fid else ROW_KEYS,
+            subdivided=await versions.get_subdivided_table(dataset, version)
+            if has_fid
+            else None,
+            simplified_zoom_levels=versions.simplified_zoom_levels(fields, "geom"),
+        )
+        feature_info_cache.set((dataset, version), columns)
+
+    return columns
+
+
+def _filter_after(keys: Tuple[CursorKey, ...], after: List[Any]) -> TextClause:
+    """Filter features which come after cursor."""
+    columns = ", ".join(key.order_by for key in keys)
+    params = ", ".join(key.param.format(f"key_{i}") for i, key in enumerate(keys))
+    f = db.text(f"({columns}) > ({params})")
+
+    return f.bindparams(**{f"key_{i}": value for i, value in enumerate(after)})
+
+
+def _encode_cursor(row, key_count: int) -> str:
+    values = [row[f"{CURSOR_PREFIX}{i}"] for i in range(key_count)]
+    return urlsafe_b64encode(orjson.dumps(values)).decode()
+
+
+def _decode_cursor(
+    cursor: Optional[str], keys: Tuple[CursorKey, ...]
+) -> Optional[List[Any]]:
+    if cursor is None:
+        return None
+
+    try:
+        values = orjson.loads(urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != len(keys)
+        or not all(isinstance(value, key.type) for value, key in zip(values, keys))
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    return values
+
+
+def _feature(row, key_count: int) -> Dict[str, Any]:
+    """Feature attributes, without key values appended for paging."""
+    feature = dict(row.items())
+    for i in range(key_count):
+        del feature[f"{CURSOR_PREFIX}{i}"]
+    return feature
+
+
+async def _stream_features(sql: Select) -> AsyncIterator[bytes]:
+    """Stream features as newline delimited JSON.
+
+    Rows are fetched using a server-side cursor, so that only a small
+    number of rows is kept in memory at any time.
+    """
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            async for row in conn.iterate(sql):
+                yield orjson.dumps(jsonable_encoder(dict(row.items()))) + b"\n"
+
+
+async def _stream_arrow_features(sql: Select, media_type: str) -> AsyncIterator[bytes]:
+    """Stream features as Arrow record batches.
 
-    return f
+    The query is prepared directly with asyncpg, which provides the
+    column types.
+    """
+    query, params = db.bind.compile(sql)
+    async with db.acquire() as conn:
+        raw_conn = conn.raw_connection
+        async with raw_conn.transaction():
+            statement = await raw_conn.prepare(query)
+            attributes = statement.get_attributes()
+            records = statement.cursor(*params, prefetch=MAX_LIMIT)
+            async for chunk in arrow.stream_records(
+                attributes, records, media_type, MAX_LIMIT
+            ):
+                yield chunk
 
 
 async def get_fields(dataset, version):
@@ -131,7 +588,9 @@ async def get_fields(dataset, version):
     return fields
 
 
-async def _features_response(rows) -> FeaturesResponse:
+async def _features_response(
+    rows, key_count: int = 0, next_cursor: Optional[str] = None
+) -> FeaturesResponse:
     """Serialize ORM response."""
-    data = list(rows)
-    return FeaturesResponse(data=data)
+    data = [_feature(row, key_count) for row in rows]
+    return FeaturesResponse(data=data, next_cursor=next_cursor)
@@ -1,31 +1,87 @@
 """Retrieve a geometry using its mb5 hash for a given dataset, user defined
 geometries in the datastore."""
 
+from hashlib import md5
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Path
-from fastapi.responses import ORJSONResponse
+import orjson
+from asyncpg.exceptions import PostgresError
+from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response
 
+from ...crud import geostore
+from ...crud.cache import geostore_cache
+from ...errors import RecordNotFoundError
+from ...models.pydantic.geostore import Geostore, GeostoreIdsResponse, GeostoreResponse
 from ...routes import dataset_dependency, version_dependency
 
+IMMUTABLE = "public, max-age=31536000, immutable"
+NDJSON = "application/x-ndjson"
+MAX_GEOSTORES = 50000
+
 router = APIRouter()
 
 
 @router.post(
-    "/geostore", response_class=ORJSONResponse,
+    "/geostore",
+    response_class=ORJSONResponse,
+    response_model=GeostoreIdsResponse,
+    tags=["Geostore"],
+    status_code=201,
 )
-async def add_new_geostore():
-    """Add geostore feature to User geostore."""
-    pass
+async def add_new_geostore(*, request: Request) -> GeostoreIdsResponse:
+    """Add geostore feature to User geostore.
+
+    Accepts a GeoJSON FeatureCollection, or newline delimited GeoJSON
+    features or geometries with content type `application/x-ndjson`.
+    Returns the geostore IDs of all geometries in input order. Existing
+    geometries are not added again.
+    """
+
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith(NDJSON):
+            objects = [orjson.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            objects = [orjson.loads(body)]
+        geometries: List[str] = [
+            orjson.dumps(geometry).decode() for geometry in _geometries(objects)
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid GeoJSON.")
+
+    if not geometries:
+        raise HTTPException(status_code=400, detail="No geometries found.")
+    if len(geometries) > MAX_GEOSTORES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot add more than {MAX_GEOSTORES} geostores at once.",
+        )
+
+    try:
+        geostore_ids = await geostore.create_geostores(geometries)
+    except PostgresError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return GeostoreIdsResponse(data=geostore_ids)
 
 
 @router.get(
     "/geostore/{geostore_id}", response_class=ORJSONResponse, tags=["Geostore"],
 )
-async def get_geostore_root(*, geostore_id: UUID = Path(..., title="geostore_id")):
+async def get_geostore_root(
+    *, geostore_id: UUID = Path(..., title="geostore_id"), request: Request
+):
     """Retrieve GeoJSON representation for a given geostore ID of any
     dataset."""
-    pass
+
+    return await _geostore_response(
+        (None, None, geostore_id),
+        lambda: geostore.get_geostore_from_anywhere(geostore_id),
+        request,
+    )
 
 
 @router.get(
@@ -37,11 +93,57 @@ async def get_geostore(
     *,
     dataset: str = Depends(dataset_dependency),
     version: str = Depends(version_dependency),
-    geostore_id: UUID = Path(..., title="geostore_id")
+    geostore_id: UUID = Path(..., title="geostore_id"),
+    request: Request,
 ):
     """Retrieve GeoJSON representation for a given geostore ID of a dataset
     version.
 
     Obtain geostore ID from feature attributes.
     """
-    pass
+
+    return await _geostore_response(
+        (dataset, version, geostore_id),
+        lambda: geostore.get_geostore_by_version(dataset, version, geostore_id),
+        request,
+    )
+
+
+async def _geostore_response(
+    key: Tuple[Optional[str], Optional[str], UUID],
+    get_geostore: Callable[[], Awaitable[Dict[str, Any]]],
+    request: Request,
+) -> Response:
+    """Serve serialized geostore from cache or database.
+
+    Geostore IDs are hashes of their geometry, so responses never
+    change and can be cached by clients for good.
+    """
+    entry: Optional[Tuple[bytes, str]] = geostore_cache.get(key)
+    if entry is None:
+        try:
+            data = Geostore(**await get_geostore())
+        except RecordNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+        content = orjson.dumps(jsonable_encoder(GeostoreResponse(data=data).dict()))
+        entry = content, f'"{md5(content).hexdigest()}"'
+        geostore_cache.set(key, entry)
+
+    content, etag = entry
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type="application/json", headers=headers)
+
+
+def _geometries(objects: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Geometries of GeoJSON feature collections, features and
+    geometries."""
+    for obj in objects:
+        if obj["type"] == "FeatureCollection":
+            yield from _geometries(obj["features"])
+        elif obj["type"] == "Feature":
+            yield obj["geometry"]
+        else:
+            yield obj
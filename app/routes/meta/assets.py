@@ -9,7 +9,7 @@ rely on full integrety. We can only assume that unmanaged are based on
 the same version and do not know the processing history.
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from uuid import UUID
 
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Query
@@ -262,18 +262,35 @@ async def _asset_response(asset_orm: ORMAsset) -> AssetResponse:
 
 async def _assets_response(assets_orm: List[ORMAsset]) -> AssetsResponse:
     """Serialize ORM response."""
-    data = [await _serialized_asset(asset_orm) for asset_orm in assets_orm]
+
+    # Assets of the same version share the source type,
+    # so only look it up once per version.
+    source_types: Dict[Tuple[str, str], str] = dict()
+    data = list()
+    for asset_orm in assets_orm:
+        key = (asset_orm.dataset, asset_orm.version)
+        if key not in source_types:
+            source_types[key] = await _get_source_type(*key)
+        data.append(await _serialized_asset(asset_orm, source_types[key]))
+
     return AssetsResponse(data=data)
 
 
-async def _serialized_asset(asset_orm: ORMAsset) -> Asset:
-    version_orm: ORMVersion = await versions.get_version(
-        asset_orm.dataset, asset_orm.version
-    )
+async def _serialized_asset(
+    asset_orm: ORMAsset, source_type: Optional[str] = None
+) -> Asset:
+    if source_type is None:
+        source_type = await _get_source_type(asset_orm.dataset, asset_orm.version)
+
     data: Asset = Asset.from_orm(asset_orm)
     data.metadata = asset_metadata_factory(asset_orm.asset_type, asset_orm.metadata)
     data.creation_options = asset_creation_option_factory(
-        version_orm.source_type, asset_orm.asset_type, asset_orm.creation_options
+        source_type, asset_orm.asset_type, asset_orm.creation_options
     )
     logger.debug(f"Metadata: {data.metadata.dict(by_alias=True)}")
     return data
+
+
+async def _get_source_type(dataset: str, version: str) -> str:
+    version_orm: ORMVersion = await versions.get_version(dataset, version)
+    return version_orm.source_type
@@ -1,24 +1,356 @@
 """Explore data entries for a given dataset version using standard SQL."""
 
-from uuid import UUID
+import asyncio
+from datetime import datetime, timezone
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import ORJSONResponse
+import orjson
+from asyncpg import Record
+from asyncpg.exceptions import PostgresError, QueryCanceledError
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 
-from ...routes import dataset_dependency, version_dependency
+from ...application import ContextEngine
+from ...crud import versions
+from ...crud.cache import query_result_cache
+from ...crud.queries import copy_query, execute_query, query_plan
+from ...errors import BadRequestError, RecordNotFoundError
+from ...models.orm.versions import Version as ORMVersion
+from ...models.pydantic.query_jobs import (
+    QueryJob,
+    QueryJobIn,
+    QueryJobResponse,
+    QueryJobStatus,
+)
+from ...routes import arrow_media_type, dataset_dependency, is_admin, version_dependency
+from ...settings.globals import (
+    QUERY_CACHE_TTL,
+    QUERY_EXPENSIVE_CONCURRENCY,
+    QUERY_JOB_MAX_COST,
+    QUERY_MAX_COST,
+    QUERY_MAX_ROWS,
+    QUERY_PREFETCH,
+    QUERY_TIMEOUT,
+)
+from ...tasks.query_jobs import get_query_job, put_query_job, run_query_job
+from ...utils import arrow
+from ...utils.sql import bind_query
 
 router = APIRouter()
 
+CSV = "text/csv"
+
+_expensive_queries: Optional[asyncio.Semaphore] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
 
 @router.get("/{dataset}/{version}/query", response_class=ORJSONResponse, tags=["Query"])
 async def query_dataset(
     *,
     dataset: str = Depends(dataset_dependency),
     version: str = Depends(version_dependency),
-    sql: str = Query(None, title="SQL query"),
-    geostore_id: UUID = Query(None, title="Geostore ID")
+    sql: str = Query(..., title="SQL query"),
+    geostore_id: UUID = Query(None, title="Geostore ID"),
+    media_type: Optional[str] = Depends(arrow_media_type),
+    request: Request,
 ):
-    """Execute a read ONLY SQL query on the given dataset version (if
-    implemented)."""
+    """Execute a read ONLY SQL query on the given dataset version.
+
+    The query must be a single SELECT statement. The table in the FROM
+    clause refers to the dataset version, whatever its name. If a
+    geostore ID is given, only rows which intersect with the geostore
+    are selected. Rows are streamed as they are read from the database.
+    Request `application/vnd.apache.arrow.stream` or
+    `application/vnd.apache.parquet` to receive rows as Arrow record
+    batches, with geometries encoded as WKB. Request `text/csv` to
+    receive rows as CSV, exactly as PostgreSQL's COPY writes them.
+
+    Queries whose estimated cost exceeds the configured limits are
+    rejected. Results are cached once the version is saved, until data
+    are appended to it.
+    """
+
+    row, bound_sql = await _bind_query(dataset, version, sql, geostore_id)
+
+    # Results only change while data are added to a version
+    if media_type is None:
+        csv = CSV in request.headers.get("accept", "")
+        media_type = CSV if csv else "application/json"
+    key = (dataset, version, bound_sql, geostore_id, media_type)
+    cacheable: bool = row.status == "saved"
+    ttl: Optional[float] = QUERY_CACHE_TTL if row.is_mutable else None
+    if cacheable:
+        content: Optional[bytes] = await query_result_cache.get(key)
+        if content is not None:
+            return Response(content, media_type=media_type)
+
+    rows = _query_rows(bound_sql, copy_query if media_type == CSV else execute_query)
+
+    # Fetch the first row before sending the response, so that invalid
+    # queries still result in a proper error response. CSV data are
+    # passed on as they are, other formats need the column attributes.
+    try:
+        attributes: Optional[Sequence[Any]] = None
+        if media_type != CSV:
+            attributes = await rows.__anext__()
+        first_row: Optional[Any] = await rows.__anext__()
+    except StopAsyncIteration:
+        first_row = None
+    except QueryCanceledError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query exceeded the time limit of {QUERY_TIMEOUT} seconds.",
+        )
+    except PostgresError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if media_type == CSV:
+        chunks = _chain(first_row, rows)
+    elif media_type in arrow.MEDIA_TYPES:
+        # Column attributes are always the first item for formats other than CSV
+        assert attributes is not None
+        chunks = arrow.stream_records(
+            attributes, _chain(first_row, rows), media_type, QUERY_PREFETCH
+        )
+    else:
+        chunks = _stream_response(first_row, rows)
+    if cacheable:
+        chunks = _cache_response(chunks, key, ttl)
+
+    return StreamingResponse(chunks, media_type=media_type)
+
+
+@router.post(
+    "/{dataset}/{version}/query/jobs",
+    response_class=ORJSONResponse,
+    response_model=QueryJobResponse,
+    status_code=202,
+    tags=["Query"],
+)
+async def submit_query_job(
+    *,
+    dataset: str = Depends(dataset_dependency),
+    version: str = Depends(version_dependency),
+    request: QueryJobIn,
+    background_tasks: BackgroundTasks,
+    response: ORJSONResponse,
+    is_authorized: bool = Depends(is_admin),
+) -> QueryJobResponse:
+    """Run a read ONLY SQL query in the background.
+
+    The query follows the same rules as for the query endpoint, but is
+    subject to a separate cost limit and not to the regular time limit.
+    Only a few jobs run at the same time, others wait until they are
+    done. The result is written to the data lake as CSV or Parquet. Poll
+    the returned job for its status and a download URL of the result.
+    """
+    _, bound_sql = await _bind_query(dataset, version, request.sql, request.geostore_id)
+
+    # Jobs run on the read pool, POST requests are bound to the write pool
+    try:
+        plan: Dict[str, Any] = await query_plan(
+            bound_sql, await ContextEngine.get_engine("READ")
+        )
+    except QueryCanceledError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query exceeded the time limit of {QUERY_TIMEOUT} seconds.",
+        )
+    except PostgresError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    summary: Dict[str, Any] = _plan_summary(plan)
+    if summary["total_cost"] > QUERY_JOB_MAX_COST:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "message": "Estimated query cost exceeds limits. "
+                "Please narrow down your query.",
+                "plan": summary,
+                "limits": {"total_cost": QUERY_JOB_MAX_COST},
+            },
+        )
+
+    now = datetime.now(timezone.utc)
+    job = QueryJob(
+        job_id=uuid4(),
+        dataset=dataset,
+        version=version,
+        sql=request.sql,
+        format=request.format,
+        created_on=now,
+        updated_on=now,
+    )
+    await put_query_job(job, QueryJobStatus.pending)
+
+    background_tasks.add_task(run_query_job, job, bound_sql)
+    response.headers["Location"] = f"/sql/jobs/{job.job_id}"
+    return QueryJobResponse(data=job)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    response_class=ORJSONResponse,
+    response_model=QueryJobResponse,
+    tags=["Query"],
+)
+async def get_query_job_status(*, job_id: UUID = Path(...)) -> QueryJobResponse:
+    """Status of a query job.
+
+    Once the job is saved, the response includes a temporary download
+    URL of the result.
+    """
+    try:
+        job: QueryJob = await get_query_job(job_id)
+    except RecordNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return QueryJobResponse(data=job)
+
+
+async def _bind_query(
+    dataset: str, version: str, sql: str, geostore_id: Optional[UUID]
+) -> Tuple[ORMVersion, str]:
+    """Version row and query bound to its table."""
+    try:
+        row: ORMVersion = await versions.get_version(dataset, version)
+    except RecordNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    subdivided: Optional[str] = None
+    if geostore_id is not None:
+        subdivided = await versions.get_subdivided_table(dataset, version)
+
+    try:
+        return row, bind_query(sql, dataset, version, geostore_id, subdivided)
+    except BadRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _query_rows(
+    sql: str, execute: Callable[[str], AsyncIterator[Any]]
+) -> AsyncIterator[Any]:
+    """Check estimated cost of query and iterate over its results.
+
+    Queries exceeding the cost limits are rejected, unless a number of
+    slots is reserved for expensive queries. In that case they wait for
+    a free slot before they are executed.
+    """
+    plan: Dict[str, Any] = await query_plan(sql)
+    summary: Dict[str, Any] = _plan_summary(plan)
+
+    if (
+        summary["total_cost"] <= QUERY_MAX_COST
+        and summary["max_rows"] <= QUERY_MAX_ROWS
+    ):
+        async for row in execute(sql):
+            yield row
+
+    elif QUERY_EXPENSIVE_CONCURRENCY > 0:
+        async with _expensive_query_slots():
+            async for row in execute(sql):
+                yield row
+
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "message": "Estimated query cost exceeds limits. "
+                "Please narrow down your query.",
+                "plan": summary,
+                "limits": {"total_cost": QUERY_MAX_COST, "max_rows": QUERY_MAX_ROWS},
+            },
+        )
+
+
+def _plan_summary(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Total cost of the query plan and the largest number of rows any
+    plan node is expected to process."""
+
+    def plan_rows(node: Dict[str, Any]) -> Iterator[int]:
+        yield node["Plan Rows"]
+        for child in node.get("Plans", list()):
+            yield from plan_rows(child)
+
+    return {
+        "node_type": plan["Node Type"],
+        "total_cost": plan["Total Cost"],
+        "rows": plan["Plan Rows"],
+        "max_rows": max(plan_rows(plan)),
+    }
+
+
+def _expensive_query_slots() -> asyncio.Semaphore:
+    """Semaphore limiting the number of concurrent expensive queries.
+
+    Semaphores are bound to an event loop, hence a new one is created
+    if the current loop changes.
+    """
+    global _expensive_queries
+    global _loop
+
+    loop = asyncio.get_event_loop()
+    if _expensive_queries is None or _loop is not loop:
+        _expensive_queries = asyncio.Semaphore(QUERY_EXPENSIVE_CONCURRENCY)
+        _loop = loop
+    return _expensive_queries
+
+
+async def _chain(first: Optional[Any], rest: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    if first is not None:
+        yield first
+        async for item in rest:
+            yield item
+
+
+async def _stream_response(
+    first_row: Optional[Record], rows: AsyncIterator[Record]
+) -> AsyncIterator[bytes]:
+    """Serialize rows into the regular response envelope, one row at a
+    time."""
+    yield b'{"status":"success","data":['
+    if first_row is not None:
+        yield orjson.dumps(jsonable_encoder(dict(first_row.items())))
+        async for row in rows:
+            yield b"," + orjson.dumps(jsonable_encoder(dict(row.items())))
+    yield b"]}"
+
+
+async def _cache_response(
+    chunks: AsyncIterator[bytes], key: Tuple[Any, ...], ttl: Optional[float]
+) -> AsyncIterator[bytes]:
+    """Pass through response and cache it once complete, unless it gets too
+    large to be cached."""
+    cached: Optional[List[bytes]] = list()
+    size = 0
+    async for chunk in chunks:
+        if cached is not None:
+            size += len(chunk)
+            if size > query_result_cache.max_entry_size:
+                cached = None
+            else:
+                cached.append(chunk)
+        yield chunk
 
-    raise NotImplementedError
+    if cached is not None:
+        await query_result_cache.set(key, b"".join(cached), ttl)
@@ -13,6 +13,7 @@ from fastapi.responses import ORJSONResponse
 
 from ...application import ContextEngine, db
 from ...crud import assets, tasks, versions
+from ...crud.cache import invalidate_query_results, invalidate_tiles
 from ...errors import RecordAlreadyExistsError, RecordNotFoundError
 from ...models.enum.assets import AssetStatus
 from ...models.enum.change_log import ChangeLogStatus
@@ -217,6 +218,10 @@ async def _check_completed(asset_id: UUID):
         if asset_row.is_default:
             dataset, version = asset_row.dataset, asset_row.version
 
+            # Cached query results and tiles don't include appended rows
+            invalidate_query_results(dataset, version)
+            invalidate_tiles(dataset, version)
+
             await versions.update_version(
                 dataset,
                 version,
@@ -250,7 +255,13 @@ async def _get_field_metadata(dataset: str, version: str) -> List[Dict[str, Any]
 
     for row in rows:
         metadata = FieldMetadata.from_orm(row)
-        if metadata.field_name_ in ["geom", "geom_wm", "gfw_geojson", "gfw_bbox"]:
+        simplified = metadata.field_type == "geometry" and bool(
+            versions.SIMPLIFIED_COLUMN.match(metadata.field_name_)
+        )
+        if (
+            metadata.field_name_ in ["geom", "geom_wm", "gfw_geojson", "gfw_bbox"]
+            or simplified
+        ):
             metadata.is_filter = False
             metadata.is_feature_info = False
         metadata.field_alias = metadata.field_name_
@@ -0,0 +1,515 @@
+"""Render vector tiles of a dataset version on the fly.
+
+Tiles are built from the `geom_wm` column of the database table, using
+PostGIS' ST_AsMVT. They are only available for versions with a dynamic
+vector tile cache asset and only within its zoom levels. Where the table
+has geometries simplified for the zoom level of a tile, these are used
+instead.
+
+Rendered tiles are cached in memory. With TILE_CACHE_WRITE_THROUGH,
+tiles of immutable versions are also written to the tile cache bucket,
+at the URI of the dynamic vector tile cache asset, so that other API
+instances and the tile cache CDN can pick them up.
+
+Static vector tile caches written as a single PMTiles archive are served
+from the same path as tile caches uploaded tile by tile. Tiles are read
+from the archive in the tile cache bucket with HTTP range requests.
+Archive headers and directories are cached in memory, so that most tiles
+take a single request.
+"""
+import gzip
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from fastapi.logger import logger
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from ...crud import assets, versions
+from ...crud.cache import (
+    feature_info_cache,
+    tile_cache,
+    tile_directory_cache,
+    tile_renders,
+)
+from ...crud.queries import read_only_transaction
+from ...errors import RecordNotFoundError
+from ...models.enum.assets import AssetStatus, AssetType
+from ...models.enum.creation_options import TileOutput
+from ...models.orm.versions import Version as ORMVersion
+from ...routes import dataset_dependency, version_dependency
+from ...settings.globals import (
+    TILE_CACHE_BUCKET,
+    TILE_CACHE_WRITE_THROUGH,
+    TILE_MAX_AGE,
+)
+from ...utils import pmtiles
+from ...utils.aws import get_s3_client
+from ...utils.path import pmtiles_key
+
+router = APIRouter()
+
+PBF = "application/x-protobuf"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Tile coordinate extent and buffer around tiles, in tile coordinates
+EXTENT = 4096
+BUFFER = 256
+
+# Columns which are never rendered as feature properties
+GEOMETRY_FIELDS = {"geom", "geom_wm", "gfw_geojson", "gfw_bbox"}
+
+
+class TileLayer(NamedTuple):
+    fields: List[str]
+    min_zoom: int
+    max_zoom: int
+    simplified_zoom_levels: Tuple[int, ...] = ()
+
+
+class TileArchive(NamedTuple):
+    key: str
+    min_zoom: int
+    max_zoom: int
+
+
+class _ArchiveChanged(Exception):
+    pass
+
+
+@router.get(
+    "/{dataset}/{version}/dynamic/{z}/{x}/{y}.pbf",
+    response_class=Response,
+    tags=["Tiles"],
+)
+async def get_dynamic_vector_tile(
+    *,
+    dataset: str = Depends(dataset_dependency),
+    version: str = Depends(version_dependency),
+    z: int = Path(..., title="Zoom level", ge=0, le=22),
+    x: int = Path(..., title="Tile column", ge=0),
+    y: int = Path(..., title="Tile row", ge=0),
+    request: Request,
+):
+    """Render a vector tile of the dataset version.
+
+    Tiles contain a single layer named after the dataset, with the
+    fields of the dynamic vector tile cache asset as feature properties.
+    Tiles are gzip encoded. Tiles of immutable versions can be cached
+    forever, others for a limited time. Empty tiles return status 204.
+    Concurrent requests for the same tile share a single render.
+    """
+    try:
+        row: ORMVersion = await versions.get_version(dataset, version)
+        layer: TileLayer = await get_tile_layer(dataset, version)
+    except RecordNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    if not layer.min_zoom <= z <= layer.max_zoom or x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Tile {z}/{x}/{y} is outside of the tile cache "
+            f"(zoom levels {layer.min_zoom} to {layer.max_zoom}).",
+        )
+
+    tile: bytes = await get_tile(dataset, version, layer, row.is_mutable, z, x, y)
+    return _tile_response(tile, row.is_mutable, request)
+
+
+@router.get(
+    "/{dataset}/{version}/default/{z}/{x}/{y}.pbf",
+    response_class=Response,
+    tags=["Tiles"],
+)
+async def get_static_vector_tile(
+    *,
+    dataset: str = Depends(dataset_dependency),
+    version: str = Depends(version_dependency),
+    z: int = Path(..., title="Zoom level", ge=0, le=22),
+    x: int = Path(..., title="Tile column", ge=0),
+    y: int = Path(..., title="Tile row", ge=0),
+    request: Request,
+):
+    """Read a vector tile from the PMTiles archive of the static vector
+    tile cache of the dataset version.
+
+    Only available for static vector tile caches created with output
+    `pmtiles`. Tiles are gzip encoded and cached like dynamic vector
+    tiles. Tiles without features return status 204.
+    """
+    try:
+        row: ORMVersion = await versions.get_version(dataset, version)
+        archive: TileArchive = await get_tile_archive(dataset, version)
+    except RecordNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    if not archive.min_zoom <= z <= archive.max_zoom or x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Tile {z}/{x}/{y} is outside of the tile cache "
+            f"(zoom levels {archive.min_zoom} to {archive.max_zoom}).",
+        )
+
+    try:
+        tile: bytes = await get_archive_tile(
+            dataset, version, archive, row.is_mutable, z, x, y
+        )
+    except RecordNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _tile_response(tile, row.is_mutable, request)
+
+
+async def get_tile_layer(dataset: str, version: str) -> TileLayer:
+    """Fields and zoom levels of the dynamic vector tile cache asset.
+
+    Layers are cached with the feature info columns of the version and
+    dropped from cache whenever an asset of the version changes.
+    """
+    key = (dataset, version, AssetType.dynamic_vector_tile_cache)
+    layer: Optional[TileLayer] = feature_info_cache.get(key)
+    if layer is None:
+        for asset in await assets.get_assets(dataset, version):
+            if (
+                asset.asset_type == AssetType.dynamic_vector_tile_cache
+                and asset.status == AssetStatus.saved
+            ):
+                layer = _tile_layer(asset.metadata)
+                break
+        else:
+            raise RecordNotFoundError(
+                f"Version {dataset}.{version} has no dynamic vector tile cache"
+            )
+        feature_info_cache.set(key, layer)
+
+    return layer
+
+
+def _tile_layer(metadata: Dict[str, Any]) -> TileLayer:
+    return TileLayer(
+        fields=[
+            field["field_name"]
+            for field in metadata.get("fields", list())
+            if field["field_name"] not in GEOMETRY_FIELDS
+            and (field.get("is_feature_info") or field.get("is_filter"))
+        ],
+        min_zoom=metadata.get("min_zoom", 0),
+        max_zoom=metadata.get("max_zoom", 22),
+        simplified_zoom_levels=versions.simplified_zoom_levels(
+            metadata.get("fields", list()), "geom_wm"
+        ),
+    )
+
+
+async def get_tile_archive(dataset: str, version: str) -> TileArchive:
+    """Key and zoom levels of the PMTiles archive of the static vector
+    tile cache asset, cached like tile layers."""
+    key = (dataset, version, AssetType.static_vector_tile_cache)
+    archive: Optional[TileArchive] = feature_info_cache.get(key)
+    if archive is None:
+        for asset in await assets.get_assets(dataset, version):
+            if (
+                asset.asset_type == AssetType.static_vector_tile_cache
+                and asset.status == AssetStatus.saved
+                and asset.creation_options.get("output") == TileOutput.pmtiles
+            ):
+                archive = TileArchive(
+                    key=pmtiles_key(dataset, version),
+                    min_zoom=asset.metadata.get("min_zoom", 0),
+                    max_zoom=asset.metadata.get("max_zoom", 22),
+                )
+                break
+        else:
+            raise RecordNotFoundError(
+                f"Version {dataset}.{version} has no static vector tile cache "
+                "archive"
+            )
+        feature_info_cache.set(key, archive)
+
+    return archive
+
+
+async def get_tile(
+    dataset: str,
+    version: str,
+    layer: TileLayer,
+    is_mutable: bool,
+    z: int,
+    x: int,
+    y: int,
+) -> bytes:
+    """Gzip encoded tile from memory, the tile cache bucket or rendered
+    from the database table, in that order."""
+    key = (dataset, version, z, x, y)
+    tile: Optional[bytes] = tile_cache.get(key)
+    if tile is None:
+        tile = await tile_renders.run(
+            key, lambda: _load_tile(dataset, version, layer, is_mutable, z, x, y)
+        )
+    return tile
+
+
+async def _load_tile(
+    dataset: str,
+    version: str,
+    layer: TileLayer,
+    is_mutable: bool,
+    z: int,
+    x: int,
+    y: int,
+) -> bytes:
+    # Tiles of mutable versions can't be invalidated in the bucket in time
+    write_through: bool = TILE_CACHE_WRITE_THROUGH and not is_mutable
+    s3_key = f"{dataset}/{version}/dynamic/{z}/{x}/{y}.pbf"
+
+    tile: Optional[bytes] = await _get_s3_tile(s3_key) if write_through else None
+    if tile is None:
+        tile = await render_tile(dataset, version, layer, z, x, y)
+        if write_through:
+            await _put_s3_tile(s3_key, tile)
+
+    tile_cache.set(
+        (dataset, version, z, x, y), tile, TILE_MAX_AGE if is_mutable else None
+    )
+    return tile
+
+
+async def _get_s3_tile(key: str) -> Optional[bytes]:
+    try:
+        response = await run_in_threadpool(
+            get_s3_client().get_object, Bucket=TILE_CACHE_BUCKET, Key=key
+        )
+        return await run_in_threadpool(response["Body"].read)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            logger.warning(f"Failed to read tile {key} from tile cache: {e}")
+        return None
+
+
+async def _put_s3_tile(key: str, tile: bytes) -> None:
+    # Empty tiles are stored as empty objects, without encoding
+    encoding: Dict[str, str] = {"ContentEncoding": "gzip"} if tile else dict()
+    try:
+        await run_in_threadpool(
+            get_s3_client().put_object,
+            Bucket=TILE_CACHE_BUCKET,
+            Key=key,
+            Body=tile,
+            ContentType=PBF,
+            CacheControl=IMMUTABLE,
+            **encoding,
+        )
+    except ClientError as e:
+        logger.warning(f"Failed to write tile {key} to tile cache: {e}")
+
+
+async def get_archive_tile(
+    dataset: str,
+    version: str,
+    archive: TileArchive,
+    is_mutable: bool,
+    z: int,
+    x: int,
+    y: int,
+) -> bytes:
+    """Gzip encoded tile from memory or read from the tile archive."""
+    key = (dataset, version, "default", z, x, y)
+    tile: Optional[bytes] = tile_cache.get(key)
+    if tile is None:
+        tile = await tile_renders.run(
+            key,
+            lambda: _load_archive_tile(dataset, version, archive, is_mutable, z, x, y),
+        )
+    return tile
+
+
+async def _load_archive_tile(
+    dataset: str,
+    version: str,
+    archive: TileArchive,
+    is_mutable: bool,
+    z: int,
+    x: int,
+    y: int,
+) -> bytes:
+    try:
+        tile = await _read_archive_tile(dataset, version, archive.key, z, x, y)
+    except _ArchiveChanged:
+        # Archive was replaced since its header was cached
+        tile_directory_cache.pop((dataset, version))
+        tile = await _read_archive_tile(dataset, version, archive.key, z, x, y)
+
+    tile_cache.set(
+        (dataset, version, "default", z, x, y),
+        tile,
+        TILE_MAX_AGE if is_mutable else None,
+    )
+    return tile
+
+
+async def _read_archive_tile(
+    dataset: str, version: str, s3_key: str, z: int, x: int, y: int
+) -> bytes:
+    """Walk down from the root directory to the entry of the tile.
+
+    All reads are conditional on the ETag of the archive, so that tiles
+    are never read from a replaced archive with outdated directories.
+    """
+    etag, header = await _archive_header(dataset, version, s3_key)
+    tile_id: int = pmtiles.tile_id(z, x, y)
+
+    offset, length = header.root_offset, header.root_length
+    for _ in range(pmtiles.MAX_DEPTH + 1):
+        directory = await _archive_directory(
+            dataset, version, s3_key, etag, header, offset, length
+        )
+        entry: Optional[pmtiles.Entry] = pmtiles.find_entry(directory, tile_id)
+        if entry is None:
+            return b""
+        if entry.run_length > 0:
+            data = await _read_range(
+                s3_key, etag, header.data_offset + entry.offset, entry.length
+            )
+            return pmtiles.gzip_tile(data, header.tile_compression)
+        offset, length = header.leaf_offset + entry.offset, entry.length
+
+    raise ValueError(f"Directories of tile archive {s3_key} are nested too deep")
+
+
+async def _archive_header(
+    dataset: str, version: str, s3_key: str
+) -> Tuple[str, pmtiles.Header]:
+    """ETag and header of archive.
+
+    Header and root directory are read with a single request and cached
+    together.
+    """
+    cached: Optional[Tuple[str, pmtiles.Header]] = tile_directory_cache.get(
+        (dataset, version)
+    )
+    if cached is not None:
+        return cached
+
+    async def load() -> Tuple[str, pmtiles.Header]:
+        try:
+            response = await run_in_threadpool(
+                get_s3_client().get_object,
+                Bucket=TILE_CACHE_BUCKET,
+                Key=s3_key,
+                Range=f"bytes=0-{pmtiles.ROOT_SIZE - 1}",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                raise RecordNotFoundError(f"Tile archive {s3_key} not found")
+            raise
+        data: bytes = await run_in_threadpool(response["Body"].read)
+
+        etag: str = response["ETag"]
+        header = pmtiles.parse_header(data)
+        root = data[header.root_offset : header.root_offset + header.root_length]
+        tile_directory_cache.set(
+            (dataset, version, etag, header.root_offset),
+            pmtiles.parse_directory(root, header.internal_compression),
+        )
+        tile_directory_cache.set((dataset, version), (etag, header))
+        return etag, header
+
+    return await tile_renders.run((dataset, version, s3_key), load)
+
+
+async def _archive_directory(
+    dataset: str,
+    version: str,
+    s3_key: str,
+    etag: str,
+    header: pmtiles.Header,
+    offset: int,
+    length: int,
+) -> pmtiles.Directory:
+    key = (dataset, version, etag, offset)
+    directory: Optional[pmtiles.Directory] = tile_directory_cache.get(key)
+    if directory is None:
+        data = await _read_range(s3_key, etag, offset, length)
+        directory = pmtiles.parse_directory(data, header.internal_compression)
+        tile_directory_cache.set(key, directory)
+    return directory
+
+
+async def _read_range(s3_key: str, etag: str, offset: int, length: int) -> bytes:
+    try:
+        response = await run_in_threadpool(
+            get_s3_client().get_object,
+            Bucket=TILE_CACHE_BUCKET,
+            Key=s3_key,
+            Range=f"bytes={offset}-{offset + length - 1}",
+            IfMatch=etag,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("PreconditionFailed", "NoSuchKey"):
+            raise _ArchiveChanged()
+        raise
+    return await run_in_threadpool(response["Body"].read)
+
+
+async def render_tile(
+    dataset: str, version: str, layer: TileLayer, z: int, x: int, y: int
+) -> bytes:
+    """Render gzip encoded tile.
+
+    The query text only depends on the version, its fields and the
+    geometry column for the zoom level, so that asyncpg reuses the
+    prepared statement per connection.
+    """
+    column = versions.simplified_column("geom_wm", layer.simplified_zoom_levels, z)
+    async with read_only_transaction() as raw_conn:
+        tile: bytes = await raw_conn.fetchval(
+            _tile_query(dataset, version, layer, column), z, x, y
+        )
+    return gzip.compress(tile) if tile else b""
+
+
+def _tile_query(dataset: str, version: str, layer: TileLayer, column: str) -> str:
+    """Select features within tile bounds, including its buffer, and
+    encode them as MVT."""
+    fields = "".join(f", {_quote(field_name)}" for field_name in layer.fields)
+    return f"""
+        WITH bounds AS (
+            SELECT envelope, ST_Expand(
+                envelope, (ST_XMax(envelope) - ST_XMin(envelope)) * {BUFFER / EXTENT}
+            ) AS buffered
+            FROM ST_TileEnvelope($1, $2, $3) AS envelope
+        )
+        SELECT ST_AsMVT(tile, {_literal(dataset)}, {EXTENT}, 'geom')
+        FROM (
+            SELECT ST_AsMVTGeom({_quote(column)}, envelope, {EXTENT}, {BUFFER}, true)
+                AS geom {fields}
+            FROM {_quote(dataset)}.{_quote(version)}, bounds
+            WHERE {_quote(column)} && buffered
+        ) AS tile
+        WHERE geom IS NOT NULL
+    """
+
+
+def _quote(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _literal(value: str) -> str:
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def _tile_response(tile: bytes, is_mutable: bool, request: Request) -> Response:
+    headers = {
+        "Cache-Control": f"public, max-age={TILE_MAX_AGE}" if is_mutable else IMMUTABLE,
+        "Vary": "Accept-Encoding",
+    }
+    if not tile:
+        return Response(status_code=204, headers=headers)
+
+    # Tiles are stored gzip encoded, which virtually all clients accept
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        tile = gzip.decompress(tile)
+
+    return Response(tile, media_type=PBF, headers=headers)
@@ -111,3 +111,76 @@ SERVICE_ACCOUNT_TOKEN = config(
 )
 
 S3_ENTRYPOINT_URL = config("S3_ENTRYPOINT_URL", cast=str, default=None)
+
+# Number of dataset and version rows kept in memory and seconds after which
+# cached rows are validated against the database
+METADATA_CACHE_SIZE = config("METADATA_CACHE_SIZE", cast=int, default=1024)
+METADATA_CACHE_TTL = config("METADATA_CACHE_TTL", cast=float, default=60)
+
+# Resolve `latest` version identifiers internally instead of redirecting
+REWRITE_LATEST_VERSION = config("REWRITE_LATEST_VERSION", cast=bool, default=False)
+
+HTTP_TIMEOUT = config("HTTP_TIMEOUT", cast=float, default=10)
+
+# GFW API used to verify user tokens
+AUTH_URL = config(
+    "AUTH_URL",
+    cast=str,
+    default=f"https://{'staging' if ENV == 'dev' else ENV}-api.globalforestwatch.org",
+)
+# Number of verified tokens kept in memory and seconds until they are verified again
+AUTH_CACHE_SIZE = config("AUTH_CACHE_SIZE", cast=int, default=1024)
+AUTH_CACHE_TTL = config("AUTH_CACHE_TTL", cast=float, default=300)
+
+# Seconds after which user SQL queries are cancelled and number of rows
+# fetched from the database at once while streaming query results
+QUERY_TIMEOUT = config("QUERY_TIMEOUT", cast=float, default=30)
+QUERY_PREFETCH = config("QUERY_PREFETCH", cast=int, default=1000)
+
+# Memory budget in bytes for cached SQL query results and optional directory
+# with its own budget for results evicted from memory. Results of mutable
+# versions expire after QUERY_CACHE_TTL seconds, results of immutable versions
+# are kept until evicted.
+QUERY_CACHE_SIZE = config("QUERY_CACHE_SIZE", cast=int, default=128 * 1024 ** 2)
+QUERY_CACHE_DIR = config("QUERY_CACHE_DIR", cast=str, default=None)
+QUERY_CACHE_DIR_SIZE = config("QUERY_CACHE_DIR_SIZE", cast=int, default=1024 ** 3)
+QUERY_CACHE_TTL = config("QUERY_CACHE_TTL", cast=float, default=300)
+
+# Limits for the estimated total cost of SQL queries and the number of rows any
+# step of the query plan may process. Queries exceeding them are rejected, unless
+# QUERY_EXPENSIVE_CONCURRENCY is set. They then wait until fewer than this
+# number of expensive queries are running.
+QUERY_MAX_COST = config("QUERY_MAX_COST", cast=float, default=10_000_000)
+QUERY_MAX_ROWS = config("QUERY_MAX_ROWS", cast=int, default=100_000_000)
+QUERY_EXPENSIVE_CONCURRENCY = config("QUERY_EXPENSIVE_CONCURRENCY", cast=int, default=0)
+
+# Seconds after which SQL query jobs are cancelled and seconds for which
+# download URLs of their results are valid
+QUERY_JOB_TIMEOUT = config("QUERY_JOB_TIMEOUT", cast=float, default=3600)
+QUERY_JOB_URL_TTL = config("QUERY_JOB_URL_TTL", cast=int, default=3600)
+
+# Number of SQL query jobs running at the same time per API instance, further
+# jobs wait until a slot is free, and limit for the estimated total cost of each
+# job, checked when it is submitted
+QUERY_JOB_CONCURRENCY = config("QUERY_JOB_CONCURRENCY", cast=int, default=2)
+QUERY_JOB_MAX_COST = config("QUERY_JOB_MAX_COST", cast=float, default=QUERY_MAX_COST)
+
+# Seconds for which clients may cache dynamic vector tiles of mutable versions.
+# Tiles of immutable versions never change.
+TILE_MAX_AGE = config("TILE_MAX_AGE", cast=int, default=300)
+
+# Memory budget in bytes for rendered dynamic vector tiles. Tiles of mutable
+# versions expire after TILE_MAX_AGE seconds, tiles of immutable versions are
+# kept until evicted. With TILE_CACHE_WRITE_THROUGH, tiles of immutable versions
+# are also written to TILE_CACHE_BUCKET and looked up there before rendering.
+TILE_CACHE_SIZE = config("TILE_CACHE_SIZE", cast=int, default=64 * 1024 ** 2)
+TILE_CACHE_WRITE_THROUGH = config("TILE_CACHE_WRITE_THROUGH", cast=bool, default=False)
+
+# Number of directory entries of PMTiles archives kept in memory, so that tiles
+# of static vector tile caches are read with a single range request
+TILE_DIRECTORY_CACHE_SIZE = config(
+    "TILE_DIRECTORY_CACHE_SIZE", cast=int, default=256 * 1024
+)
+
+# Memory budget in bytes for serialized geostore responses
+GEOSTORE_CACHE_SIZE = config("GEOSTORE_CACHE_SIZE", cast=int, default=64 * 1024 ** 2)
@@ -1,14 +1,19 @@
 from ..application import ContextEngine, db
+from ..crud.cache import invalidate_tiles
+from ..crud.versions import SUBDIVIDED_SUFFIX
 from ..settings.globals import (
     DATA_LAKE_BUCKET,
     TILE_CACHE_BUCKET,
     TILE_CACHE_CLOUDFRONT_ID,
+    TILE_CACHE_WRITE_THROUGH,
 )
+from ..utils.path import pmtiles_key
 from .aws_tasks import delete_s3_objects, expire_s3_objects, flush_cloudfront_cache
 
 
 async def delete_all_assets(dataset: str, version: str) -> None:
     await delete_database_table(dataset, version)
+    invalidate_tiles(dataset, version)
     delete_s3_objects(DATA_LAKE_BUCKET, f"{dataset}/{version}/")
     expire_s3_objects(TILE_CACHE_BUCKET, f"{dataset}/{version}/")
     flush_cloudfront_cache(TILE_CACHE_CLOUDFRONT_ID, f"{dataset}/{version}/*")
@@ -17,6 +22,10 @@ async def delete_all_assets(dataset: str, version: str) -> None:
 async def delete_dynamic_vector_tile_cache_assets(
     dataset: str, version: str, implementation: str = "dynamic"
 ) -> None:
+    invalidate_tiles(dataset, version)
+    # Written through by the tile API, expiring them could take up to a day
+    if TILE_CACHE_WRITE_THROUGH:
+        delete_s3_objects(TILE_CACHE_BUCKET, f"{dataset}/{version}/{implementation}/")
     flush_cloudfront_cache(
         TILE_CACHE_CLOUDFRONT_ID, f"{dataset}/{version}/{implementation}/*"
     )
@@ -25,12 +34,18 @@ async def delete_dynamic_vector_tile_cache_assets(
 async def delete_static_vector_tile_cache_assets(
     dataset: str, version: str, implementation: str = "default"
 ) -> None:
+    invalidate_tiles(dataset, version)
     expire_s3_objects(
         TILE_CACHE_BUCKET, f"{dataset}/{version}/{implementation}/", "format", "pbf"
     )
+    # A single object, which doesn't need to wait for the lifecycle rule
+    delete_s3_objects(TILE_CACHE_BUCKET, pmtiles_key(dataset, version, implementation))
     flush_cloudfront_cache(
         TILE_CACHE_CLOUDFRONT_ID, f"{dataset}/{version}/{implementation}/*.pbf"
     )
+    flush_cloudfront_cache(
+        TILE_CACHE_CLOUDFRONT_ID, pmtiles_key(dataset, version, implementation)
+    )
 
 
 async def delete_static_raster_tile_cache_assets(
@@ -54,4 +69,7 @@ async def delete_raster_tileset_assets(
 
 async def delete_database_table(dataset, version):
     async with ContextEngine("WRITE"):
+        await db.status(
+            f"""DROP TABLE IF EXISTS "{dataset}"."{version}{SUBDIVIDED_SUFFIX}";"""
+        )
         await db.status(f"""DROP TABLE IF EXISTS "{dataset}"."{version}" CASCADE;""")
@@ -0,0 +1,155 @@
+"""Run SQL queries in the background and write their results to the data
+lake.
+
+The status of each job is stored as JSON next to its result, so that
+every API instance can report on any job.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+from typing import Any, AsyncIterator, Optional
+from uuid import UUID
+
+import aiofiles
+from asyncpg.exceptions import PostgresError, QueryCanceledError
+from botocore.exceptions import ClientError
+from fastapi.logger import logger
+from gino import GinoEngine
+from starlette.concurrency import run_in_threadpool
+
+from ..application import ContextEngine
+from ..crud.queries import copy_query, execute_query
+from ..errors import RecordNotFoundError
+from ..models.pydantic.query_jobs import QueryJob, QueryJobFormat, QueryJobStatus
+from ..settings.globals import (
+    DATA_LAKE_BUCKET,
+    QUERY_JOB_CONCURRENCY,
+    QUERY_JOB_TIMEOUT,
+    QUERY_JOB_URL_TTL,
+    QUERY_PREFETCH,
+)
+from ..utils import arrow
+from ..utils.aws import get_s3_client
+
+JOB_PREFIX = "sql_jobs"
+
+_query_jobs: Optional[asyncio.Semaphore] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def run_query_job(job: QueryJob, sql: str) -> None:
+    """Run bound query on the read pool and upload its result.
+
+    Jobs are submitted with POST requests, which are bound to the write
+    pool, hence the read pool is selected explicitly. Jobs stay pending
+    until one of QUERY_JOB_CONCURRENCY slots is free.
+    """
+    async with _query_job_slots():
+        await _run_query_job(job, sql)
+
+
+async def _run_query_job(job: QueryJob, sql: str) -> None:
+    await put_query_job(job, QueryJobStatus.running)
+    try:
+        engine: GinoEngine = await ContextEngine.get_engine("READ")
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"result.{job.format.value}")
+            async with aiofiles.open(path, "wb") as f:
+                async for chunk in _result_chunks(job, sql, engine):
+                    await f.write(chunk)
+            await run_in_threadpool(
+                get_s3_client().upload_file, path, DATA_LAKE_BUCKET, _result_key(job)
+            )
+    except QueryCanceledError:
+        await put_query_job(
+            job,
+            QueryJobStatus.failed,
+            f"Query exceeded the time limit of {QUERY_JOB_TIMEOUT} seconds.",
+        )
+    except PostgresError as e:
+        await put_query_job(job, QueryJobStatus.failed, str(e))
+    except Exception:
+        logger.exception(f"Query job {job.job_id} failed")
+        await put_query_job(job, QueryJobStatus.failed, "Query job failed.")
+    else:
+        await put_query_job(job, QueryJobStatus.saved)
+
+
+async def put_query_job(
+    job: QueryJob, status: QueryJobStatus, message: Optional[str] = None
+) -> None:
+    job.status = status
+    job.message = message
+    job.updated_on = datetime.now(timezone.utc)
+
+    await run_in_threadpool(
+        get_s3_client().put_object,
+        Bucket=DATA_LAKE_BUCKET,
+        Key=_status_key(job.job_id),
+        Body=job.json(exclude={"download_url"}).encode(),
+        ContentType="application/json",
+    )
+
+
+async def get_query_job(job_id: UUID) -> QueryJob:
+    """Current status of job, with download URL once the result is
+    saved."""
+    try:
+        response = await run_in_threadpool(
+            get_s3_client().get_object,
+            Bucket=DATA_LAKE_BUCKET,
+            Key=_status_key(job_id),
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            raise RecordNotFoundError(f"Query job {job_id} not found")
+        raise
+
+    job = QueryJob.parse_raw(response["Body"].read())
+    if job.status == QueryJobStatus.saved:
+        job.download_url = get_s3_client().generate_presigned_url(
+            "get_object",
+            Params={"Bucket": DATA_LAKE_BUCKET, "Key": _result_key(job)},
+            ExpiresIn=QUERY_JOB_URL_TTL,
+        )
+    return job
+
+
+async def _result_chunks(
+    job: QueryJob, sql: str, engine: GinoEngine
+) -> AsyncIterator[bytes]:
+    if job.format == QueryJobFormat.csv:
+        async for chunk in copy_query(sql, engine, QUERY_JOB_TIMEOUT):
+            yield chunk
+    else:
+        rows: AsyncIterator[Any] = execute_query(sql, engine, QUERY_JOB_TIMEOUT)
+        attributes = await rows.__anext__()
+        async for chunk in arrow.stream_records(
+            attributes, rows, arrow.PARQUET, QUERY_PREFETCH
+        ):
+            yield chunk
+
+
+def _query_job_slots() -> asyncio.Semaphore:
+    """Semaphore limiting the number of concurrent query jobs.
+
+    Semaphores are bound to an event loop, hence a new one is created
+    if the current loop changes.
+    """
+    global _query_jobs
+    global _loop
+
+    loop = asyncio.get_event_loop()
+    if _query_jobs is None or _loop is not loop:
+        _query_jobs = asyncio.Semaphore(QUERY_JOB_CONCURRENCY)
+        _loop = loop
+    return _query_jobs
+
+
+def _status_key(job_id: UUID) -> str:
+    return f"{JOB_PREFIX}/{job_id}/status.json"
+
+
+def _result_key(job: QueryJob) -> str:
+    return f"{JOB_PREFIX}/{job.job_id}/result.{job.format.value}"
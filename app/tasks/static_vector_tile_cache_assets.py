@@ -1,20 +1,34 @@
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 from uuid import UUID
 
-from ..crud import assets
+from ..application import ContextEngine, db
+from ..crud import assets, versions
+from ..models.enum.change_log import ChangeLogStatus
+from ..models.enum.creation_options import TileBuilder, TileOutput
 from ..models.orm.assets import Asset as ORMAsset
 from ..models.pydantic.assets import AssetType
 from ..models.pydantic.change_log import ChangeLog
 from ..models.pydantic.creation_options import (
+    POSTGIS_TILE_SPLIT_ZOOM,
     StaticVectorTileCacheCreationOptions,
     asset_creation_option_factory,
 )
-from ..models.pydantic.jobs import GdalPythonExportJob, TileCacheJob
+from ..models.pydantic.jobs import (
+    GdalPythonExportJob,
+    Job,
+    PostgresqlClientJob,
+    TileCacheJob,
+)
 from ..models.pydantic.metadata import asset_metadata_factory
-from ..settings.globals import DATA_LAKE_BUCKET, TILE_CACHE_JOB_QUEUE
+from ..settings.globals import DATA_LAKE_BUCKET, TILE_CACHE_BUCKET, TILE_CACHE_JOB_QUEUE
+from ..utils.path import pmtiles_key
 from . import callback_constructor, reader_secrets
 from .batch import execute
 
+# Maximum number of jobs the quadkeys of the postgis builder are distributed to
+MAX_TILE_JOBS = 64
+
 
 async def static_vector_tile_cache_asset(
     dataset: str, version: str, asset_id: UUID, input_data: Dict[str, Any],
@@ -28,6 +42,7 @@ async def static_vector_tile_cache_asset(
     creation_options = asset_creation_option_factory(
         None, AssetType.static_vector_tile_cache, input_data["creation_options"]
     )
+    assert isinstance(creation_options, StaticVectorTileCacheCreationOptions)
 
     await assets.update_asset(
         asset_id,
@@ -37,14 +52,19 @@ async def static_vector_tile_cache_asset(
         },
     )
 
-    ############################
-    # Create NDJSON asset as side effect
-    ############################
-
     field_attributes: List[Dict[str, Any]] = await _get_field_attributes(
         dataset, version, creation_options
     )
 
+    if creation_options.tile_builder == TileBuilder.postgis:
+        return await _postgis_tile_cache(
+            dataset, version, asset_id, creation_options, field_attributes
+        )
+
+    ############################
+    # Create NDJSON asset as side effect
+    ############################
+
     _metadata = input_data.get("metadata", {})
     _metadata["fields"] = field_attributes
 
@@ -104,6 +124,13 @@ async def static_vector_tile_cache_asset(
         "-t",
         creation_options.tile_strategy,
     ]
+    if creation_options.output == TileOutput.pmtiles:
+        command += [
+            "-F",
+            "pmtiles",
+            "-T",
+            f"s3://{TILE_CACHE_BUCKET}/{pmtiles_key(dataset, version)}",
+        ]
 
     create_vector_tile_cache = TileCacheJob(
         job_name="create_vector_tile_cache",
@@ -121,31 +148,138 @@ async def static_vector_tile_cache_asset(
     return log
 
 
-async def _get_field_attributes(
-    dataset: str, version: str, creation_options: StaticVectorTileCacheCreationOptions
-) -> List[Dict[str, Any]]:
-    """Get field attribute list from creation options.
+async def _postgis_tile_cache(
+    dataset: str,
+    version: str,
+    asset_id: UUID,
+    creation_options: StaticVectorTileCacheCreationOptions,
+    field_attributes: List[Dict[str, Any]],
+) -> ChangeLog:
+    """Render tiles directly from the database table, without NDJSON
+    intermediate.
 
-    If no attribute list provided, use all fields from DB table, marked
-    as `is_feature_info`. Otherwise compare to provide list with
-    available fields and use intersection.
+    The tile pyramid is split at POSTGIS_TILE_SPLIT_ZOOM, which is the
+    lowest minimum zoom level the builder accepts. Quadkeys at this
+    level which contain features are split into ranges, each rendered
+    by its own job.
+    """
+    quadkeys: List[str] = await _occupied_quadkeys(
+        dataset, version, POSTGIS_TILE_SPLIT_ZOOM
+    )
+
+    simplified_zoom_levels = versions.simplified_zoom_levels(
+        await _get_fields(dataset, version), "geom_wm"
+    )
+    command: List[str] = [
+        "create_postgis_tile_cache.sh",
+        "-d",
+        dataset,
+        "-v",
+        version,
+        "-C",
+        ",".join([field["field_name"] for field in field_attributes]),
+        "-Z",
+        str(creation_options.min_zoom),
+        "-z",
+        str(creation_options.max_zoom),
+        "-T",
+        f"s3://{TILE_CACHE_BUCKET}/{dataset}/{version}/default",
+        "--zoom_levels",
+        ",".join(str(z) for z in simplified_zoom_levels),
+    ]
+
+    jobs: List[Job] = [
+        PostgresqlClientJob(
+            job_name=f"create_postgis_tile_cache_{i}",
+            command=command + ["--quadkeys", ",".join(quadkey_range)],
+            environment=reader_secrets,
+            callback=callback_constructor(asset_id),
+        )
+        for i, quadkey_range in enumerate(_quadkey_ranges(quadkeys, MAX_TILE_JOBS))
+    ]
+
+    if not jobs:
+        return ChangeLog(
+            date_time=datetime.now(),
+            status=ChangeLogStatus.success,
+            message="Created Static Vector Tile Cache",
+            detail="No tiles within zoom levels contain features.",
+        )
+
+    return await execute(jobs)
+
+
+def _quadkey_ranges(quadkeys: List[str], max_ranges: int) -> List[List[str]]:
+    """Split sorted quadkeys into up to max_ranges contiguous ranges of
+    about the same size, so that neighbouring tiles end up in the same
+    range."""
+    count = min(max_ranges, len(quadkeys))
+    return [
+        quadkeys[i * len(quadkeys) // count : (i + 1) * len(quadkeys) // count]
+        for i in range(count)
+    ]
+
+
+async def _occupied_quadkeys(dataset: str, version: str, zoom: int) -> List[str]:
+    """Sorted quadkeys of tiles at zoom level which contain features.
+
+    Each tile is probed with the spatial index on geom_wm.
     """
+    sql = db.text(
+        f"""SELECT x, y
+            FROM generate_series(0, (2 ^ :zoom)::integer - 1) AS x,
+                generate_series(0, (2 ^ :zoom)::integer - 1) AS y
+            WHERE EXISTS (
+                SELECT 1 FROM "{dataset}"."{version}"
+                WHERE geom_wm && ST_TileEnvelope(:zoom, x, y)
+            )"""
+    ).bindparams(zoom=zoom)
+
+    async with ContextEngine("READ"):
+        rows = await db.all(sql)
+
+    return sorted(_quadkey(zoom, row.x, row.y) for row in rows)
+
+
+def _quadkey(zoom: int, x: int, y: int) -> str:
+    """Quadkey of tile, in which each digit selects a quarter of the
+    parent tile."""
+    return "".join(
+        str(((x >> i) & 1) + 2 * ((y >> i) & 1)) for i in range(zoom - 1, -1, -1)
+    )
+
 
+async def _get_fields(dataset: str, version: str) -> List[Dict[str, Any]]:
+    """Field metadata of default asset."""
     orm_assets: List[ORMAsset] = await assets.get_assets(dataset, version)
 
-    fields: Optional[List[Dict[str, str]]] = None
+    fields: Optional[List[Dict[str, Any]]] = None
     for asset in orm_assets:
         if asset.is_default:
             fields = asset.metadata["fields"]
             break
 
-    if fields:
-        field_attributes: List[Dict[str, Any]] = [
-            field for field in fields if field["is_feature_info"]
-        ]
-    else:
+    if not fields:
         raise RuntimeError("No default asset found.")
 
+    return fields
+
+
+async def _get_field_attributes(
+    dataset: str, version: str, creation_options: StaticVectorTileCacheCreationOptions
+) -> List[Dict[str, Any]]:
+    """Get field attribute list from creation options.
+
+    If no attribute list provided, use all fields from DB table, marked
+    as `is_feature_info`. Otherwise compare to provide list with
+    available fields and use intersection.
+    """
+
+    fields: List[Dict[str, Any]] = await _get_fields(dataset, version)
+    field_attributes: List[Dict[str, Any]] = [
+        field for field in fields if field["is_feature_info"]
+    ]
+
     if creation_options.field_attributes:
         field_attributes = [
             field
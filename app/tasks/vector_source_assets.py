@@ -112,6 +112,44 @@ async def vector_source_asset(
             )
         )
 
+    if creation_options.subdivide_max_vertices:
+        index_jobs.append(
+            PostgresqlClientJob(
+                job_name="subdivide_geometries",
+                command=[
+                    "subdivide_geometries.sh",
+                    "-d",
+                    dataset,
+                    "-v",
+                    version,
+                    "--max_vertices",
+                    str(creation_options.subdivide_max_vertices),
+                ],
+                parents=[gfw_attribute_job.job_name],
+                environment=job_env,
+                callback=callback,
+            )
+        )
+
+    if creation_options.simplify_zoom_levels:
+        index_jobs.append(
+            PostgresqlClientJob(
+                job_name="simplify_geometries",
+                command=[
+                    "simplify_geometries.sh",
+                    "-d",
+                    dataset,
+                    "-v",
+                    version,
+                    "--zoom_levels",
+                    ",".join(str(z) for z in creation_options.simplify_zoom_levels),
+                ],
+                parents=[gfw_attribute_job.job_name],
+                environment=job_env,
+                callback=callback,
+            )
+        )
+
     inherit_geostore_job = PostgresqlClientJob(
         job_name="inherit_from_geostore",
         command=["inherit_geostore.sh", "-d", dataset, "-v", version],
@@ -0,0 +1,176 @@
+"""Serialize query results as Apache Arrow record batches.
+
+Record batches are built column by column from asyncpg records, using
+the column types PostgreSQL reports for the prepared statement, so that
+rows never pass through JSON. Geometries are encoded as WKB. Batches
+are written either as an Arrow IPC stream or as a Parquet file with one
+row group per batch.
+"""
+
+import io
+import struct
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, List, NamedTuple, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+MEDIA_TYPES = (ARROW_STREAM, PARQUET)
+
+# EWKB flag which indicates that an SRID follows the geometry type
+EWKB_SRID_FLAG = 0x20000000
+
+GEOMETRY_TYPES = {"geometry", "geography"}
+
+
+class Column(NamedTuple):
+    name: str
+    type: Any  # pyarrow.DataType
+    convert: Optional[Callable[[Any], Any]] = None
+
+
+def accepted_media_type(accept: str) -> Optional[str]:
+    """Arrow media type listed in Accept header, if any."""
+    for media_type in MEDIA_TYPES:
+        if media_type in accept:
+            return media_type
+    return None
+
+
+def wkb(ewkb_hex: str) -> bytes:
+    """Convert hex encoded EWKB, as PostGIS returns geometries in text
+    format, to WKB.
+
+    Only the SRID is dropped. Z and M flags keep their EWKB encoding,
+    which GEOS based readers understand as well.
+    """
+    ewkb = bytes.fromhex(ewkb_hex)
+    byte_order = "<" if ewkb[0] == 1 else ">"
+    (geometry_type,) = struct.unpack(f"{byte_order}I", ewkb[1:5])
+    if not geometry_type & EWKB_SRID_FLAG:
+        return ewkb
+    return (
+        ewkb[:1]
+        + struct.pack(f"{byte_order}I", geometry_type & ~EWKB_SRID_FLAG)
+        + ewkb[9:]
+    )
+
+
+def columns(attributes: Sequence[Any]) -> List[Column]:
+    """Arrow columns for attributes of a prepared asyncpg statement.
+
+    Types without an Arrow equivalent are returned as strings.
+    """
+    types = {
+        "bool": (pa.bool_(), None),
+        "int2": (pa.int16(), None),
+        "int4": (pa.int32(), None),
+        "int8": (pa.int64(), None),
+        "oid": (pa.int64(), None),
+        "float4": (pa.float32(), None),
+        "float8": (pa.float64(), None),
+        "numeric": (pa.float64(), float),
+        "date": (pa.date32(), None),
+        "timestamp": (pa.timestamp("us"), None),
+        "timestamptz": (pa.timestamp("us", tz="UTC"), None),
+        "bytea": (pa.binary(), None),
+    }
+
+    result: List[Column] = list()
+    for attribute in attributes:
+        name: str = attribute.type.name
+        if name in GEOMETRY_TYPES:
+            result.append(Column(attribute.name, pa.binary(), wkb))
+        elif name in types:
+            result.append(Column(attribute.name, *types[name]))
+        else:
+            result.append(Column(attribute.name, pa.string(), _text))
+    return result
+
+
+def _text(value: Any) -> str:
+    return str(value) if not isinstance(value, Decimal) else format(value, "f")
+
+
+def record_batch(cols: List[Column], records: List[Any]) -> "pa.RecordBatch":
+    """Build record batch from the leading columns of asyncpg records."""
+    arrays = list()
+    for i, column in enumerate(cols):
+        values = [record[i] for record in records]
+        if column.convert is not None:
+            values = [None if v is None else column.convert(v) for v in values]
+        arrays.append(pa.array(values, type=column.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=_schema(cols))
+
+
+async def stream_records(
+    attributes: Sequence[Any],
+    records: AsyncIterator[Any],
+    media_type: str,
+    batch_size: int,
+) -> AsyncIterator[bytes]:
+    """Write records as Arrow IPC stream or Parquet file, passing on
+    bytes as soon as a batch is written."""
+    cols = columns(attributes)
+    sink = _Sink()
+    output = pa.PythonFile(sink, mode="w")
+    if media_type == PARQUET:
+        writer = pq.ParquetWriter(output, _schema(cols))
+    else:
+        writer = pa.ipc.new_stream(output, _schema(cols))
+
+    batch: List[Any] = list()
+    async for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            _write(writer, record_batch(cols, batch))
+            batch = list()
+            yield sink.pop()
+
+    if batch:
+        _write(writer, record_batch(cols, batch))
+    writer.close()
+    yield sink.pop()
+
+
+def _write(writer, batch: "pa.RecordBatch") -> None:
+    if isinstance(writer, pq.ParquetWriter):
+        writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer.write_batch(batch)
+
+
+def _schema(cols: List[Column]) -> "pa.Schema":
+    return pa.schema([pa.field(column.name, column.type) for column in cols])
+
+
+class _Sink(io.RawIOBase):
+    """Write only file which hands out what was written so far."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = list()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        chunk = bytes(b)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        # Writers close their output when done, buffered bytes must remain
+        pass
+
+    def pop(self) -> bytes:
+        content = b"".join(self._chunks)
+        self._chunks = list()
+        return content
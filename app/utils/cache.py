@@ -0,0 +1,268 @@
+import asyncio
+import os
+from collections import OrderedDict
+from hashlib import sha256
+from tempfile import mkdtemp
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import aiofiles
+
+
+class LRUCache(object):
+    """Bounded in-process cache with least recently used eviction.
+
+    Entries expire after `ttl` seconds, if set. Size of entries is
+    measured using `getsizeof`, which defaults to one unit per entry.
+    Keeps track of hits and misses so that the cache can be sized
+    correctly.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        getsizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.getsizeof: Callable[[Any], int] = getsizeof or (lambda value: 1)
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data and not self._expired(self._data[key][2])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get value for key and mark it as most recently used."""
+        try:
+            value, _, expires = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if self._expired(expires):
+            self.pop(key)
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self, key: Hashable, value: Any, ttl: Optional[float] = None
+    ) -> List[Tuple[Hashable, Any]]:
+        """Add value to cache and evict least recently used entries until
+        cache fits into its size limit.
+
+        Values larger than the cache size are not cached. Returns
+        evicted entries, including the new one if it did not fit.
+        """
+        size = self.getsizeof(value)
+        self.pop(key)
+        if size > self.maxsize:
+            return [(key, value)]
+
+        if ttl is None:
+            ttl = self.ttl
+        expires = monotonic() + ttl if ttl is not None else float("inf")
+
+        self._data[key] = (value, size, expires)
+        self.currsize += size
+
+        evicted: List[Tuple[Hashable, Any]] = list()
+        while self.currsize > self.maxsize:
+            evicted_key, (evicted_value, evicted_size, _) = self._data.popitem(
+                last=False
+            )
+            self.currsize -= evicted_size
+            evicted.append((evicted_key, evicted_value))
+
+        return evicted
+
+    def touch(self, key: Hashable, ttl: Optional[float] = None) -> None:
+        """Reset time to live of an existing entry."""
+        if key in self._data:
+            value, _, _ = self._data[key]
+            self.set(key, value, ttl)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove entry from cache."""
+        try:
+            value, size, _ = self._data.pop(key)
+        except KeyError:
+            return default
+        self.currsize -= size
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Get value for key, ignoring its expiry date and without updating
+        usage statistics."""
+        try:
+            return self._data[key][0]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.currsize = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Usage statistics of cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else None,
+            "entries": len(self._data),
+            "size": self.currsize,
+            "maxsize": self.maxsize,
+        }
+
+    @staticmethod
+    def _expired(expires: float) -> bool:
+        return monotonic() >= expires
+
+
+class ResultCache(object):
+    """Cache for serialized results with a memory budget in bytes.
+
+    Least recently used entries are spilled to files in a private
+    directory below `spill_dir`, if set, which has its own budget.
+    Entries spilled to disk move back into memory when they are read.
+    Entries without TTL never expire.
+    """
+
+    def __init__(
+        self, maxsize: int, spill_dir: Optional[str] = None, spill_maxsize: int = 0
+    ):
+        self.spill_dir = spill_dir
+        self.memory = LRUCache(maxsize, getsizeof=lambda entry: len(entry[0]))
+        self.disk = LRUCache(
+            spill_maxsize if spill_dir else 0, getsizeof=lambda entry: entry[1]
+        )
+        self._spill_path: Optional[str] = None
+
+    @property
+    def max_entry_size(self) -> int:
+        """Size of the largest result which can be cached."""
+        return max(self.memory.maxsize, self.disk.maxsize)
+
+    async def get(self, key: Hashable) -> Optional[bytes]:
+        entry: Optional[Tuple[bytes, float]] = self.memory.get(key)
+        if entry is not None:
+            content, expires = entry
+            if not LRUCache._expired(expires):
+                return content
+            self.memory.pop(key)
+            return None
+
+        spilled: Optional[Tuple[str, int, float]] = self.disk.get(key)
+        if spilled is None:
+            return None
+
+        path, _, expires = self.disk.pop(key)
+        try:
+            if LRUCache._expired(expires):
+                return None
+            async with aiofiles.open(path, "rb") as f:
+                content = await f.read()
+        finally:
+            os.remove(path)
+
+        await self._set_entry(key, (content, expires))
+        return content
+
+    async def set(self, key: Hashable, content: bytes, ttl: Optional[float] = None):
+        expires = monotonic() + ttl if ttl is not None else float("inf")
+        self._remove_spilled(key)
+        await self._set_entry(key, (content, expires))
+
+    def invalidate(self, *key: Any) -> None:
+        """Remove entry or all entries which start with a partial key."""
+        for cached_key in self.memory.keys():
+            if cached_key[: len(key)] == key:
+                self.memory.pop(cached_key)
+        for cached_key in self.disk.keys():
+            if cached_key[: len(key)] == key:
+                self._remove_spilled(cached_key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        for key in self.disk.keys():
+            self._remove_spilled(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
+
+    async def _set_entry(self, key: Hashable, entry: Tuple[bytes, float]) -> None:
+        for evicted_key, (content, expires) in self.memory.set(key, entry):
+            await self._spill(evicted_key, content, expires)
+
+    async def _spill(self, key: Hashable, content: bytes, expires: float) -> None:
+        if not self.spill_dir or len(content) > self.disk.maxsize:
+            return
+
+        if self._spill_path is None:
+            self._spill_path = mkdtemp(prefix="cache-", dir=self.spill_dir)
+        path = os.path.join(self._spill_path, sha256(repr(key).encode()).hexdigest())
+
+        async with aiofiles.open(path, "wb") as f:
+            await f.write(content)
+        for evicted_key, (evicted_path, _, _) in self.disk.set(
+            key, (path, len(content), expires)
+        ):
+            os.remove(evicted_path)
+
+    def _remove_spilled(self, key: Hashable) -> None:
+        spilled = self.disk.pop(key)
+        if spilled is not None:
+            os.remove(spilled[0])
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls for the same key into a single call.
+
+    Callers which arrive while a call for their key is in flight wait for
+    its result instead of starting another one. The call keeps running if
+    the caller which started it is cancelled.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, "asyncio.Future[Any]"] = dict()
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = asyncio.ensure_future(call())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda f: self._land(key, f))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(flight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+        }
+
+    def _land(self, key: Hashable, flight: "asyncio.Future[Any]") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark errors as retrieved, in case all callers were cancelled
+        if not flight.cancelled():
+            flight.exception()
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Optional
+
+import httpx
+
+from ..settings.globals import HTTP_TIMEOUT
+
+_client: Optional[httpx.AsyncClient] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared async HTTP client.
+
+    Connections are kept alive and reused across requests. Pooled
+    connections are bound to an event loop, hence a new client is
+    created if the current loop changes.
+    """
+    global _client
+    global _loop
+
+    loop = asyncio.get_event_loop()
+    if _client is None or _loop is not loop:
+        _client = httpx.AsyncClient(timeout=HTTP_TIMEOUT)
+        _loop = loop
+    return _client
+
+
+async def close_async_client() -> None:
+    global _client
+    global _loop
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _loop = None
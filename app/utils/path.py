@@ -33,6 +33,12 @@ def is_zipped(s3_uri: str) -> bool:
     return False
 
 
+def pmtiles_key(dataset: str, version: str, implementation: str = "default") -> str:
+    """Key of PMTiles archive of static vector tile cache in tile cache
+    bucket."""
+    return f"{dataset}/{version}/{implementation}/tiles.pmtiles"
+
+
 def get_layer_name(uri):
     name, ext = os.path.splitext(os.path.basename(uri))
     if ext == "":
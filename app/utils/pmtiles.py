@@ -0,0 +1,160 @@
+"""Read tiles from PMTiles (version 3) archives.
+
+An archive holds all tiles of a tile cache in a single file. Tiles are
+addressed by an ID along a Hilbert curve per zoom level. The root
+directory, which follows the fixed size header, maps tile IDs to byte
+ranges of tile data or of leaf directories, so that any tile can be read
+with a few HTTP range requests. Directories are immutable and can be
+cached for as long as the archive doesn't change.
+
+See https://github.com/protomaps/PMTiles/blob/main/spec/v3/spec.md
+"""
+import gzip
+import struct
+from bisect import bisect_right
+from typing import List, NamedTuple, Optional, Tuple
+
+MAGIC = b"PMTiles"
+HEADER_SIZE = 127
+
+# Header and root directory always fit into the first 16 KiB
+ROOT_SIZE = 16384
+
+# Compression and tile type codes
+COMPRESSION_NONE = 1
+COMPRESSION_GZIP = 2
+TILE_TYPE_MVT = 1
+
+# Leaf directories nest at most three levels deep
+MAX_DEPTH = 3
+
+
+class Header(NamedTuple):
+    root_offset: int
+    root_length: int
+    metadata_offset: int
+    metadata_length: int
+    leaf_offset: int
+    leaf_length: int
+    data_offset: int
+    data_length: int
+    internal_compression: int
+    tile_compression: int
+    tile_type: int
+    min_zoom: int
+    max_zoom: int
+
+
+class Entry(NamedTuple):
+    tile_id: int
+    offset: int
+    length: int
+    run_length: int  # 0 for leaf directories
+
+
+class Directory(NamedTuple):
+    tile_ids: List[int]
+    entries: List[Entry]
+
+
+def parse_header(data: bytes) -> Header:
+    if len(data) < HEADER_SIZE or data[:7] != MAGIC or data[7] != 3:
+        raise ValueError("Not a PMTiles version 3 archive")
+
+    # Offsets and lengths of sections, then compression, tile type and zoom
+    # levels, following the tile counts and clustered flag
+    offsets = struct.unpack_from("<8Q", data, 8)
+    return Header(*offsets, *data[97:102])
+
+
+def parse_directory(data: bytes, compression: int) -> Directory:
+    """Deserialize directory.
+
+    Entries are stored column by column as varints: tile ID deltas, run
+    lengths, lengths and offsets. Offsets are 0 for data which directly
+    follows the previous entry, otherwise offset + 1.
+    """
+    buffer = _decompress(data, compression)
+    position = 0
+
+    def varint() -> int:
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = buffer[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    count = varint()
+    tile_ids: List[int] = list()
+    last_id = 0
+    for _ in range(count):
+        last_id += varint()
+        tile_ids.append(last_id)
+    run_lengths = [varint() for _ in range(count)]
+    lengths = [varint() for _ in range(count)]
+
+    entries: List[Entry] = list()
+    for i in range(count):
+        value = varint()
+        if value == 0 and i > 0:
+            offset = entries[i - 1].offset + entries[i - 1].length
+        else:
+            offset = value - 1
+        entries.append(Entry(tile_ids[i], offset, lengths[i], run_lengths[i]))
+
+    return Directory(tile_ids, entries)
+
+
+def find_entry(directory: Directory, tile_id: int) -> Optional[Entry]:
+    """Entry which covers tile ID, either tile data or the leaf directory
+    to look into next."""
+    i = bisect_right(directory.tile_ids, tile_id) - 1
+    if i < 0:
+        return None
+
+    entry = directory.entries[i]
+    if entry.run_length == 0 or tile_id < entry.tile_id + entry.run_length:
+        return entry
+    return None
+
+
+def tile_id(z: int, x: int, y: int) -> int:
+    """Position of tile on the Hilbert curves of all zoom levels up to and
+    including its own."""
+    n = 1 << z
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        x, y = _rotate(n, x, y, rx, ry)
+        s >>= 1
+    return ((1 << 2 * z) - 1) // 3 + d
+
+
+def _rotate(n: int, x: int, y: int, rx: int, ry: int) -> Tuple[int, int]:
+    if ry == 0:
+        if rx == 1:
+            x, y = n - 1 - x, n - 1 - y
+        return y, x
+    return x, y
+
+
+def _decompress(data: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_GZIP:
+        return gzip.decompress(data)
+    if compression == COMPRESSION_NONE:
+        return data
+    raise ValueError(f"Unsupported PMTiles compression {compression}")
+
+
+def gzip_tile(data: bytes, compression: int) -> bytes:
+    """Tile data gzip encoded, as tiles are served."""
+    if compression == COMPRESSION_GZIP:
+        return data
+    return gzip.compress(_decompress(data, compression))
@@ -0,0 +1,279 @@
+"""Parse and sandbox user provided SQL queries.
+
+Queries are split into tokens, so that keywords are never confused with
+the content of string literals, quoted identifiers or comments. Only a
+single SELECT statement on a single table is accepted. The table in the
+FROM clause is bound to the table of the requested dataset version.
+"""
+
+import re
+from typing import List, NamedTuple, Optional
+from uuid import UUID
+
+from ..errors import BadRequestError
+
+TOKEN_REGEX = re.compile(
+    r"""
+    (?P<ws>\s+)
+    | (?P<comment>--[^\n]*|/\*)
+    | (?P<string>[eE]'(?:[^'\\]|\\.|'')*'|(?:[bBnNxX]|[uU]&)?'(?:[^']|'')*')
+    | (?P<dollar>\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$)
+    | (?P<quoted>"(?:[^"]|"")+")
+    | (?P<param>\$\d+)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<punct>[(),;.\[\]])
+    | (?P<op>::|(?:(?!--|/\*)[^\sA-Za-z0-9_(),;.\[\]'"$])+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Clauses which write or lock rows. Any other statement is rejected
+# already, since queries must start with SELECT.
+FORBIDDEN_KEYWORDS = {
+    "delete",
+    "insert",
+    "into",
+    "merge",
+    "share",
+    "truncate",
+    "update",
+}
+
+# Keywords which combine the result with other relations
+SET_OPERATIONS = {"except", "intersect", "join", "lateral", "table", "union"}
+
+# Functions which access the file system, other tables, sessions or
+# sequences, or run SQL passed to them as a string
+FORBIDDEN_FUNCTION_PREFIXES = (
+    "pg_",
+    "lo_",
+    "dblink",
+    "cursor_to_",
+    "database_to_",
+    "query_to_",
+    "schema_to_",
+    "table_to_",
+)
+FORBIDDEN_FUNCTIONS = {
+    "addgeometrycolumn",
+    "current_setting",
+    "dropgeometrycolumn",
+    "dropgeometrytable",
+    "find_srid",
+    "nextval",
+    "populate_geometry_columns",
+    "set_config",
+    "setval",
+    "st_estimated_extent",
+    "st_estimatedextent",
+    "st_find_extent",
+    "st_findextent",
+    "ts_rewrite",
+    "ts_stat",
+    "txid_current",
+    "updategeometrysrid",
+}
+
+# Keywords which end the FROM clause
+FROM_TERMINATORS = {
+    "where",
+    "group",
+    "having",
+    "window",
+    "order",
+    "limit",
+    "offset",
+    "fetch",
+    "tablesample",
+}
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+
+    @property
+    def keyword(self) -> Optional[str]:
+        return self.value.lower() if self.kind == "word" else None
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Split SQL into tokens.
+
+    Whitespace and comments are dropped. String literals include their
+    prefix, such as E, X or U&.
+    """
+    tokens: List[Token] = list()
+    pos = 0
+    while pos < len(sql):
+        match = TOKEN_REGEX.match(sql, pos)
+        if not match:
+            raise BadRequestError(f"Invalid SQL near `{sql[pos:pos + 20]}`.")
+
+        kind: str = match.lastgroup  # type: ignore
+        value: str = match.group()
+        pos = match.end()
+
+        if kind == "comment" and value == "/*":
+            pos = _block_comment_end(sql, pos)
+        elif kind == "dollar":
+            end = sql.find(value, pos)
+            if end == -1:
+                raise BadRequestError("Unterminated dollar-quoted string.")
+            tokens.append(Token("string", sql[match.start() : end + len(value)]))
+            pos = end + len(value)
+        elif kind not in ("ws", "comment"):
+            tokens.append(Token(kind, value))
+
+    return tokens
+
+
+def _block_comment_end(sql: str, pos: int) -> int:
+    """Position after a block comment starting before pos.
+
+    Block comments can be nested.
+    """
+    depth = 1
+    while depth:
+        start = sql.find("/*", pos)
+        end = sql.find("*/", pos)
+        if end == -1:
+            raise BadRequestError("Unterminated comment.")
+        if start != -1 and start < end:
+            depth += 1
+            pos = start + 2
+        else:
+            depth -= 1
+            pos = end + 2
+    return pos
+
+
+def normalize(tokens: List[Token]) -> str:
+    """Join tokens into a canonical query string.
+
+    Queries which only differ in whitespace, comments or the case of
+    keywords and unquoted identifiers result in the same string.
+    """
+    sql = ""
+    previous: Optional[Token] = None
+    for token in tokens:
+        value = token.keyword or token.value
+        if previous is not None and not (
+            token.value in (")", ",", ".", "::", "]", "[")
+            or previous.value in ("(", ".", "::", "[")
+            or (token.value == "(" and previous.kind in ("word", "quoted"))
+        ):
+            sql += " "
+        sql += value
+        previous = token
+    return sql
+
+
+def bind_query(
+    sql: str,
+    dataset: str,
+    version: str,
+    geostore_id: Optional[UUID] = None,
+    subdivided: Optional[str] = None,
+) -> str:
+    """Validate a read only query and bind it to a dataset version table.
+
+    The query must be a single SELECT statement without subqueries,
+    which selects from a single table. The table name is replaced by the
+    dataset version table and kept as alias, so that qualified column
+    names still resolve. If a geostore ID is given, only rows which
+    intersect with the geostore geometry are selected, using the table
+    of subdivided geometries, if given.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].value == ";":
+        tokens.pop()
+
+    if not tokens or tokens[0].keyword != "select":
+        raise BadRequestError("Only SELECT statements are allowed.")
+
+    from_index: Optional[int] = None
+    depth = 0
+    for i, token in enumerate(tokens):
+        keyword = token.keyword
+        next_value = tokens[i + 1].value if i + 1 < len(tokens) else None
+
+        if token.value == ";":
+            raise BadRequestError("Only a single statement is allowed.")
+        elif token.kind == "param":
+            raise BadRequestError("Query parameters are not supported.")
+        elif token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+            if depth < 0:
+                raise BadRequestError("Unbalanced parentheses.")
+        elif keyword in FORBIDDEN_KEYWORDS:
+            raise BadRequestError(f"`{token.value.upper()}` is not allowed.")
+        elif keyword == "select" and i > 0:
+            raise BadRequestError("Subqueries are not allowed.")
+        elif keyword in SET_OPERATIONS:
+            raise BadRequestError("Query must select from a single table.")
+        elif keyword == "from" and depth == 0:
+            if from_index is not None:
+                raise BadRequestError("Query must select from a single table.")
+            from_index = i
+        elif next_value == "(" and token.kind in ("word", "quoted"):
+            name = token.value.strip('"').lower()
+            if name in FORBIDDEN_FUNCTIONS or name.startswith(
+                FORBIDDEN_FUNCTION_PREFIXES
+            ):
+                raise BadRequestError(f"Function `{name}` is not allowed.")
+
+    if depth != 0:
+        raise BadRequestError("Unbalanced parentheses.")
+    if from_index is None:
+        raise BadRequestError("Query must select from the dataset table.")
+
+    return _bind_table(tokens, from_index, dataset, version, geostore_id, subdivided)
+
+
+def _bind_table(
+    tokens: List[Token],
+    from_index: int,
+    dataset: str,
+    version: str,
+    geostore_id: Optional[UUID],
+    subdivided: Optional[str],
+) -> str:
+    """Replace the table in the FROM clause with the dataset version
+    table."""
+    table_index = from_index + 1
+    table = tokens[table_index] if table_index < len(tokens) else None
+    if table is None or table.kind not in ("word", "quoted"):
+        raise BadRequestError("Query must select from the dataset table.")
+
+    # Everything up to the next clause must be an optional alias
+    end = table_index + 1
+    while end < len(tokens) and tokens[end].keyword not in FROM_TERMINATORS:
+        end += 1
+    alias = tokens[table_index + 1 : end]
+    if alias and alias[0].keyword == "as":
+        alias = alias[1:]
+    if len(alias) > 1 or (alias and alias[0].kind not in ("word", "quoted")):
+        raise BadRequestError("Query must select from a single table.")
+
+    relation = f'"{dataset}"."{version}"'
+    if geostore_id is not None:
+        condition = (
+            "ST_Intersects(geom, "
+            "(SELECT ST_GeomFromGeoJSON(gfw_geojson) FROM public.geostore "
+            f"WHERE gfw_geostore_id = '{UUID(str(geostore_id))}'::uuid))"
+        )
+        if subdivided is not None:
+            condition = (
+                f"gfw_fid IN (SELECT gfw_fid FROM {subdivided} WHERE {condition})"
+            )
+        relation = f"(SELECT * FROM {relation} WHERE {condition})"
+
+    bound = [Token("relation", relation)]
+    if not alias:
+        bound += [Token("word", "AS"), table]
+
+    return normalize(tokens[:table_index] + bound + tokens[table_index + 1 :])
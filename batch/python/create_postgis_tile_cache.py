@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple
+from urllib.parse import urlparse
+
+import boto3
+import click
+import psycopg2
+
+EXTENT = 4096
+BUFFER = 256
+
+# Number of tiles rendered with a single query and uploaded in parallel
+BATCH_SIZE = 500
+UPLOAD_THREADS = 16
+
+Tile = Tuple[int, int, int]
+
+
+@click.command()
+@click.option("-d", "--dataset", type=str, help="Dataset name")
+@click.option("-v", "--version", type=str, help="Version name")
+@click.option("-C", "--column_names", type=str, help="Columns to include in tiles")
+@click.option("-Z", "--min_zoom", type=int, help="Minimum zoom level")
+@click.option("-z", "--max_zoom", type=int, help="Maximum zoom level")
+@click.option("-T", "--target", type=str, help="S3 URI of tile cache")
+@click.option("--quadkeys", type=str, help="Quadkeys of tiles to render")
+@click.option(
+    "--zoom_levels", type=str, default="", help="Zoom levels of simplified geometries"
+)
+def cli(
+    dataset: str,
+    version: str,
+    column_names: str,
+    min_zoom: int,
+    max_zoom: int,
+    target: str,
+    quadkeys: str,
+    zoom_levels: str,
+) -> None:
+    """Render all tiles below the given quadkeys, down to the maximum zoom
+    level, and upload them gzip encoded.
+
+    Tiles are rendered level by level. Only children of tiles with
+    features are rendered at the next level, tiles above the minimum
+    zoom level are rendered but not uploaded.
+    """
+
+    click.echo(
+        f"python create_postgis_tile_cache.py -d {dataset} -v {version} -C {column_names} "
+        f"-Z {min_zoom} -z {max_zoom} -T {target} --quadkeys {quadkeys} --zoom_levels {zoom_levels}"
+    )
+
+    connection = psycopg2.connect(
+        database=os.environ["PGDATABASE"],
+        user=os.environ["PGUSER"],
+        password=os.environ["PGPASSWORD"],
+        port=os.environ["PGPORT"],
+        host=os.environ["PGHOST"],
+    )
+    connection.set_session(readonly=True)
+    cursor = connection.cursor()
+
+    url = urlparse(target)
+    bucket, prefix = url.netloc, url.path.strip("/")
+    s3 = boto3.client("s3")
+    simplified = sorted(int(z) for z in zoom_levels.split(",") if z)
+
+    tiles: List[Tile] = [tile(quadkey) for quadkey in quadkeys.split(",")]
+    count = 0
+
+    with ThreadPoolExecutor(UPLOAD_THREADS) as executor:
+        while tiles:
+            z = tiles[0][0]
+            sql = tile_query(dataset, version, column_names, column(z, simplified))
+            children: List[Tile] = list()
+
+            for batch in batches(tiles, BATCH_SIZE):
+                cursor.execute(
+                    sql, ([x for _, x, _ in batch], [y for _, _, y in batch], z)
+                )
+                uploads = list()
+                for x, y, mvt in cursor.fetchall():
+                    if not mvt:
+                        continue
+                    if z < max_zoom:
+                        children += [
+                            (z + 1, 2 * x + dx, 2 * y + dy)
+                            for dx in (0, 1)
+                            for dy in (0, 1)
+                        ]
+                    if z >= min_zoom:
+                        uploads.append(
+                            executor.submit(
+                                upload, s3, bucket, f"{prefix}/{z}/{x}/{y}.pbf", mvt
+                            )
+                        )
+                for future in uploads:
+                    future.result()
+                count += len(uploads)
+
+            click.echo(f"Zoom level {z}: {count} tiles uploaded so far")
+            tiles = children
+
+    cursor.close()
+    connection.close()
+
+
+def tile(quadkey: str) -> Tile:
+    """Tile coordinates of quadkey. The empty quadkey is the world tile."""
+    x = y = 0
+    for digit in quadkey:
+        x = 2 * x + (int(digit) & 1)
+        y = 2 * y + (int(digit) >> 1)
+    return len(quadkey), x, y
+
+
+def column(z: int, zoom_levels: List[int]) -> str:
+    """Most simplified geometry column which is precise enough at zoom
+    level."""
+    for zoom_level in zoom_levels:
+        if z <= zoom_level:
+            return f"geom_wm_z{zoom_level}"
+    return "geom_wm"
+
+
+def tile_query(dataset: str, version: str, column_names: str, geometry: str) -> str:
+    """Render a batch of tiles of one zoom level, passed as arrays of
+    columns and rows."""
+    fields = "".join(f', "{name}"' for name in column_names.split(",") if name)
+    return f"""
+        SELECT tiles.x, tiles.y, (
+            SELECT ST_AsMVT(tile, '{dataset}', {EXTENT}, 'geom')
+            FROM (
+                SELECT ST_AsMVTGeom("{geometry}", envelope, {EXTENT}, {BUFFER}, true)
+                    AS geom {fields}
+                FROM "{dataset}"."{version}"
+                WHERE "{geometry}" && ST_Expand(
+                    envelope, (ST_XMax(envelope) - ST_XMin(envelope)) * {BUFFER / EXTENT}
+                )
+            ) AS tile
+            WHERE geom IS NOT NULL
+        ) AS mvt
+        FROM unnest(%s::integer[], %s::integer[]) AS tiles(x, y),
+            ST_TileEnvelope(%s, tiles.x, tiles.y) AS envelope
+    """
+
+
+def batches(tiles: List[Tile], size: int) -> Iterator[List[Tile]]:
+    for i in range(0, len(tiles), size):
+        yield tiles[i : i + size]
+
+
+def upload(s3, bucket: str, key: str, mvt) -> None:
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=gzip.compress(bytes(mvt)),
+        ContentType="application/x-protobuf",
+        ContentEncoding="gzip",
+        Tagging="format=pbf",
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+from typing import Dict, List, Tuple
+
+import click
+
+HEADER_SIZE = 127
+ROOT_SIZE = 16384
+COMPRESSION_GZIP = 2
+TILE_TYPE_MVT = 1
+
+# Entry: tile ID, offset, length, run length
+Entry = List[int]
+
+
+@click.command()
+@click.argument("mbtiles", type=click.Path(exists=True))
+@click.argument("pmtiles", type=click.Path())
+def cli(mbtiles: str, pmtiles: str) -> None:
+    """Convert MBTiles file with gzip encoded vector tiles into a PMTiles
+    (version 3) archive.
+
+    Tiles are written in tile ID order. Identical tiles are stored once
+    and consecutive identical tiles share a directory entry.
+    """
+
+    click.echo(f"python mbtiles_to_pmtiles.py {mbtiles} {pmtiles}")
+
+    connection = sqlite3.connect(mbtiles)
+    cursor = connection.cursor()
+    metadata: Dict[str, str] = dict(cursor.execute("SELECT name, value FROM metadata"))
+
+    tiles: List[Tuple[int, int, int, int]] = sorted(
+        (tile_id(z, x, (1 << z) - 1 - row), z, x, row)
+        for z, x, row in cursor.execute(
+            "SELECT zoom_level, tile_column, tile_row FROM tiles"
+        )
+    )
+
+    entries: List[Entry] = list()
+    contents: Dict[bytes, Tuple[int, int]] = dict()
+    data_length = 0
+    with tempfile.TemporaryFile() as data:
+        for tid, z, x, row in tiles:
+            (tile_data,) = cursor.execute(
+                "SELECT tile_data FROM tiles "
+                "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, row),
+            ).fetchone()
+            digest = hashlib.sha256(tile_data).digest()
+            if digest not in contents:
+                contents[digest] = (data_length, len(tile_data))
+                data.write(tile_data)
+                data_length += len(tile_data)
+            offset, length = contents[digest]
+
+            last = entries[-1] if entries else None
+            if last and last[1] == offset and last[0] + last[3] == tid:
+                last[3] += 1
+            else:
+                entries.append([tid, offset, length, 1])
+
+        root, leaves = directories(entries)
+        meta = gzip.compress(json.dumps(tile_metadata(metadata)).encode())
+
+        zooms = [z for _, z, _, _ in tiles]
+        header = serialize_header(
+            metadata,
+            root_length=len(root),
+            metadata_length=len(meta),
+            leaf_length=len(leaves),
+            data_length=data_length,
+            counts=(len(tiles), len(entries), len(contents)),
+            zooms=(min(zooms, default=0), max(zooms, default=0)),
+        )
+
+        with open(pmtiles, "wb") as f:
+            for section in (header, root, meta, leaves):
+                f.write(section)
+            data.seek(0)
+            shutil.copyfileobj(data, f)
+
+    connection.close()
+    click.echo(
+        f"Wrote {len(tiles)} tiles, {len(contents)} distinct, "
+        f"{os.path.getsize(pmtiles)} bytes"
+    )
+
+
+def tile_id(z: int, x: int, y: int) -> int:
+    """Position of tile on the Hilbert curves of all zoom levels up to and
+    including its own."""
+    n = 1 << z
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = n - 1 - x, n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return ((1 << 2 * z) - 1) // 3 + d
+
+
+def directories(entries: List[Entry]) -> Tuple[bytes, bytes]:
+    """Root directory and leaf directories.
+
+    All entries go into the root directory if it fits into the first 16
+    KiB with the header. Otherwise, entries are split into leaf
+    directories, which grow until the root directory pointing to them
+    fits.
+    """
+    root = serialize_directory(entries)
+    if HEADER_SIZE + len(root) <= ROOT_SIZE:
+        return root, b""
+
+    leaf_size = 4096
+    while True:
+        leaves = b""
+        root_entries: List[Entry] = list()
+        for i in range(0, len(entries), leaf_size):
+            leaf = serialize_directory(entries[i : i + leaf_size])
+            root_entries.append([entries[i][0], len(leaves), len(leaf), 0])
+            leaves += leaf
+        root = serialize_directory(root_entries)
+        if HEADER_SIZE + len(root) <= ROOT_SIZE:
+            return root, leaves
+        leaf_size *= 2
+
+
+def serialize_directory(entries: List[Entry]) -> bytes:
+    buffer = bytearray()
+    varint(buffer, len(entries))
+    last_id = 0
+    for tid, _, _, _ in entries:
+        varint(buffer, tid - last_id)
+        last_id = tid
+    for _, _, _, run_length in entries:
+        varint(buffer, run_length)
+    for _, _, length, _ in entries:
+        varint(buffer, length)
+    for i, (_, offset, _, _) in enumerate(entries):
+        previous = entries[i - 1] if i > 0 else None
+        if previous and offset == previous[1] + previous[2]:
+            varint(buffer, 0)
+        else:
+            varint(buffer, offset + 1)
+    return gzip.compress(bytes(buffer))
+
+
+def varint(buffer: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def tile_metadata(metadata: Dict[str, str]) -> Dict:
+    """PMTiles metadata from MBTiles metadata, with the vector layers
+    tippecanoe lists in the `json` entry."""
+    result = {
+        key: value for key, value in metadata.items() if key not in ("json", "bounds")
+    }
+    if "json" in metadata:
+        result.update(json.loads(metadata["json"]))
+    return result
+
+
+def serialize_header(
+    metadata: Dict[str, str],
+    root_length: int,
+    metadata_length: int,
+    leaf_length: int,
+    data_length: int,
+    counts: Tuple[int, int, int],
+    zooms: Tuple[int, int],
+) -> bytes:
+    root_offset = HEADER_SIZE
+    metadata_offset = root_offset + root_length
+    leaf_offset = metadata_offset + metadata_length
+    data_offset = leaf_offset + leaf_length
+
+    bounds = [float(b) for b in metadata.get("bounds", "-180,-85,180,85").split(",")]
+    center = metadata.get("center")
+    if center:
+        lon, lat, center_zoom = [float(c) for c in center.split(",")]
+    else:
+        lon, lat = (bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2
+        center_zoom = zooms[0]
+
+    return b"PMTiles" + struct.pack(
+        "<B11QBBBBBBiiiiBii",
+        3,
+        root_offset,
+        root_length,
+        metadata_offset,
+        metadata_length,
+        leaf_offset,
+        leaf_length,
+        data_offset,
+        data_length,
+        *counts,
+        1,  # clustered
+        COMPRESSION_GZIP,  # internal compression
+        COMPRESSION_GZIP,  # tile compression, as tippecanoe writes them
+        TILE_TYPE_MVT,
+        *zooms,
+        *[int(b * 10_000_000) for b in bounds],
+        int(center_zoom),
+        int(lon * 10_000_000),
+        int(lat * 10_000_000),
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,21 @@
+#!/bin/bash
+
+set -e
+
+# requires arguments
+# -d | --dataset
+# -v | --version
+# -C | --column_names
+# -Z | --min_zoom
+# -z | --max_zoom
+# -T | --target
+# --quadkeys
+#
+# optional arguments
+# --zoom_levels
+ME=$(basename "$0")
+. get_arguments.sh "$@"
+
+echo "PYTHON: Render tiles below quadkeys ${QUADKEYS} with ST_AsMVT"
+create_postgis_tile_cache.py -d "$DATASET" -v "$VERSION" -C "$COLUMN_NAMES" -Z "$MIN_ZOOM" -z "$MAX_ZOOM" \
+  -T "$TARGET" --quadkeys "$QUADKEYS" --zoom_levels "$ZOOM_LEVELS"
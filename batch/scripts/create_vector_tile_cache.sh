@@ -9,6 +9,9 @@ set -e
 # -Z | --min_zoom
 # -z | --max_zoom
 # -t | --tile_strategy
+# optional arguments
+# -F | --format (pmtiles to write a single PMTiles archive)
+# -T | --target (URI of PMTiles archive)
 ME=$(basename "$0")
 . get_arguments.sh "$@"
 
@@ -27,11 +30,23 @@ continuous) # Continuous polygon features
 esac
 
 echo "Fetch NDJSON data from Data Lake"
-aws s3 cp "${SOURCE}" "${DATASET}"
+aws s3 cp "${SRC}" "${DATASET}"
 
-echo "Build Tile Cache"
-# shellcheck disable=SC2086
-tippecanoe -Z"${MINZOOM}" -z"${MAXZOOM}" -e tilecache --${STRATEGY} --extend-zooms-if-still-dropping -P -n "${DATASET}" ${DATASET}
+if [ "${FORMAT}" == "pmtiles" ]; then
+  echo "Build Tile Cache"
+  # shellcheck disable=SC2086
+  tippecanoe -Z"${MIN_ZOOM}" -z"${MAX_ZOOM}" -o tilecache.mbtiles --${STRATEGY} --extend-zooms-if-still-dropping -P -n "${DATASET}" ${DATASET}
 
-echo "Upload tiles to S3"
-tileputty tilecache --bucket "${TILE_CACHE}" --layer "${DATASET}" --version "${VERSION}" --ext pbf --option "${IMPLEMENTATION}""
+  echo "Convert tiles to PMTiles archive"
+  mbtiles_to_pmtiles.py tilecache.mbtiles tilecache.pmtiles
+
+  echo "Upload PMTiles archive to S3"
+  aws s3 cp tilecache.pmtiles "${TARGET}" --content-type application/vnd.pmtiles
+else
+  echo "Build Tile Cache"
+  # shellcheck disable=SC2086
+  tippecanoe -Z"${MIN_ZOOM}" -z"${MAX_ZOOM}" -e tilecache --${STRATEGY} --extend-zooms-if-still-dropping -P -n "${DATASET}" ${DATASET}
+
+  echo "Upload tiles to S3"
+  tileputty tilecache --bucket "${TILE_CACHE}" --layer "${DATASET}" --version "${VERSION}" --ext pbf --option "${IMPLEMENTATION}"
+fi
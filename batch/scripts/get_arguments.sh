@@ -101,6 +101,11 @@ do
       shift # past argument
       shift # past value
       ;;
+      --max_vertices)
+      MAX_VERTICES="$2"
+      shift # past argument
+      shift # past value
+      ;;
       -m|--field_map)
       FIELD_MAP="$2"
       shift # past argument
@@ -116,6 +121,11 @@ do
       shift # past argument
       shift # past value
       ;;
+      --quadkeys)
+      QUADKEYS="$2"
+      shift # past argument
+      shift # past value
+      ;;
       -s|--source)
       SRC+=("$2")
       shift # past argument
@@ -151,6 +161,11 @@ do
       shift # past argument
       shift # past value
       ;;
+      --zoom_levels)
+      ZOOM_LEVELS="$2"
+      shift # past argument
+      shift # past value
+      ;;
       -z|--max_zoom)
       MAX_ZOOM="$2"
       shift # past argument
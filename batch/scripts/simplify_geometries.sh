@@ -0,0 +1,36 @@
+#!/bin/bash
+
+set -e
+
+# requires arguments
+# -d | --dataset
+# -v | --version
+# --zoom_levels
+ME=$(basename "$0")
+. get_arguments.sh "$@"
+
+# Store geometries simplified to the pixel size of each zoom level, for tiles of 256 pixels.
+# Tiles and feature info at lower zoom levels don't need to process full resolution geometries.
+for ZOOM in ${ZOOM_LEVELS//,/ }; do
+  for COLUMN in "$GEOMETRY_NAME" "${GEOMETRY_NAME}_wm"; do
+    if [ "$COLUMN" == "$GEOMETRY_NAME" ]; then
+      SRID=4326
+      TOLERANCE="360.0 / (256 * 2 ^ $ZOOM)"
+    else
+      SRID=3857
+      TOLERANCE="40075016.68557849 / (256 * 2 ^ $ZOOM)"
+    fi
+    SIMPLIFIED="${COLUMN}_z${ZOOM}"
+
+    echo "PSQL: ALTER TABLE \"$DATASET\".\"$VERSION\". Add column $SIMPLIFIED"
+    psql -c "ALTER TABLE \"$DATASET\".\"$VERSION\" ADD COLUMN IF NOT EXISTS $SIMPLIFIED geometry(MultiPolygon,$SRID);
+             ALTER TABLE \"$DATASET\".\"$VERSION\" ALTER COLUMN $SIMPLIFIED SET STORAGE EXTERNAL;
+             UPDATE \"$DATASET\".\"$VERSION\" SET $SIMPLIFIED = ST_Multi(ST_SimplifyPreserveTopology($COLUMN, $TOLERANCE));"
+
+    echo "PSQL: CREATE INDEX. Add index on $SIMPLIFIED to \"$DATASET\".\"$VERSION\""
+    psql -c "CREATE INDEX IF NOT EXISTS \"${VERSION}_${SIMPLIFIED}_gist_idx\"
+               ON \"$DATASET\".\"$VERSION\" USING gist ($SIMPLIFIED);"
+  done
+done
+
+psql -c "ANALYZE \"$DATASET\".\"$VERSION\";"
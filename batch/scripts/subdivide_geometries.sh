@@ -0,0 +1,29 @@
+#!/bin/bash
+
+set -e
+
+# requires arguments
+# -d | --dataset
+# -v | --version
+# --max_vertices
+ME=$(basename "$0")
+. get_arguments.sh "$@"
+
+SUBDIVIDED="${VERSION}__subdivided"
+
+# Store geometries split into parts of at most MAX_VERTICES vertices.
+# Intersections with large polygons only need to check the parts near the other geometry.
+echo "PSQL: CREATE TABLE \"$DATASET\".\"$SUBDIVIDED\". Subdivide geometries"
+psql -c "DROP TABLE IF EXISTS \"$DATASET\".\"$SUBDIVIDED\";
+         CREATE TABLE \"$DATASET\".\"$SUBDIVIDED\" AS
+           SELECT $FID_NAME, ST_Subdivide($GEOMETRY_NAME, $MAX_VERTICES) AS $GEOMETRY_NAME
+           FROM \"$DATASET\".\"$VERSION\";
+         ALTER TABLE \"$DATASET\".\"$SUBDIVIDED\" ADD CONSTRAINT \"${SUBDIVIDED}_${FID_NAME}_fkey\"
+           FOREIGN KEY ($FID_NAME) REFERENCES \"$DATASET\".\"$VERSION\" ($FID_NAME) ON DELETE CASCADE;"
+
+echo "PSQL: CREATE INDEX. Add indices to \"$DATASET\".\"$SUBDIVIDED\""
+psql -c "CREATE INDEX IF NOT EXISTS \"${SUBDIVIDED}_${GEOMETRY_NAME}_gist_idx\"
+           ON \"$DATASET\".\"$SUBDIVIDED\" USING gist ($GEOMETRY_NAME);
+         CREATE INDEX IF NOT EXISTS \"${SUBDIVIDED}_${FID_NAME}_btree_idx\"
+           ON \"$DATASET\".\"$SUBDIVIDED\" USING btree ($FID_NAME);
+         ANALYZE \"$DATASET\".\"$SUBDIVIDED\";"
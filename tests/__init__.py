@@ -91,6 +91,49 @@ class MemoryServer(BaseHTTPRequestHandler):
         )
 
 
+AUTH_TOKENS = {
+    "admin_token": {
+        "role": "ADMIN",
+        "email": "admin@wri.org",
+        "extraUserData": {"apps": ["gfw"]},
+    },
+    "service_token": {
+        "role": "USER",
+        "email": "gfw-sync@wri.org",
+        "extraUserData": {"apps": ["gfw"]},
+    },
+    "user_token": {
+        "role": "USER",
+        "email": "user@wri.org",
+        "extraUserData": {"apps": ["gfw"]},
+    },
+}
+
+
+class AuthServer(BaseHTTPRequestHandler):
+    """Stand-in for GFW API token verification."""
+
+    calls: int = 0
+
+    def do_GET(self):
+        AuthServer.calls += 1
+
+        token = self.headers.get("Authorization", "").replace("Bearer ", "")
+        if self.path == "/auth/check-logged" and token in AUTH_TOKENS:
+            self.send_response(200)
+            body = AUTH_TOKENS[token]
+        else:
+            self.send_response(401)
+            body = {"errors": [{"status": 401, "detail": "Unauthorized"}]}
+
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
 class AWSMock(object):
     mocks = {
         "batch": mock_batch,
@@ -0,0 +1,23 @@
+import importlib.util
+import os
+
+from app.tasks.static_vector_tile_cache_assets import _quadkey
+
+spec = importlib.util.spec_from_file_location(
+    "create_postgis_tile_cache",
+    os.path.join(
+        os.path.dirname(__file__), "../../batch/python/create_postgis_tile_cache.py"
+    ),
+)
+create_postgis_tile_cache = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(create_postgis_tile_cache)
+
+
+def test_tile():
+    assert create_postgis_tile_cache.tile("") == (0, 0, 0)
+
+    # Quadkeys passed to jobs resolve to the tiles they were computed from
+    for z in range(4):
+        for x in range(2 ** z):
+            for y in range(2 ** z):
+                assert create_postgis_tile_cache.tile(_quadkey(z, x, y)) == (z, x, y)
@@ -0,0 +1,28 @@
+from typing import Callable, List, Tuple
+
+import pytest
+
+# Test, name, value and unit of all results reported in this session
+_results: List[Tuple[str, str, float, str]] = list()
+
+
+@pytest.fixture
+def benchmark_result(request, record_property) -> Callable[[str, float, str], None]:
+    """Report a benchmark result.
+
+    Results are recorded as properties of the test, hence end up in the
+    JUnit XML report, and are listed in the terminal summary.
+    """
+
+    def report(name: str, value: float, unit: str) -> None:
+        record_property(name, value)
+        _results.append((request.node.name, name, value, unit))
+
+    return report
+
+
+def pytest_terminal_summary(terminalreporter):
+    if _results:
+        terminalreporter.section("benchmarks")
+        for test, name, value, unit in _results:
+            terminalreporter.write_line(f"{test}: {name}: {value:.3f} {unit}")
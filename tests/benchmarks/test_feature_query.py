@@ -0,0 +1,110 @@
+"""Micro-benchmark of the info tool query.
+
+Compares the former query, which is built with SQLAlchemy and compiled
+by Gino on every request, with the prepared statement which is reused
+per connection. Planning time is taken from PostgreSQL, request time is
+measured end to end. Skipped unless run with `RUN_BENCHMARKS=1
+./scripts/test benchmarks`, results are listed in the terminal summary.
+"""
+import json
+from time import perf_counter
+from typing import Any, Dict, List
+
+import pytest
+
+from app import application
+from app.application import ContextEngine
+from app.crud.cache import feature_info_cache
+from app.routes.features.features import (
+    FID_KEYS,
+    POINT_PARAMS,
+    FeatureColumns,
+    _features_query,
+    _info_query,
+    _point_values,
+    get_features_by_location,
+)
+
+from ..routes import create_dataset, generic_dataset_metadata
+
+REQUESTS = 500
+POINTS = 100000
+
+
+async def _planning_time(sql: str) -> float:
+    """Planning time in milliseconds, as reported by EXPLAIN ANALYZE."""
+    async with application.db.acquire() as conn:
+        plan: List[Dict[str, Any]] = json.loads(
+            await conn.raw_connection.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")
+        )
+    return plan[0]["Planning Time"]
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_feature_query_benchmark(async_client, db, benchmark_result):
+    dataset = "test"
+    version = "v1"
+
+    await create_dataset(dataset, generic_dataset_metadata)
+    db.execute(
+        f"""CREATE TABLE "{dataset}"."{version}" AS
+            SELECT i AS gfw_fid, 'BRA'::text AS iso,
+                ST_SetSRID(ST_MakePoint(-60 + random() * 20, -20 + random() * 20), 4326) AS geom
+            FROM generate_series(1, {POINTS}) AS i;
+        CREATE INDEX ON "{dataset}"."{version}" USING gist (geom);
+        ANALYZE "{dataset}"."{version}";"""
+    )
+    db.commit()
+
+    columns = FeatureColumns(fields=["gfw_fid", "iso"], keys=FID_KEYS)
+    feature_info_cache.set((dataset, version), columns)
+    lat, lng, zoom = -10.0, -50.0, 5
+
+    async with ContextEngine("READ"):
+        # Server side planning time of a freshly parsed query and of the
+        # prepared statement, once PostgreSQL settled on a plan
+        sql = _info_query(dataset, version, columns, True)
+        unprepared = await _planning_time(
+            str(
+                _features_query(dataset, version, columns, lat, lng, zoom).compile(
+                    compile_kwargs={"literal_binds": True}
+                )
+            )
+        )
+        values = _point_values(lat, lng, zoom)
+        args = ", ".join(str(values[name]) for name in POINT_PARAMS)
+        async with application.db.acquire() as conn:
+            raw_conn = conn.raw_connection
+            await raw_conn.execute(f"PREPARE info AS {sql}")
+            for _ in range(10):
+                await raw_conn.execute(f"EXECUTE info({args})")
+            prepared: List[Dict[str, Any]] = json.loads(
+                await raw_conn.fetchval(
+                    f"EXPLAIN (ANALYZE, FORMAT JSON) EXECUTE info({args})"
+                )
+            )
+            await raw_conn.execute("DEALLOCATE info")
+
+        benchmark_result("Planning time, unprepared", unprepared, "ms")
+        benchmark_result("Planning time, prepared", prepared[0]["Planning Time"], "ms")
+
+        # End to end time per request
+        async def former():
+            return await application.db.all(
+                _features_query(dataset, version, columns, lat, lng, zoom)
+            )
+
+        async def current():
+            return await get_features_by_location(dataset, version, lat, lng, zoom)
+
+        results = dict()
+        for name, query in (("SQLAlchemy", former), ("Prepared", current)):
+            features = await query()  # Warm up connection and statement cache
+            start = perf_counter()
+            for _ in range(REQUESTS):
+                assert len(await query()) == len(features)
+            results[name] = (perf_counter() - start) / REQUESTS * 1000
+
+    for name, ms in results.items():
+        benchmark_result(name, ms, "ms/request")
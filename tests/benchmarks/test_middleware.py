@@ -0,0 +1,97 @@
+"""Micro-benchmark of middleware overhead.
+
+Compares requests/sec for `/meta/{dataset}` with the former
+BaseHTTPMiddleware based middleware and the current pure ASGI
+middleware. Skipped unless run with `RUN_BENCHMARKS=1 ./scripts/test
+benchmarks`, results are listed in the terminal summary.
+"""
+import asyncio
+import json
+from time import perf_counter
+
+import pytest
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.application import ContextEngine
+from app.main import app
+from app.middleware import RedirectLatestMiddleware, SetDBModeMiddleware, resolve_latest
+
+from ..routes import generic_dataset_metadata
+
+REQUESTS = 500
+CONCURRENCY = 10
+
+
+# Former middleware, mounted through BaseHTTPMiddleware
+async def set_db_mode(request, call_next):
+    if request.method in ["PUT", "PATCH", "POST", "DELETE"]:
+        method = "WRITE"
+    else:
+        method = "READ"
+    async with ContextEngine(method):
+        response = await call_next(request)
+    return response
+
+
+async def redirect_latest(request, call_next):
+    if request.method == "GET" and "latest" in request.url.path:
+        await resolve_latest(request.url.path)
+    return await call_next(request)
+
+
+BASE_HTTP_MIDDLEWARE = [
+    Middleware(BaseHTTPMiddleware, dispatch=redirect_latest),
+    Middleware(BaseHTTPMiddleware, dispatch=set_db_mode),
+]
+ASGI_MIDDLEWARE = [
+    Middleware(RedirectLatestMiddleware),
+    Middleware(SetDBModeMiddleware),
+]
+
+
+async def _requests_per_second(async_client, url) -> float:
+    async def worker(n):
+        for _ in range(n):
+            response = await async_client.get(url)
+            assert response.status_code == 200
+
+    start = perf_counter()
+    await asyncio.gather(*[worker(REQUESTS // CONCURRENCY) for _ in range(CONCURRENCY)])
+    return REQUESTS / (perf_counter() - start)
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_middleware_benchmark(async_client, benchmark_result):
+    dataset = "test"
+
+    response = await async_client.put(
+        f"/meta/{dataset}", data=json.dumps(generic_dataset_metadata)
+    )
+    assert response.status_code == 201
+
+    user_middleware = app.user_middleware
+    results = dict()
+    try:
+        for name, middleware in (
+            ("BaseHTTPMiddleware", BASE_HTTP_MIDDLEWARE),
+            ("ASGI middleware", ASGI_MIDDLEWARE),
+        ):
+            # Keep outer middleware, such as CORS and GZip, in place
+            app.user_middleware = [
+                m
+                for m in user_middleware
+                if m.cls not in (RedirectLatestMiddleware, SetDBModeMiddleware)
+            ] + middleware
+            app.middleware_stack = app.build_middleware_stack()
+
+            # Warm up connection pools and caches
+            await _requests_per_second(async_client, f"/meta/{dataset}")
+            results[name] = await _requests_per_second(async_client, f"/meta/{dataset}")
+    finally:
+        app.user_middleware = user_middleware
+        app.middleware_stack = app.build_middleware_stack()
+
+    for name, rps in results.items():
+        benchmark_result(name, rps, "requests/sec")
@@ -1,8 +1,10 @@
 import contextlib
 import csv
 import io
+import os
 import threading
 from http.server import HTTPServer
+from unittest.mock import patch
 
 import boto3
 import pytest
@@ -35,6 +37,7 @@ from . import (
     TSV_PATH,
     APPEND_TSV_NAME,
     APPEND_TSV_PATH,
+    AuthServer,
     AWSMock,
     MemoryServer,
     is_admin_mocked,
@@ -43,6 +46,30 @@ from . import (
     setup_clients,
 )
 
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmarks",
+        action="store_true",
+        default=False,
+        help="Run benchmarks, also enabled by setting RUN_BENCHMARKS",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: slow benchmark, skipped by default")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmarks") or os.environ.get("RUN_BENCHMARKS"):
+        return
+
+    skip = pytest.mark.skip(reason="Set RUN_BENCHMARKS or pass --benchmarks to run")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
 # We overwrite endpoint_url directly in the app.
 # Keeping this around for now, just in case we want to revert back to fixtures.
 # @pytest.fixture(autouse=True)
@@ -117,6 +144,7 @@ def db():
 def client():
     """Set up a clean database before running a test Run all migrations before
     test and downgrade afterwards."""
+    from app.crud.cache import clear_cache
     from app.main import app
 
     main(["--raiseerr", "upgrade", "head"])
@@ -128,6 +156,7 @@ def client():
 
     app.dependency_overrides = {}
     main(["--raiseerr", "downgrade", "base"])
+    clear_cache()
 
 
 @pytest.fixture(autouse=True)
@@ -157,6 +186,21 @@ def httpd():
     t.join()
 
 
+@pytest.fixture(scope="session")
+def auth_server():
+    """Local stand-in for the authorization server."""
+    httpd = HTTPServer(("localhost", 0), AuthServer)
+
+    t = threading.Thread(target=httpd.serve_forever)
+    t.start()
+
+    with patch("app.routes.AUTH_URL", f"http://localhost:{httpd.server_port}"):
+        yield httpd
+
+    httpd.shutdown()
+    t.join()
+
+
 @pytest.fixture(autouse=True)
 def flush_request_list(httpd):
     """Delete request cache before every test."""
@@ -13,6 +13,7 @@ from app.crud.assets import (
     get_asset,
     get_assets,
     get_assets_by_type,
+    iterate_assets,
     update_asset,
 )
 from app.crud.datasets import create_dataset
@@ -288,3 +289,38 @@ async def test_assets_metadata():
     async with ContextEngine("WRITE"):
         asset = await delete_asset(asset_id)
     assert asset.metadata == result_metadata
+
+
+@pytest.mark.asyncio
+async def test_iterate_assets():
+    """Assets are streamed in pages and inherit metadata from their
+    version."""
+
+    dataset = "test"
+    versions = ["v1.1.1", "v1.1.2"]
+
+    async with ContextEngine("WRITE"):
+        await create_dataset(dataset, metadata={"title": "Title"})
+        for version in versions:
+            await create_version(
+                dataset, version, source_type="table", metadata={"subtitle": version}
+            )
+            for i in range(3):
+                await create_asset(
+                    dataset,
+                    version,
+                    asset_type="Database table",
+                    asset_uri=f"s3://path/to/{version}/file_{i}",
+                )
+
+    async with ContextEngine("READ"):
+        rows = [row async for row in iterate_assets(page_size=2)]
+
+    assert len(rows) == 6
+    assert len(set(row.asset_id for row in rows)) == 6
+    for row in rows:
+        assert row.metadata == {"title": "Title", "subtitle": row.version}
+
+    async with ContextEngine("READ"):
+        rows = [row async for row in iterate_assets("ndjson", page_size=2)]
+    assert rows == []
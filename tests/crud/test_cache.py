@@ -0,0 +1,101 @@
+import pytest
+
+from app.application import ContextEngine
+from app.crud.assets import create_asset, update_asset
+from app.crud.cache import cache_stats
+from app.crud.datasets import create_dataset, delete_dataset, update_dataset
+from app.crud.versions import create_version, get_version, update_version
+from app.errors import RecordNotFoundError
+from app.routes.features.features import get_feature_columns
+
+
+@pytest.mark.asyncio
+async def test_metadata_cache():
+    """Dataset and version rows are served from cache until they are
+    changed through crud."""
+
+    dataset_name = "test"
+    version_name = "v1.1.1"
+
+    async with ContextEngine("WRITE"):
+        await create_dataset(dataset_name, metadata={"title": "Title"})
+        await create_version(
+            dataset_name, version_name, source_type="table", is_latest=True
+        )
+
+    hits = cache_stats()["versions"]["hits"]
+
+    row = await get_version(dataset_name, version_name)
+    assert row.metadata == {"title": "Title"}
+    row = await get_version(dataset_name, version_name)
+    assert row.metadata == {"title": "Title"}
+    assert cache_stats()["versions"]["hits"] == hits + 1
+
+    # Changing returned rows must not change cached rows
+    row.metadata["title"] = "Changed"
+    row = await get_version(dataset_name, version_name)
+    assert row.metadata == {"title": "Title"}
+
+    # Updates of dataset and version are visible right away
+    async with ContextEngine("WRITE"):
+        await update_dataset(dataset_name, metadata={"title": "New Title"})
+        await update_version(
+            dataset_name, version_name, metadata={"subtitle": "Subtitle"}
+        )
+    row = await get_version(dataset_name, version_name)
+    assert row.metadata == {"title": "New Title", "subtitle": "Subtitle"}
+
+    # Trigger on versions table resets is_latest of other versions
+    async with ContextEngine("WRITE"):
+        await create_version(dataset_name, "v1.1.2", source_type="table")
+        await update_version(dataset_name, "v1.1.2", is_latest=True)
+    row = await get_version(dataset_name, version_name)
+    assert row.is_latest is False
+
+    # Deleting a dataset also removes its versions from cache
+    async with ContextEngine("WRITE"):
+        await delete_dataset(dataset_name)
+
+    with pytest.raises(RecordNotFoundError):
+        await get_version(dataset_name, version_name)
+
+
+@pytest.mark.asyncio
+async def test_feature_info_cache():
+    """Feature info fields are dropped from cache when asset metadata
+    change."""
+
+    dataset_name = "test"
+    version_name = "v1.1.1"
+
+    def _fields(*names):
+        return [
+            {"field_name": name, "is_feature_info": name != "geom"} for name in names
+        ]
+
+    async with ContextEngine("WRITE"):
+        await create_dataset(dataset_name)
+        await create_version(dataset_name, version_name, source_type="table")
+        asset = await create_asset(
+            dataset_name,
+            version_name,
+            asset_type="Database table",
+            asset_uri="s3://path/to/file",
+            metadata={"fields": _fields("geom", "iso")},
+        )
+
+    fields = (await get_feature_columns(dataset_name, version_name)).fields
+    assert fields == ["iso"]
+
+    hits = cache_stats()["feature_info"]["hits"]
+    fields = (await get_feature_columns(dataset_name, version_name)).fields
+    assert fields == ["iso"]
+    assert cache_stats()["feature_info"]["hits"] == hits + 1
+
+    async with ContextEngine("WRITE"):
+        await update_asset(
+            asset.asset_id, metadata={"fields": _fields("geom", "iso", "adm1")}
+        )
+
+    fields = (await get_feature_columns(dataset_name, version_name)).fields
+    assert fields == ["iso", "adm1"]
@@ -13,6 +13,8 @@ from app.crud.versions import (
     get_version,
     get_version_names,
     get_versions,
+    simplified_column,
+    simplified_zoom_levels,
     update_version,
 )
 from app.errors import RecordAlreadyExistsError, RecordNotFoundError
@@ -159,3 +161,24 @@ async def test_latest_versions():
     assert first_row.is_latest is False
     assert second_row.is_latest is True
     assert latest == "v1.1.2"
+
+
+def test_simplified_columns():
+    fields = [
+        {"field_name": "geom", "field_type": "geometry"},
+        {"field_name": "geom_wm", "field_type": "geometry"},
+        {"field_name": "geom_wm_z6", "field_type": "geometry"},
+        {"field_name": "geom_wm_z2", "field_type": "geometry"},
+        {"field_name": "geom_z2", "field_type": "geometry"},
+        {"field_name": "count_z2", "field_type": "integer"},
+    ]
+    assert simplified_zoom_levels(fields, "geom_wm") == (2, 6)
+    assert simplified_zoom_levels(fields, "geom") == (2,)
+    assert simplified_zoom_levels(fields, "count") == ()
+
+    # Most simplified geometries which are still precise enough
+    assert simplified_column("geom_wm", (2, 6), 0) == "geom_wm_z2"
+    assert simplified_column("geom_wm", (2, 6), 2) == "geom_wm_z2"
+    assert simplified_column("geom_wm", (2, 6), 3) == "geom_wm_z6"
+    assert simplified_column("geom_wm", (2, 6), 7) == "geom_wm"
+    assert simplified_column("geom_wm", (), 0) == "geom_wm"
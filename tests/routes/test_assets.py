@@ -2,6 +2,7 @@ import uuid
 from unittest.mock import patch
 
 import pytest
+from gino.engine import GinoConnection
 
 from tests.routes import create_default_asset
 
@@ -76,3 +77,30 @@ async def test_assets(async_client, db):
     assert create_asset_resp.json()["message"] == (
         "Version status is `failed`. Cannot add any assets."
     )
+
+
+@pytest.mark.asyncio
+async def test_assets_round_trips(async_client):
+    """Listing the assets of a version must not query the database once per
+    asset."""
+    dataset = "test"
+    version = "v20200626"
+
+    def generate_uuid(*args, **kwargs):
+        return uuid.uuid4()
+
+    with patch("app.tasks.batch.submit_batch_job", side_effect=generate_uuid):
+        await create_default_asset(dataset, version)
+
+    with patch.object(
+        GinoConnection, "_execute", autospec=True, side_effect=GinoConnection._execute
+    ) as execute:
+        resp = await async_client.get(f"/meta/{dataset}/{version}/assets")
+
+    assert resp.status_code == 200
+    assert len(resp.json()["data"]) == 1
+
+    # One query for assets including inherited metadata,
+    # one to look up the source type of the version.
+    # Previously this took 3 queries plus 2 for every asset.
+    assert execute.call_count == 2
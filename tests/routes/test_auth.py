@@ -0,0 +1,34 @@
+import pytest
+from fastapi import HTTPException
+
+from app.routes import identity_cache, is_admin, is_service_account
+
+from .. import AuthServer
+
+
+@pytest.mark.asyncio
+async def test_token_verification(auth_server):
+    """Verified tokens are cached, rejected tokens are checked every
+    time."""
+
+    identity_cache.clear()
+    calls = AuthServer.calls
+
+    assert await is_admin("admin_token") is True
+    assert await is_admin("admin_token") is True
+    assert AuthServer.calls == calls + 1
+
+    assert await is_service_account("service_token") is True
+    assert AuthServer.calls == calls + 2
+
+    # Cached identity must still be checked for required role
+    with pytest.raises(HTTPException) as e:
+        await is_admin("service_token")
+    assert e.value.status_code == 401
+    assert AuthServer.calls == calls + 2
+
+    for i in range(2):
+        with pytest.raises(HTTPException) as e:
+            await is_service_account("invalid_token")
+        assert e.value.status_code == 401
+    assert AuthServer.calls == calls + 4
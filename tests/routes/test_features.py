@@ -1,12 +1,22 @@
 import json
 
 import pendulum
+import pyarrow
 import pytest
 from httpx import AsyncClient
 from pendulum.parsing.exceptions import ParserError
+from sqlalchemy.dialects import postgresql
 
 from app.application import app
 from app.crud import tasks
+from app.crud.cache import cache_stats
+from app.crud.versions import SUBDIVIDED_SUFFIX
+from app.models.pydantic.features import FeaturePoint
+from app.routes.features.features import (
+    FID_KEYS,
+    FeatureColumns,
+    _features_by_locations_query,
+)
 from tests import BUCKET, TSV_NAME
 from tests.routes import create_default_asset
 from tests.tasks import poll_jobs
@@ -110,7 +120,7 @@ async def test_features(batch_client, httpd):
     # Test features endpoint
     ########################
     async with AsyncClient(app=app, base_url="http://test", trust_env=False) as ac:
-        # Exact match, z > 9 (though see FIXME in app/routes/features/features.py)
+        # Exact match, z > 9
         resp = await ac.get(
             f"/features/{dataset}/{version}?lat=4.42813&lng=17.97655&z=10"
         )
@@ -118,6 +128,20 @@ async def test_features(batch_client, httpd):
         assert len(resp.json()["data"]) == 1
         assert resp.json()["data"][0]["iso"] == "CAF"
 
+        # About 110 m off, only within search tolerance at lower zoom levels
+        resp = await ac.get(
+            f"/features/{dataset}/{version}?lat=4.42913&lng=17.97655&z=10"
+        )
+        assert resp.status_code == 200
+        assert len(resp.json()["data"]) == 0
+
+        resp = await ac.get(
+            f"/features/{dataset}/{version}?lat=4.42913&lng=17.97655&z=5"
+        )
+        assert resp.status_code == 200
+        assert len(resp.json()["data"]) == 1
+        assert resp.json()["data"][0]["iso"] == "CAF"
+
         # Nearby match
         resp = await ac.get(
             f"/features/{dataset}/{version}?lat=9.40645&lng=-3.3681&z=9"
@@ -126,11 +150,80 @@ async def test_features(batch_client, httpd):
         assert len(resp.json()["data"]) == 1
         assert resp.json()["data"][0]["iso"] == "CIV"
 
+        # Page through features using a cursor
+        url = f"/features/{dataset}/{version}?lat=4.42813&lng=17.97655&z=0"
+        resp = await ac.get(url)
+        assert resp.status_code == 200
+        features = resp.json()["data"]
+        assert resp.json()["next_cursor"] is None
+
+        pages = list()
+        resp = await ac.get(f"{url}&limit=1")
+        while True:
+            assert resp.status_code == 200
+            assert len(resp.json()["data"]) == 1
+            pages += resp.json()["data"]
+            cursor = resp.json()["next_cursor"]
+            if cursor is None:
+                break
+            resp = await ac.get(f"{url}&limit=1&cursor={cursor}")
+        assert sorted(pages, key=json.dumps) == sorted(features, key=json.dumps)
+
+        resp = await ac.get(f"{url}&limit=1&cursor=invalid")
+        assert resp.status_code == 400
+
+        # Stream features as newline delimited JSON
+        resp = await ac.get(url, headers={"Accept": "application/x-ndjson"})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        streamed = [json.loads(line) for line in resp.text.splitlines()]
+        assert sorted(streamed, key=json.dumps) == sorted(features, key=json.dumps)
+
+        # Streamed responses can't be paged
+        for accept in ["application/x-ndjson", "application/vnd.apache.parquet"]:
+            resp = await ac.get(f"{url}&limit=1", headers={"Accept": accept})
+            assert resp.status_code == 400
+
+        # Stream features as Arrow record batches
+        resp = await ac.get(
+            url, headers={"Accept": "application/vnd.apache.arrow.stream"}
+        )
+        assert resp.status_code == 200
+        table = pyarrow.ipc.open_stream(resp.content).read_all()
+        assert table.num_rows == len(features)
+        assert sorted(table.column("iso").to_pylist()) == sorted(
+            feature["iso"] for feature in features
+        )
+
         # No match
         resp = await ac.get(f"/features/{dataset}/{version}?lat=10&lng=-10&z=22")
         assert resp.status_code == 200
         assert len(resp.json()["data"]) == 0
 
+        # Look up many points at once, results are keyed by input index
+        resp = await ac.post(
+            f"/features/{dataset}/{version}",
+            data=json.dumps(
+                {
+                    "points": [
+                        {"lat": 4.42813, "lng": 17.97655, "z": 10},
+                        {"lat": 4.42913, "lng": 17.97655, "z": 10},
+                        {"lat": 4.42913, "lng": 17.97655, "z": 5},
+                        {"lat": 9.40645, "lng": -3.3681, "z": 9},
+                        {"lat": 10, "lng": -10},
+                    ]
+                }
+            ),
+        )
+        assert resp.status_code == 200
+        data = resp.json()["data"]
+        assert set(data.keys()) == {"0", "1", "2", "3", "4"}
+        assert [feature["iso"] for feature in data["0"]] == ["CAF"]
+        assert data["1"] == []
+        assert [feature["iso"] for feature in data["2"]] == ["CAF"]
+        assert [feature["iso"] for feature in data["3"]] == ["CIV"]
+        assert data["4"] == []
+
         # Invalid latitude, longitude, or zoom level
         # Check all the constraints at once, why not?
         expected_messages = [
@@ -192,3 +285,98 @@ async def test_features(batch_client, httpd):
         ) == set(json.dumps(msg, sort_keys=True) for msg in expected_messages)
 
         # TODO: Assert on the content of the fields in the features response
+
+    ##################################
+    # Test dynamic vector tile endpoint
+    ##################################
+    async with AsyncClient(app=app, base_url="http://test", trust_env=False) as ac:
+        url = f"/tiles/{dataset}/{version}/dynamic"
+
+        # Single tile covering the world, gzip encoded
+        resp = await ac.get(f"{url}/0/0/0.pbf", headers={"Accept-Encoding": "gzip"})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/x-protobuf"
+        assert resp.headers["content-encoding"] == "gzip"
+        assert "immutable" in resp.headers["cache-control"]
+        assert dataset.encode() in resp.content
+
+        # Repeated requests are served from cache
+        hits = cache_stats()["tiles"]["hits"]
+        resp = await ac.get(f"{url}/0/0/0.pbf", headers={"Accept-Encoding": "gzip"})
+        assert resp.status_code == 200
+        assert cache_stats()["tiles"]["hits"] == hits + 1
+
+        # Clients which don't accept gzip receive plain tiles
+        resp = await ac.get(f"{url}/0/0/0.pbf", headers={"Accept-Encoding": "identity"})
+        assert resp.status_code == 200
+        assert "content-encoding" not in resp.headers
+        assert dataset.encode() in resp.content
+
+        # Empty tile in the Arctic Ocean
+        resp = await ac.get(f"{url}/10/0/0.pbf")
+        assert resp.status_code == 204
+
+        # Tile outside of the grid
+        resp = await ac.get(f"{url}/1/2/0.pbf")
+        assert resp.status_code == 404
+
+        resp = await ac.get(f"/tiles/{dataset}/v1/dynamic/0/0/0.pbf")
+        assert resp.status_code == 404
+
+
+def test_features_by_locations_plan(db):
+    """Points are joined with subdivided geometries through their spatial
+    index, without a subquery per point and feature."""
+    dataset = "plan_test"
+    version = "v1"
+    db.execute(
+        f"""CREATE SCHEMA {dataset};
+        CREATE TABLE {dataset}.{version} AS
+            SELECT i AS gfw_fid, 'feature ' || i AS name,
+                ST_Buffer(ST_MakePoint(i % 360 - 180, i / 360 % 180 - 90), 0.5) AS geom
+            FROM generate_series(0, 19999) AS i;
+        CREATE TABLE {dataset}.{version}__subdivided AS
+            SELECT gfw_fid, ST_Subdivide(geom, 8) AS geom FROM {dataset}.{version};
+        CREATE INDEX ON {dataset}.{version} (gfw_fid);
+        CREATE INDEX ON {dataset}.{version}__subdivided USING gist (geom);
+        ANALYZE {dataset}.{version};
+        ANALYZE {dataset}.{version}__subdivided;"""
+    )
+    db.commit()
+
+    try:
+        columns = FeatureColumns(
+            ["name"], FID_KEYS, f'"{dataset}"."{version}{SUBDIVIDED_SUFFIX}"'
+        )
+        points = [
+            FeaturePoint(lat=-80, lng=0, z=12),
+            FeaturePoint(lat=-70.2, lng=20.3, z=3),
+        ]
+        sql = _features_by_locations_query(dataset, version, columns, points)
+        compiled = sql.compile(dialect=postgresql.psycopg2.dialect())
+
+        cursor = db.connection().connection.cursor()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+        plan = cursor.fetchone()[0][0]["Plan"]
+
+        def nodes(node):
+            yield node
+            for child in node.get("Plans", list()):
+                yield from nodes(child)
+
+        assert not any(
+            node.get("Parent Relationship") == "SubPlan" for node in nodes(plan)
+        )
+        assert not any(
+            node["Node Type"] == "Seq Scan"
+            and node.get("Relation Name") == f"{version}{SUBDIVIDED_SUFFIX}"
+            for node in nodes(plan)
+        )
+
+        cursor.execute(str(compiled), compiled.params)
+        rows = cursor.fetchall()
+        assert {row[0] for row in rows} == {0, 1}
+    finally:
+        db.rollback()
+        db.execute(f"DROP SCHEMA {dataset} CASCADE")
+        db.commit()
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from app.crud.cache import cache_stats
+
+GEOMETRY = {
+    "type": "Polygon",
+    "coordinates": [[[-52, -12], [-49, -12], [-49, -9], [-52, -9], [-52, -12]]],
+}
+
+
+@pytest.mark.asyncio
+async def test_get_geostore(async_client, db):
+    geostore_id = "b9faa657-34c9-96d4-fce4-8bb8a1507cb3"
+    db.execute(
+        """INSERT INTO geostore (gfw_geostore_id, gfw_geojson, gfw_area__ha, gfw_bbox)
+        VALUES (:id, :geojson, 1000, ST_Envelope(ST_GeomFromGeoJSON(:geojson)))""",
+        {"id": geostore_id, "geojson": json.dumps(GEOMETRY)},
+    )
+    db.commit()
+
+    response = await async_client.get(f"/geostore/geostore/{geostore_id}")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    data = response.json()["data"]
+    assert data["gfw_geostore_id"] == geostore_id
+    assert data["gfw_geojson"]["features"][0]["geometry"] == GEOMETRY
+    assert data["gfw_area__ha"] == 1000
+    assert data["gfw_bbox"] == [-52, -12, -49, -9]
+
+    # Second request is served from cache
+    hits = cache_stats()["geostores"]["hits"]
+    etag = response.headers["etag"]
+    response = await async_client.get(f"/geostore/geostore/{geostore_id}")
+    assert response.status_code == 200
+    assert response.headers["etag"] == etag
+    assert response.json()["data"] == data
+    assert cache_stats()["geostores"]["hits"] == hits + 1
+
+    response = await async_client.get(
+        f"/geostore/geostore/{geostore_id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    response = await async_client.get(
+        "/geostore/geostore/00000000-0000-0000-0000-000000000000"
+    )
+    assert response.status_code == 404
+    assert response.json()["status"] == "failed"
+
+    # Dataset versions without geostore
+    response = await async_client.get(f"/geostore/test/v1.1.1/geostore/{geostore_id}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_add_geostores(async_client):
+    point = {"type": "Point", "coordinates": [10, 20]}
+    features = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": {}, "geometry": GEOMETRY},
+            {"type": "Feature", "properties": {"name": "point"}, "geometry": point},
+            {"type": "Feature", "properties": {}, "geometry": GEOMETRY},
+        ],
+    }
+    response = await async_client.post("/geostore/geostore", data=json.dumps(features))
+    assert response.status_code == 201
+    ids = response.json()["data"]
+    assert len(ids) == 3
+    assert ids[0] == ids[2] != ids[1]
+
+    # Existing geometries are not added again, ids are returned in input order
+    response = await async_client.post(
+        "/geostore/geostore",
+        data="\n".join(json.dumps(geometry) for geometry in [point, GEOMETRY]),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 201
+    assert response.json()["data"] == [ids[1], ids[0]]
+
+    response = await async_client.get(f"/geostore/geostore/{ids[0]}")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["gfw_geojson"]["features"][0]["geometry"] == GEOMETRY
+    assert data["gfw_bbox"] == [-52, -12, -49, -9]
+    assert data["gfw_area__ha"] > 0
+
+    response = await async_client.get(f"/geostore/geostore/{ids[1]}")
+    assert response.status_code == 200
+    assert response.json()["data"]["gfw_bbox"] == [10, 20, 10, 20]
+
+    for body in ["not json", json.dumps({"features": []}), json.dumps([1])]:
+        response = await async_client.post("/geostore/geostore", data=body)
+        assert response.status_code == 400
+
+    response = await async_client.post(
+        "/geostore/geostore", data=json.dumps({"type": "Polygon", "coordinates": 1})
+    )
+    assert response.status_code == 400
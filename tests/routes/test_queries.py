@@ -0,0 +1,312 @@
+import json
+from unittest.mock import patch
+from uuid import uuid4
+
+import pyarrow
+import pyarrow.parquet
+import pytest
+import requests
+from shapely import wkb
+
+from app.application import ContextEngine
+from app.crud.assets import create_asset
+from app.crud.cache import cache_stats
+from app.crud.tasks import create_task
+from app.crud.versions import create_version, get_version
+from app.main import app
+from app.routes import is_admin
+from app.tasks.default_assets import append_default_asset
+from tests import BUCKET
+
+from . import create_dataset, generic_dataset_metadata
+
+
+@pytest.mark.asyncio
+async def test_query_dataset(async_client, db):
+    dataset = "table_test"
+    version = "v202002.1"
+
+    await create_dataset(dataset, generic_dataset_metadata)
+    async with ContextEngine("WRITE"):
+        await create_version(
+            dataset, version, source_type="table", is_mutable=True, status="saved"
+        )
+    db.execute(
+        f"""CREATE TABLE "{dataset}"."{version}" (iso text, alert__count integer, geom geometry(Point, 4326));
+        INSERT INTO "{dataset}"."{version}" VALUES
+            ('BRA', 1, ST_SetSRID(ST_MakePoint(-50, -10), 4326)),
+            ('BRA', 2, ST_SetSRID(ST_MakePoint(-51, -11), 4326)),
+            ('IDN', 3, ST_SetSRID(ST_MakePoint(110, -1), 4326));"""
+    )
+    db.commit()
+
+    sql = "SELECT iso, sum(alert__count) AS alerts FROM data GROUP BY iso ORDER BY iso"
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query", params={"sql": sql}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {
+        "status": "success",
+        "data": [{"iso": "BRA", "alerts": 3}, {"iso": "IDN", "alerts": 3}],
+    }
+
+    # Same query with different formatting is served from cache
+    hits = cache_stats()["query_results"]["memory"]["hits"]
+    db.execute(f"""DELETE FROM "{dataset}"."{version}" WHERE iso = 'IDN';""")
+    db.commit()
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query",
+        params={"sql": sql.lower().replace(" ", "\n  ") + ";"},
+    )
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 2
+    assert cache_stats()["query_results"]["memory"]["hits"] == hits + 1
+
+    # Appending data to a version keeps its status
+    async with ContextEngine("WRITE"):
+        asset = await create_asset(
+            dataset,
+            version,
+            asset_type="Database table",
+            asset_uri=f"/{dataset}/{version}/features",
+            is_default=True,
+        )
+    with patch("app.tasks.default_assets.put_asset") as put_asset:
+        await append_default_asset(
+            dataset, version, {"source_type": "table"}, asset.asset_id
+        )
+    assert put_asset.called
+    async with ContextEngine("READ"):
+        assert (await get_version(dataset, version)).status == "saved"
+
+    db.execute(f"""INSERT INTO "{dataset}"."{version}" VALUES ('IDN', 5);""")
+    db.commit()
+
+    # Cached results are dropped once the appended default asset completes
+    hits = cache_stats()["query_results"]["memory"]["hits"]
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query", params={"sql": sql}
+    )
+    assert response.json()["data"][1] == {"iso": "IDN", "alerts": 3}
+    assert cache_stats()["query_results"]["memory"]["hits"] == hits + 1
+
+    task_id = uuid4()
+    async with ContextEngine("WRITE"):
+        await create_task(task_id, asset_id=asset.asset_id, change_log=list())
+    response = await async_client.patch(
+        f"/tasks/{task_id}",
+        json={
+            "change_log": [
+                {
+                    "date_time": "2020-06-25 14:30:00",
+                    "status": "success",
+                    "message": "Loaded data",
+                    "detail": "None",
+                }
+            ]
+        },
+    )
+    assert response.status_code == 200
+
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query", params={"sql": sql}
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == [
+        {"iso": "BRA", "alerts": 3},
+        {"iso": "IDN", "alerts": 5},
+    ]
+    db.execute(f"""DELETE FROM "{dataset}"."{version}" WHERE iso = 'IDN';""")
+    db.commit()
+
+    # Empty result
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query",
+        params={"sql": "SELECT iso FROM data WHERE iso = 'USA'"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "data": []}
+
+    # Only rows intersecting with the geostore
+    geostore_id = "b9faa657-34c9-96d4-fce4-8bb8a1507cb3"
+    geojson = {
+        "type": "Polygon",
+        "coordinates": [[[-52, -12], [-49, -12], [-49, -9], [-52, -9], [-52, -12]]],
+    }
+    db.execute(
+        "INSERT INTO geostore (gfw_geostore_id, gfw_geojson) VALUES (:id, :geojson)",
+        {"id": geostore_id, "geojson": json.dumps(geojson)},
+    )
+    db.commit()
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query",
+        params={"sql": "SELECT DISTINCT iso FROM data", "geostore_id": geostore_id},
+    )
+    assert response.status_code == 200
+    assert response.json()["data"] == [{"iso": "BRA"}]
+
+    # CSV as written by COPY
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query",
+        params={"sql": "SELECT iso, alert__count FROM data ORDER BY alert__count"},
+        headers={"Accept": "text/csv"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines() == ["iso,alert__count", "BRA,1", "BRA,2"]
+
+    # Arrow record batches, with geometries as WKB
+    sql = "SELECT iso, alert__count, geom FROM data ORDER BY alert__count"
+    for media_type in [
+        "application/vnd.apache.arrow.stream",
+        "application/vnd.apache.parquet",
+    ]:
+        response = await async_client.get(
+            f"/sql/{dataset}/{version}/query",
+            params={"sql": sql},
+            headers={"Accept": media_type},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == media_type
+        if media_type == "application/vnd.apache.parquet":
+            table = pyarrow.parquet.read_table(pyarrow.BufferReader(response.content))
+        else:
+            table = pyarrow.ipc.open_stream(response.content).read_all()
+        assert table.column("iso").to_pylist() == ["BRA", "BRA"]
+        assert table.schema.field("alert__count").type == pyarrow.int32()
+        assert wkb.loads(table.column("geom").to_pylist()[0]).coords[:] == [(-50, -10)]
+
+    # Writes and other tables are rejected before they reach the database
+    for sql in [
+        f'DELETE FROM "{dataset}"."{version}"',
+        "SELECT * FROM public.geostore",
+        "SELECT pg_sleep(60) FROM data",
+        "SELECT ts_stat('SELECT to_tsvector(gfw_geojson) FROM public.geostore') "
+        "FROM data",
+        "SELECT ts_rewrite('a'::tsquery, 'SELECT t, s FROM public.geostore') "
+        "FROM data",
+        "SELECT ST_EstimatedExtent('public', 'geostore', 'geom') FROM data",
+    ]:
+        response = await async_client.get(
+            f"/sql/{dataset}/{version}/query", params={"sql": sql}
+        )
+        assert response.status_code == 400
+        assert response.json()["status"] == "failed"
+
+    # Database errors
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query",
+        params={"sql": "SELECT unknown_column FROM data"},
+    )
+    assert response.status_code == 400
+    assert response.json()["status"] == "failed"
+
+    response = await async_client.get(
+        f"/sql/{dataset}/{version}/query",
+        params={"sql": "SELECT unknown_column FROM data"},
+        headers={"Accept": "text/csv"},
+    )
+    assert response.status_code == 400
+    assert response.json()["status"] == "failed"
+
+    # Constant expressions are evaluated while planning, within the time limit
+    sql = "SELECT iso FROM data WHERE md5(repeat('a', 100000000)) = ''"
+    with patch("app.crud.queries.QUERY_TIMEOUT", 0.01):
+        response = await async_client.get(
+            f"/sql/{dataset}/{version}/query", params={"sql": sql}
+        )
+    assert response.status_code == 400
+    assert "time limit" in response.json()["message"]
+
+    # Queries exceeding the estimated cost limits are rejected
+    sql = "SELECT iso FROM data WHERE alert__count > 1"
+    with patch("app.routes.sql.queries.QUERY_MAX_COST", 0):
+        response = await async_client.get(
+            f"/sql/{dataset}/{version}/query", params={"sql": sql}
+        )
+        assert response.status_code == 400
+        assert response.json()["message"]["plan"]["node_type"] == "Seq Scan"
+        assert response.json()["message"]["plan"]["total_cost"] > 0
+
+        # or wait for a slot reserved for expensive queries
+        with patch("app.routes.sql.queries.QUERY_EXPENSIVE_CONCURRENCY", 1):
+            response = await async_client.get(
+                f"/sql/{dataset}/{version}/query", params={"sql": sql}
+            )
+        assert response.status_code == 200
+        assert response.json()["data"] == [{"iso": "BRA"}]
+
+
+@pytest.mark.asyncio
+async def test_query_job(async_client, db):
+    dataset = "table_test"
+    version = "v202002.1"
+
+    await create_dataset(dataset, generic_dataset_metadata)
+    async with ContextEngine("WRITE"):
+        await create_version(dataset, version, source_type="table", status="saved")
+    db.execute(
+        f"""CREATE TABLE "{dataset}"."{version}" (iso text, alert__count integer);
+        INSERT INTO "{dataset}"."{version}" VALUES ('BRA', 1), ('BRA', 2), ('IDN', 3);"""
+    )
+    db.commit()
+
+    with patch("app.tasks.query_jobs.DATA_LAKE_BUCKET", BUCKET):
+        sql = "SELECT iso, sum(alert__count) AS alerts FROM data GROUP BY iso ORDER BY iso"
+        response = await async_client.post(
+            f"/sql/{dataset}/{version}/query/jobs", data=json.dumps({"sql": sql})
+        )
+        assert response.status_code == 202
+        job_id = response.json()["data"]["job_id"]
+        assert response.headers["location"] == f"/sql/jobs/{job_id}"
+
+        # The job runs in the background, once the response is sent
+        response = await async_client.get(f"/sql/jobs/{job_id}")
+        assert response.status_code == 200
+        job = response.json()["data"]
+        assert job["status"] == "saved"
+        assert job["format"] == "csv"
+
+        result = requests.get(job["download_url"])
+        assert result.status_code == 200
+        assert result.text.splitlines() == ["iso,alerts", "BRA,3", "IDN,3"]
+
+        # Database errors are reported with the job
+        response = await async_client.post(
+            f"/sql/{dataset}/{version}/query/jobs",
+            data=json.dumps({"sql": "SELECT 1 / (alert__count - 1) FROM data"}),
+        )
+        assert response.status_code == 202
+        job_id = response.json()["data"]["job_id"]
+        response = await async_client.get(f"/sql/jobs/{job_id}")
+        assert response.json()["data"]["status"] == "failed"
+        assert "division by zero" in response.json()["data"]["message"]
+
+        # Invalid queries are rejected right away
+        response = await async_client.post(
+            f"/sql/{dataset}/{version}/query/jobs",
+            data=json.dumps({"sql": f'DELETE FROM "{dataset}"."{version}"'}),
+        )
+        assert response.status_code == 400
+
+        # Only admins can submit jobs
+        with patch.dict(app.dependency_overrides):
+            del app.dependency_overrides[is_admin]
+            response = await async_client.post(
+                f"/sql/{dataset}/{version}/query/jobs", data=json.dumps({"sql": sql})
+            )
+        assert response.status_code == 401
+
+        # So are queries exceeding the cost limit for jobs
+        with patch("app.routes.sql.queries.QUERY_JOB_MAX_COST", 0):
+            response = await async_client.post(
+                f"/sql/{dataset}/{version}/query/jobs", data=json.dumps({"sql": sql})
+            )
+        assert response.status_code == 400
+        assert response.json()["message"]["plan"]["total_cost"] > 0
+
+        response = await async_client.get(
+            "/sql/jobs/00000000-0000-0000-0000-000000000000"
+        )
+        assert response.status_code == 404
@@ -240,3 +240,45 @@ def test_latest_middleware(mocked_task, client):
     print(response.json())
     assert response.status_code == 200
     assert response.json()["data"]["version"] == version
+
+
+@patch("app.middleware.REWRITE_LATEST_VERSION", True)
+@patch("fastapi.BackgroundTasks.add_task", return_value=None)
+def test_latest_middleware_rewrite(mocked_task, client):
+    """Test if middleware serves latest version without redirect when
+    rewriting is enabled."""
+
+    dataset = "test"
+    version = "v1.1.1"
+
+    response = client.put(f"/meta/{dataset}", data=json.dumps(payload))
+    assert response.status_code == 201
+
+    version_payload = {
+        "is_latest": True,
+        "source_type": "vector",
+        "source_uri": ["s3://some/path"],
+        "metadata": payload["metadata"],
+        "creation_options": {"src_driver": "ESRI Shapefile", "zipped": True},
+    }
+
+    response = client.put(
+        f"/meta/{dataset}/{version}", data=json.dumps(version_payload)
+    )
+    assert response.status_code == 202
+
+    response = client.get(f"/meta/{dataset}/latest", allow_redirects=False)
+    assert response.status_code == 200
+    assert response.headers["Content-Location"] == f"/meta/{dataset}/{version}"
+    assert response.json()["data"]["version"] == version
+
+    # Latest version pointer must follow changes of is_latest
+    version2 = "v1.1.2"
+    response = client.put(
+        f"/meta/{dataset}/{version2}", data=json.dumps(version_payload)
+    )
+    assert response.status_code == 202
+
+    response = client.get(f"/meta/{dataset}/latest", allow_redirects=False)
+    assert response.status_code == 200
+    assert response.json()["data"]["version"] == version2
@@ -0,0 +1,43 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.pydantic.creation_options import StaticVectorTileCacheCreationOptions
+from app.tasks.static_vector_tile_cache_assets import _quadkey, _quadkey_ranges
+
+
+def test_quadkey():
+    assert _quadkey(0, 0, 0) == ""
+    assert _quadkey(1, 1, 0) == "1"
+    assert _quadkey(1, 0, 1) == "2"
+    assert _quadkey(3, 3, 5) == "213"
+
+    # Sorted quadkeys keep tiles of the same parent together
+    quadkeys = sorted(_quadkey(2, x, y) for x in range(4) for y in range(4))
+    assert quadkeys[:4] == ["00", "01", "02", "03"]
+
+
+def test_quadkey_ranges():
+    quadkeys = sorted(_quadkey(2, x, y) for x in range(4) for y in range(4))
+
+    ranges = _quadkey_ranges(quadkeys, 4)
+    assert ranges == [quadkeys[0:4], quadkeys[4:8], quadkeys[8:12], quadkeys[12:16]]
+
+    # All quadkeys are distributed in order, ranges differ in size by one at most
+    ranges = _quadkey_ranges(quadkeys, 5)
+    assert [quadkey for r in ranges for quadkey in r] == quadkeys
+    assert {len(r) for r in ranges} == {3, 4}
+
+    assert _quadkey_ranges(quadkeys[:2], 64) == [["00"], ["01"]]
+    assert _quadkey_ranges(list(), 64) == list()
+
+
+def test_postgis_builder_min_zoom():
+    options = {"max_zoom": 12, "tile_strategy": "discontinuous"}
+    StaticVectorTileCacheCreationOptions(min_zoom=5, tile_builder="postgis", **options)
+    StaticVectorTileCacheCreationOptions(min_zoom=0, **options)
+
+    # Tiles above the split zoom level would each render the whole table
+    with pytest.raises(ValidationError):
+        StaticVectorTileCacheCreationOptions(
+            min_zoom=4, tile_builder="postgis", **options
+        )
@@ -0,0 +1,30 @@
+from shapely import wkb
+from shapely.geometry import Point
+
+from app.utils.arrow import accepted_media_type
+from app.utils.arrow import wkb as to_wkb
+
+
+def test_accepted_media_type():
+    assert accepted_media_type("application/json") is None
+    assert (
+        accepted_media_type("application/vnd.apache.arrow.stream, */*;q=0.1")
+        == "application/vnd.apache.arrow.stream"
+    )
+    assert (
+        accepted_media_type("application/vnd.apache.parquet")
+        == "application/vnd.apache.parquet"
+    )
+
+
+def test_wkb():
+    point = Point(-50, -10)
+
+    # SRID is dropped from EWKB
+    ewkb = wkb.dumps(point, hex=True, srid=4326)
+    assert to_wkb(ewkb) == wkb.dumps(point)
+
+    # Big endian, without SRID
+    assert to_wkb(wkb.dumps(point, hex=True, big_endian=True)) == wkb.dumps(
+        point, big_endian=True
+    )
@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+import pytest
+
+from app.utils.cache import LRUCache, ResultCache, SingleFlight
+
+
+def test_lru_cache():
+    cache = LRUCache(3, getsizeof=len)
+    assert cache.set("a", "a") == []
+    assert cache.set("b", "bb") == []
+    assert cache.get("a") == "a"
+
+    # Least recently used entries are evicted first
+    assert cache.set("c", "c") == [("b", "bb")]
+    assert cache.keys() == ["a", "c"]
+
+    # Values larger than the cache are not cached
+    assert cache.set("d", "dddd") == [("d", "dddd")]
+    assert "d" not in cache
+    assert cache.stats()["size"] == 2
+
+
+@pytest.mark.asyncio
+async def test_result_cache_spill(tmp_path):
+    cache = ResultCache(4, spill_dir=str(tmp_path), spill_maxsize=6)
+
+    await cache.set(("ds", "v1", "a"), b"aa")
+    await cache.set(("ds", "v1", "b"), b"bb")
+    await cache.set(("ds", "v2", "c"), b"cc")
+
+    # Least recently used entry was moved to disk
+    assert cache.memory.keys() == [("ds", "v1", "b"), ("ds", "v2", "c")]
+    assert cache.disk.keys() == [("ds", "v1", "a")]
+
+    # and moves back into memory once read
+    assert await cache.get(("ds", "v1", "a")) == b"aa"
+    assert cache.disk.keys() == [("ds", "v1", "b")]
+
+    # Expired entries are dropped
+    await cache.set(("ds", "v2", "d"), b"dd", ttl=0)
+    assert await cache.get(("ds", "v2", "d")) is None
+
+    cache.invalidate("ds", "v1")
+    assert await cache.get(("ds", "v1", "a")) is None
+    assert await cache.get(("ds", "v1", "b")) is None
+    assert await cache.get(("ds", "v2", "c")) == b"cc"
+
+    cache.clear()
+    assert [f for _, _, files in os.walk(tmp_path) for f in files] == []
+
+
+@pytest.mark.asyncio
+async def test_single_flight():
+    flights = SingleFlight()
+    renders = list()
+
+    async def render(key):
+        renders.append(key)
+        await asyncio.sleep(0.01)
+        if key == "error":
+            raise ValueError(key)
+        return key.upper()
+
+    # Concurrent calls for the same key share one call
+    results = await asyncio.gather(
+        *[flights.run(key, lambda key=key: render(key)) for key in "aab"]
+    )
+    assert results == ["A", "A", "B"]
+    assert renders == ["a", "b"]
+    assert flights.stats() == {"calls": 2, "coalesced": 1, "in_flight": 0}
+
+    # Errors are raised for every caller, later calls start over
+    results = await asyncio.gather(
+        flights.run("error", lambda: render("error")),
+        flights.run("error", lambda: render("error")),
+        return_exceptions=True,
+    )
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert await flights.run("a", lambda: render("a")) == "A"
+    assert renders == ["a", "b", "error", "a"]
+
+    # Calls keep running for other callers if the first one is cancelled
+    first = asyncio.ensure_future(flights.run("c", lambda: render("c")))
+    second = asyncio.ensure_future(flights.run("c", lambda: render("c")))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "C"
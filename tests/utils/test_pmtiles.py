@@ -0,0 +1,97 @@
+import gzip
+import struct
+
+import pytest
+
+from app.utils.pmtiles import (
+    COMPRESSION_GZIP,
+    COMPRESSION_NONE,
+    HEADER_SIZE,
+    TILE_TYPE_MVT,
+    find_entry,
+    gzip_tile,
+    parse_directory,
+    parse_header,
+    tile_id,
+)
+
+
+def _varints(*values: int) -> bytes:
+    data = bytearray()
+    for value in values:
+        while value >= 0x80:
+            data.append((value & 0x7F) | 0x80)
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def test_tile_id():
+    assert [tile_id(0, 0, 0), tile_id(1, 0, 0), tile_id(1, 0, 1)] == [0, 1, 2]
+    assert [tile_id(1, 1, 1), tile_id(1, 1, 0), tile_id(2, 0, 0)] == [3, 4, 5]
+    assert tile_id(12, 3423, 1763) == 19078479
+
+
+def test_parse_header():
+    header = b"PMTiles" + struct.pack(
+        "<B11QBBBBBBiiiiBii",
+        3,
+        HEADER_SIZE,
+        20,
+        147,
+        10,
+        157,
+        0,
+        157,
+        300,
+        3,
+        2,
+        2,
+        1,
+        COMPRESSION_GZIP,
+        COMPRESSION_NONE,
+        TILE_TYPE_MVT,
+        0,
+        14,
+        *[0] * 4,
+        0,
+        0,
+        0,
+    )
+    assert len(header) == HEADER_SIZE
+
+    parsed = parse_header(header)
+    assert parsed.root_offset == HEADER_SIZE
+    assert parsed.data_length == 300
+    assert parsed.internal_compression == COMPRESSION_GZIP
+    assert parsed.tile_compression == COMPRESSION_NONE
+    assert (parsed.min_zoom, parsed.max_zoom) == (0, 14)
+
+    with pytest.raises(ValueError):
+        parse_header(b"PMTiles\x02" + header[8:])
+
+
+def test_parse_directory():
+    # Tiles 0, 1 to 4 with the same data, 10 and a leaf directory from 20
+    directory = parse_directory(
+        gzip.compress(
+            _varints(4, 0, 1, 9, 10, 1, 4, 1, 0, 100, 200, 300, 50, 1, 0, 0, 1001)
+        ),
+        COMPRESSION_GZIP,
+    )
+    assert directory.tile_ids == [0, 1, 10, 20]
+    assert [entry.offset for entry in directory.entries] == [0, 100, 300, 1000]
+
+    assert find_entry(directory, 0).length == 100
+    assert find_entry(directory, 3).offset == 100
+    assert find_entry(directory, 5) is None
+    assert find_entry(directory, 10).offset == 300
+    assert find_entry(directory, 11) is None
+
+    # Leaf directories cover all tiles from their first tile ID
+    assert find_entry(directory, 25_000).run_length == 0
+
+
+def test_gzip_tile():
+    assert gzip_tile(b"\x1f\x8b data", COMPRESSION_GZIP) == b"\x1f\x8b data"
+    assert gzip.decompress(gzip_tile(b"tile", COMPRESSION_NONE)) == b"tile"
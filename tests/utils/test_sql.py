@@ -0,0 +1,89 @@
+from uuid import UUID
+
+import pytest
+
+from app.errors import BadRequestError
+from app.utils.sql import bind_query
+
+
+def test_bind_query():
+    assert (
+        bind_query("SELECT iso, count(*) FROM data GROUP BY iso;", "ds", "v1")
+        == 'select iso, count(*) from "ds"."v1" as data group by iso'
+    )
+
+    # Existing aliases are kept, string literals and comments can't hide keywords
+    assert (
+        bind_query(
+            "SELECT t.iso -- ; DROP TABLE x\nFROM mytable AS t WHERE iso = ';DELETE'",
+            "ds",
+            "v1",
+        )
+        == 'select t.iso from "ds"."v1" as t where iso = \';DELETE\''
+    )
+
+    # Functions with a FROM keyword are not mistaken for the FROM clause
+    assert (
+        bind_query("SELECT extract(year FROM alert__date) FROM data", "ds", "v1")
+        == 'select extract(year from alert__date) from "ds"."v1" as data'
+    )
+
+    # Prefixes of string literals stay attached to them
+    assert (
+        bind_query(
+            "SELECT * FROM data WHERE hash = X'1F' OR flags = B'101' "
+            "OR name = U&'d\\0061t' OR note = E'it\\'s' OR iso = N'BRA'",
+            "ds",
+            "v1",
+        )
+        == "select * from \"ds\".\"v1\" as data where hash = X'1F' or flags = B'101' "
+        "or name = U&'d\\0061t' or note = E'it\\'s' or iso = N'BRA'"
+    )
+
+    geostore_id = UUID("b9faa657-34c9-96d4-fce4-8bb8a1507cb3")
+    assert bind_query("SELECT * FROM data", "ds", "v1", geostore_id) == (
+        'select * from (SELECT * FROM "ds"."v1" WHERE ST_Intersects(geom, '
+        "(SELECT ST_GeomFromGeoJSON(gfw_geojson) FROM public.geostore "
+        f"WHERE gfw_geostore_id = '{geostore_id}'::uuid))) as data"
+    )
+
+    # Intersect with subdivided geometries, if available
+    subdivided = '"ds"."v1__subdivided"'
+    assert bind_query("SELECT * FROM data", "ds", "v1", geostore_id, subdivided) == (
+        'select * from (SELECT * FROM "ds"."v1" WHERE gfw_fid IN '
+        f"(SELECT gfw_fid FROM {subdivided} WHERE ST_Intersects(geom, "
+        "(SELECT ST_GeomFromGeoJSON(gfw_geojson) FROM public.geostore "
+        f"WHERE gfw_geostore_id = '{geostore_id}'::uuid)))) as data"
+    )
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "DELETE FROM data",
+        "WITH x AS (DELETE FROM data RETURNING *) SELECT * FROM x",
+        "SELECT 1",
+        "SELECT * FROM data; SELECT * FROM data",
+        "SELECT * INTO other FROM data",
+        "SELECT * FROM data FOR UPDATE",
+        "SELECT * FROM public.geostore",
+        "SELECT * FROM data, other",
+        "SELECT * FROM data JOIN other ON true",
+        "SELECT * FROM data UNION TABLE other",
+        "SELECT (SELECT 1 FROM other) FROM data",
+        "SELECT * FROM (VALUES (1)) AS data",
+        "SELECT pg_sleep(60) FROM data",
+        "SELECT \"pg_read_file\"('/etc/passwd') FROM data",
+        "SELECT ts_stat('SELECT to_tsvector(email) FROM public.users') FROM data",
+        "SELECT ts_rewrite('a'::tsquery, 'SELECT t, s FROM public.geostore') FROM data",
+        "SELECT TS_STAT ('SELECT 1') FROM data",
+        "SELECT ST_EstimatedExtent('other_schema', 'table', 'geom') FROM data",
+        "SELECT * FROM data WHERE iso = $1",
+        "SELECT * FROM data WHERE (iso = 'BRA'",
+        "SELECT * FROM data WHERE iso = 'BRA",
+        "SELECT * FROM data /* unterminated",
+    ],
+)
+def test_bind_query_rejected(sql):
+    with pytest.raises(BadRequestError):
+        bind_query(sql, "ds", "v1")